@@ -83,6 +83,11 @@ function createTables() {
             is_primary INTEGER NOT NULL DEFAULT 0
         )`,
         
+        `CREATE TABLE IF NOT EXISTS session_keys (
+            idempotency_key TEXT PRIMARY KEY,
+            session_id INTEGER NOT NULL REFERENCES attendance_sessions(id)
+        )`,
+        
         `CREATE TABLE IF NOT EXISTS system_config (
             id INTEGER PRIMARY KEY DEFAULT 1,
             image_capture_interval TEXT NOT NULL DEFAULT '["07:00"]',
@@ -267,6 +272,36 @@ function addSessionImage(sessionId, imageData, isPrimary) {
     }
 }
 
+/**
+ * Remember the idempotency key a session was recorded with
+ * @param {string} key - Idempotency key sent by the worker
+ * @param {number} sessionId - Session ID
+ */
+function addSessionKey(key, sessionId) {
+    try {
+        const sql = 'INSERT OR IGNORE INTO session_keys (idempotency_key, session_id) VALUES (?, ?)';
+        db.run(sql, [key, sessionId]);
+        saveDB();
+    } catch (error) {
+        console.error('[Database] addSessionKey error:', error);
+    }
+}
+
+/**
+ * Find the session recorded with an idempotency key
+ * @param {string} key - Idempotency key sent by the worker
+ * @returns {number|null} Session ID or null if the key is unknown
+ */
+function getSessionIdByKey(key) {
+    try {
+        const result = db.exec('SELECT session_id FROM session_keys WHERE idempotency_key = ?', [key]);
+        return result.length > 0 && result[0].values.length > 0 ? result[0].values[0][0] : null;
+    } catch (error) {
+        console.error('[Database] getSessionIdByKey error:', error);
+        return null;
+    }
+}
+
 /**
  * Retrieve the latest attendance session
  * @returns {Object|null} Latest session with details
@@ -402,6 +437,8 @@ module.exports = {
     addSessionPresent,
     addSessionAbsent,
     addSessionImage,
+    addSessionKey,
+    getSessionIdByKey,
     getLatestSession,
     getSessionHistory,
     getSessionDetails
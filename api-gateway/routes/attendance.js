@@ -3,7 +3,7 @@
  * 
  * Handles attendance session management including:
  * - Retrieving latest attendance data
- * - Recording check-in results from Python worker
+ * - Recording check-in results from Python worker (JSON or binary bundle)
  * - Managing attendance images
  * - Providing attendance history
  */
@@ -37,23 +37,25 @@ router.get('/', tryCatch(async (req, res) => {
 }));
 
 /**
- * POST /api/attendance
- * 
- * Records check-in results from Python worker.
- * Saves attendance data and broadcasts to Web UI.
+ * Saves a check-in result and broadcasts it to Web UI.
  * 
- * @async
- * @param {Object} req - Express request
- * @param {string} req.body.source - Source of check-in ('auto' or 'manual')
- * @param {number} req.body.total - Total students
- * @param {Array} req.body.present_names - Names of present students
- * @param {Array} req.body.absent_names - Names of absent students
- * @param {Array} req.body.images - Array of base64 images
- * @param {Object} res - Express response
- * @returns {Object} Success status and session ID
+ * @param {Object} data - Attendance data
+ * @param {string} data.source - Source of check-in ('auto' or 'manual')
+ * @param {number} data.total - Total students
+ * @param {Array} data.present_names - Names of present students
+ * @param {Array} data.absent_names - Names of absent students
+ * @param {Array} data.images - Array of base64 images
+ * @param {string} [data.idempotency_key] - Key of a worker retry; a repeated key is not recorded twice
+ * @returns {Object} The broadcast attendance session
  */
-router.post('/', tryCatch(async (req, res) => {
-    const { source = 'auto', total = 0, present_names = [], absent_names = [], images = [] } = req.body;
+function recordAttendance({ source = 'auto', total = 0, present_names = [], absent_names = [], images = [], idempotency_key }) {
+    if (idempotency_key) {
+        const existingId = db.getSessionIdByKey(idempotency_key);
+        if (existingId) {
+            console.log(`[Attendance] Duplicate delivery ${idempotency_key} ignored (session ${existingId})`);
+            return { id: existingId, duplicate: true };
+        }
+    }
 
     const presentCount = present_names.length;
     const absentCount = absent_names.length;
@@ -61,6 +63,9 @@ router.post('/', tryCatch(async (req, res) => {
     // Create new session
     const sessionId = db.createSession({ source, total, present_count: presentCount, absent_count: absentCount });
     console.log(`[Attendance] New session created ID: ${sessionId}`);
+    if (idempotency_key) {
+        db.addSessionKey(idempotency_key, sessionId);
+    }
 
     // Record attendance for each student
     present_names.forEach(name => db.addSessionPresent(sessionId, name));
@@ -88,14 +93,93 @@ router.post('/', tryCatch(async (req, res) => {
         created_at: new Date().toISOString()
     };
     broadcastToUI('attendance_update', currentAttendanceCache);
+    return currentAttendanceCache;
+}
+
+/**
+ * Parses a length-prefixed attendance bundle sent by the Python worker.
+ * 
+ * Layout: uint32 (big-endian) metadata length, UTF-8 JSON metadata, then
+ * for each image a uint32 (big-endian) length followed by the image bytes.
+ * 
+ * @param {Buffer} buf - Request body
+ * @returns {Object} Metadata with `images` as base64 strings
+ * @throws {Error} If the body is truncated or malformed
+ */
+function parseAttendanceBundle(buf) {
+    if (!Buffer.isBuffer(buf) || buf.length < 4) {
+        throw new Error("Empty or invalid attendance bundle.");
+    }
+    let offset = 0;
+    const readChunk = () => {
+        if (offset + 4 > buf.length) {
+            throw new Error("Truncated attendance bundle.");
+        }
+        const length = buf.readUInt32BE(offset);
+        offset += 4;
+        if (offset + length > buf.length) {
+            throw new Error("Truncated attendance bundle.");
+        }
+        const chunk = buf.subarray(offset, offset + length);
+        offset += length;
+        return chunk;
+    };
+
+    const metadata = JSON.parse(readChunk().toString('utf8'));
+    const images = [];
+    while (offset < buf.length) {
+        images.push(readChunk().toString('base64'));
+    }
+    return { ...metadata, images };
+}
+
+/**
+ * POST /api/attendance
+ * 
+ * Records check-in results from Python worker.
+ * Saves attendance data and broadcasts to Web UI.
+ * 
+ * @async
+ * @param {Object} req - Express request
+ * @param {string} req.body.source - Source of check-in ('auto' or 'manual')
+ * @param {number} req.body.total - Total students
+ * @param {Array} req.body.present_names - Names of present students
+ * @param {Array} req.body.absent_names - Names of absent students
+ * @param {Array} req.body.images - Array of base64 images
+ * @param {Object} res - Express response
+ * @returns {Object} Success status and session ID
+ */
+router.post('/', tryCatch(async (req, res) => {
+    const data = recordAttendance(req.body || {});
 
     return res.json({ 
         success: true, 
-        data: currentAttendanceCache,
+        data,
         message: "Attendance session recorded successfully."
     }); 
 }));
 
+/**
+ * POST /api/attendance/frames
+ * 
+ * Records check-in results sent as a binary bundle (see parseAttendanceBundle):
+ * a small JSON metadata part followed by raw WebP images, without base64.
+ * 
+ * @async
+ * @param {Object} req - Express request with application/octet-stream body
+ * @param {Object} res - Express response
+ * @returns {Object} Success status and session ID
+ */
+router.post('/frames', express.raw({ type: 'application/octet-stream', limit: '50mb' }), tryCatch(async (req, res) => {
+    const data = recordAttendance(parseAttendanceBundle(req.body));
+
+    return res.json({
+        success: true,
+        data,
+        message: "Attendance session recorded successfully."
+    });
+}));
+
 /**
  * POST /api/attendance/upload_image
  * 
@@ -18,11 +18,17 @@ const router = express.Router();
  * Sends command to Python worker via WebSocket.
  * 
  * @async
+ * @param {Object} req - Express request
+ * @param {string} [req.body.camera_id] - Camera to check in (all cameras if omitted)
  * @param {Object} res - Express response
  * @returns {Object} Success status and message
  */
 router.post('/trigger_checkin', tryCatch(async (req, res) => {
+    const { camera_id } = req.body || {};
     const payload = { requestedBy: 'admin_dashboard', source: 'manual' };
+    if (camera_id) {
+        payload.camera_id = camera_id;
+    }
     
     console.log('[Command] Trigger check-in command sent to worker');
     broadcastToWorker('trigger_checkin', payload);
@@ -70,6 +76,34 @@ router.post('/add_student', tryCatch(async (req, res) => {
     });
 }));
 
+/**
+ * POST /api/command/cancel_job
+ * 
+ * Cancels a queued or running job on the Python worker.
+ * Job IDs are reported in the worker's command acknowledgments.
+ * 
+ * @async
+ * @param {Object} req - Express request
+ * @param {string} req.body.job_id - Job ID to cancel
+ * @param {Object} res - Express response
+ * @returns {Object} Success status and message
+ */
+router.post('/cancel_job', tryCatch(async (req, res) => {
+    const { job_id } = req.body || {};
+
+    if (!job_id) {
+        return res.status(400).json({ success: false, message: "job_id is required." });
+    }
+
+    console.log(`[Command] Cancel job '${job_id}' command sent to worker`);
+    broadcastToWorker('cancel_job', { job_id });
+
+    return res.json({
+        success: true,
+        message: "Cancel command sent to camera worker.",
+        data: { command: 'cancel_job', job_id }
+    });
+}));
 
 /**
  * POST /api/command/ack
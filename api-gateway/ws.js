@@ -3,7 +3,7 @@
  * 
  * Handles WebSocket connections for real-time communication between:
  * - Web UI: Receives attendance updates and config changes
- * - Python Worker: Sends check-in results and receives commands
+ * - Python Worker: Sends check-in results and command acks, receives commands
  */
 
 const WebSocket = require('ws');
@@ -39,6 +39,27 @@ function initWebSocket(server) {
             }
         }
 
+        // Workers send command acknowledgments and status updates over the open socket
+        ws.on('message', (raw) => {
+            let message;
+            try {
+                message = JSON.parse(raw);
+            } catch (err) {
+                console.error('[WebSocket] Invalid message:', err.message);
+                return;
+            }
+            if (ws.clientType === 'worker' && message.type === 'ack') {
+                const { id, status, detail } = message.payload || {};
+                if (id) {
+                    console.log(`[Command ACK] ${id} -> ${status}`, detail || {});
+                }
+            } else if (ws.clientType === 'worker' && message.type === 'worker_status') {
+                // Model readiness: the worker reports once on connect and again when loaded
+                console.log('[WebSocket] Worker status:', message.payload || {});
+                broadcastToUI('worker_status', message.payload || {});
+            }
+        });
+
         ws.on('close', () => console.log(`[WebSocket] Client disconnected. Type: ${ws.clientType}`));
         ws.on('error', (err) => console.error('[WebSocket] Error:', err));
     });
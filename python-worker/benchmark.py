@@ -0,0 +1,276 @@
+"""Offline benchmarks for the face recognition worker."""
+
+import argparse
+import os
+import time
+import cv2
+from src.utils import FancyText
+
+
+def _load_images(folder: str, limit: int) -> list:
+    """
+    Load up to `limit` images from a folder.
+
+    Args:
+        folder (str): Directory containing image files
+        limit (int): Maximum number of images to load
+
+    Returns:
+        list: Decoded BGR images
+    """
+    images = []
+    for name in sorted(os.listdir(folder)):
+        img = cv2.imread(os.path.join(folder, name))
+        if img is not None:
+            images.append(img)
+        if len(images) >= limit:
+            break
+    return images
+
+
+def _detect_per_frame(face_system, frame) -> list:
+    """
+    Per-frame baseline for detect_batch: one detection call per frame and one
+    recognition call per face, without the landmark and gender/age heads.
+
+    Args:
+        face_system: FaceSystem instance
+        frame (np.ndarray): BGR image frame
+
+    Returns:
+        list: Embeddings of the faces in the frame
+    """
+    from insightface.utils import face_align
+
+    rec_model = face_system.detector.models['recognition']
+    bboxes, kpss = face_system.detector.det_model.detect(frame, max_num=0, metric='default')
+    if kpss is None:
+        return []
+    return [
+        rec_model.get_feat([face_align.norm_crop(frame, landmark=kps, image_size=rec_model.input_size[0])])
+        for kps in kpss
+    ]
+
+
+def bench_detect(args):
+    """Compare per-frame detection and recognition calls against batched detect_batch."""
+    import tempfile
+    from src.FaceSystem import FaceSystem
+
+    frames = _load_images(args.images, args.frames)
+    if not frames:
+        FancyText.error(f'No readable images in {args.images}')
+        return
+    # An empty store, so the benchmark neither loads nor migrates the real gallery
+    with tempfile.TemporaryDirectory() as tmp:
+        face_system = FaceSystem(modelPath=args.model, embPath=os.path.join(tmp, 'embeddings.pkl'))
+        face_system.detect_batch(frames[:1])  # warm-up
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            per_frame = [_detect_per_frame(face_system, frame) for frame in frames]
+        per_frame_s = (time.perf_counter() - start) / args.repeat
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            batched = face_system.detect_batch(frames)
+        batched_s = (time.perf_counter() - start) / args.repeat
+        face_system.close()
+
+    faces = sum(len(f) for f in batched)
+    FancyText.info(f'{len(frames)} frames, {faces} faces (per-frame path found {sum(len(f) for f in per_frame)})')
+    FancyText.success(f'Per-frame : {per_frame_s * 1000:8.1f} ms  ({len(frames) / per_frame_s:6.2f} frames/s)')
+    FancyText.success(f'Batched   : {batched_s * 1000:8.1f} ms  ({len(frames) / batched_s:6.2f} frames/s)')
+
+
+def bench_search(args):
+    """Measure recall@1 and query latency of the ANN backend against exact search."""
+    import numpy as np
+    from src.search import create_index
+
+    rng = np.random.default_rng(42)
+    people = rng.standard_normal((args.people, args.dim)).astype(np.float32)
+    people /= np.linalg.norm(people, axis=1, keepdims=True)
+    owners = np.repeat(np.arange(args.people), args.samples)
+    gallery = people[owners] + args.noise * rng.standard_normal((owners.size, args.dim)).astype(np.float32)
+    gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+    targets = rng.integers(0, args.people, size=args.queries)
+    queries = people[targets] + args.noise * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    exact = create_index('exact', dim=args.dim)
+    exact.build(gallery)
+    start = time.perf_counter()
+    truth = [int(exact.search(q)[0][0]) for q in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / args.queries
+    FancyText.success(f'exact : {exact_ms:.3f} ms/query over {len(exact)} embeddings')
+
+    for nprobe in args.nprobe:
+        start = time.perf_counter()
+        ann = create_index('ivf', dim=args.dim, nprobe=nprobe, min_train=1)
+        ann.build(gallery)
+        build_s = time.perf_counter() - start
+        start = time.perf_counter()
+        found = [int(ann.search(q)[0][0]) for q in queries]
+        ann_ms = (time.perf_counter() - start) * 1000 / args.queries
+        recall = np.mean(np.asarray(found) == np.asarray(truth))
+        same_person = np.mean(owners[found] == targets)
+        FancyText.success(
+            f'ivf nprobe={nprobe:<3}: {ann_ms:.3f} ms/query, recall@1 {recall:.3f}, '
+            f'identity accuracy {same_person:.3f}, build {build_s:.2f}s'
+        )
+
+    start = time.perf_counter()
+    for i in range(args.queries):
+        ann.add(queries[i:i + 1])
+    FancyText.info(f'ivf incremental add: {(time.perf_counter() - start) * 1000 / args.queries:.3f} ms/embedding')
+
+
+def bench_enhance(args):
+    """Measure ms/frame of each image enhancement mode."""
+    import numpy as np
+    from src.enhance import ENHANCE_MODES, enhance_frame, enhance_face_crop
+
+    frames = _load_images(args.images, args.frames) if os.path.isdir(args.images) else []
+    if frames:
+        frames = [cv2.resize(frame, tuple(args.size)) for frame in frames]
+    else:
+        FancyText.warning(f'No readable images in {args.images}, using synthetic dark/normal/bright frames')
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(lo, lo + 60, (args.size[1], args.size[0], 3), dtype=np.uint8)
+                  for lo in (10, 100, 190) for _ in range(max(1, args.frames // 3))]
+    crops = [cv2.resize(frame, (112, 112)) for frame in frames]
+
+    for mode in ENHANCE_MODES:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for frame, crop in zip(frames, crops):
+                if mode == 'faces':
+                    for _ in range(args.faces):
+                        enhance_face_crop(crop)
+                else:
+                    enhance_frame(frame, mode)
+        ms = (time.perf_counter() - start) * 1000 / (args.repeat * len(frames))
+        detail = f' ({args.faces} face crops per frame)' if mode == 'faces' else ''
+        FancyText.success(f'{mode:<9}: {ms:7.3f} ms/frame{detail}')
+
+
+def _load_labelled(folder: str) -> list:
+    """
+    Load a labelled image folder laid out as ``<folder>/<person>/<image>``.
+
+    Args:
+        folder (str): Root directory with one sub-directory per person
+
+    Returns:
+        list: (person, BGR image) pairs
+    """
+    samples = []
+    for person in sorted(os.listdir(folder)):
+        person_dir = os.path.join(folder, person)
+        if not os.path.isdir(person_dir):
+            continue
+        for name in sorted(os.listdir(person_dir)):
+            img = cv2.imread(os.path.join(person_dir, name))
+            if img is not None:
+                samples.append((person, img))
+    return samples
+
+
+def bench_accuracy(args):
+    """Identification accuracy and latency of inference profiles on a labelled folder."""
+    import tempfile
+    import numpy as np
+    from src.FaceSystem import FaceSystem
+    from src.quality import best_face
+
+    samples = _load_labelled(args.images)
+    if not samples:
+        FancyText.error(f'No labelled images in {args.images} (expected <folder>/<person>/<image>)')
+        return
+    FancyText.info(f'{len(samples)} images of {len(set(p for p, _ in samples))} people')
+
+    profiles = []
+    for pack in args.packs:
+        for quantize in (['off', 'dynamic'] if args.quantize else ['off']):
+            for threads in args.threads:
+                profiles.append({
+                    'model_pack': pack, 'quantize': quantize, 'intra_op_threads': threads,
+                    'graph_optimization': args.graph_optimization
+                })
+
+    for profile in profiles:
+        with tempfile.TemporaryDirectory() as tmp:
+            face_system = FaceSystem(embPath=os.path.join(tmp, 'embeddings.pkl'), inferenceProfile=profile)
+            face_system.detect_batch([samples[0][1]])  # warm-up
+            start = time.perf_counter()
+            embedded = []
+            for person, img in samples:
+                face = best_face(face_system.detect_batch([img])[0])
+                embedded.append((person, None if face is None else face['embedding']))
+            ms = (time.perf_counter() - start) * 1000 / len(samples)
+            face_system.close()
+
+        gallery, probes, seen = [], [], set()
+        for person, emb in embedded:
+            if emb is None:
+                continue
+            (probes if person in seen else gallery).append((person, emb))
+            seen.add(person)
+        missed = sum(emb is None for _, emb in embedded)
+        if not probes:
+            accuracy = float('nan')
+        else:
+            matrix = np.stack([emb for _, emb in gallery])
+            scores = np.stack([emb for _, emb in probes]) @ matrix.T
+            best = scores.argmax(axis=1)
+            accuracy = np.mean([gallery[b][0] == person for b, (person, _) in zip(best, probes)])
+        name = f"{profile['model_pack']}{'_int8' if profile['quantize'] != 'off' else ''} threads={profile['intra_op_threads']}"
+        FancyText.success(
+            f'{name:<32}: {ms:7.1f} ms/image, rank-1 accuracy {accuracy:.3f} '
+            f'({len(probes)} probes vs {len(gallery)} enrolled), no face in {missed} images'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('detect', help='Per-frame vs batched detection and embedding')
+    p.add_argument('--images', default='data/faces', help='Folder of test images')
+    p.add_argument('--frames', type=int, default=5, help='Number of frames per check-in')
+    p.add_argument('--repeat', type=int, default=5)
+    p.add_argument('--model', default='buffalo_l')
+    p.set_defaults(func=bench_detect)
+
+    p = sub.add_parser('search', help='Recall/latency of approximate vs exact embedding search')
+    p.add_argument('--people', type=int, default=20000)
+    p.add_argument('--samples', type=int, default=3, help='Embeddings per person')
+    p.add_argument('--dim', type=int, default=512)
+    p.add_argument('--noise', type=float, default=0.04, help='Per-dimension noise around each identity')
+    p.add_argument('--queries', type=int, default=500)
+    p.add_argument('--nprobe', type=int, nargs='+', default=[4, 8, 16, 32])
+    p.set_defaults(func=bench_search)
+
+    p = sub.add_parser('enhance', help='ms/frame of each image enhancement mode')
+    p.add_argument('--images', default='data/faces', help='Folder of test images (synthetic frames if missing)')
+    p.add_argument('--frames', type=int, default=12)
+    p.add_argument('--size', type=int, nargs=2, default=[960, 540], help='Frame width and height')
+    p.add_argument('--faces', type=int, default=5, help='Face crops per frame in faces mode')
+    p.add_argument('--repeat', type=int, default=20)
+    p.set_defaults(func=bench_enhance)
+
+    p = sub.add_parser('accuracy', help='Accuracy/latency of model packs, INT8 and thread settings')
+    p.add_argument('--images', required=True, help='Labelled folder: <folder>/<person>/<image>; first image per person is enrolled')
+    p.add_argument('--packs', nargs='+', default=['buffalo_l', 'buffalo_s', 'buffalo_sc'])
+    p.add_argument('--quantize', action='store_true', help='Also test the INT8-quantized variant of each pack')
+    p.add_argument('--threads', type=int, nargs='+', default=[0], help='intra_op_threads values to test (0 = ONNX Runtime default)')
+    p.add_argument('--graph-optimization', default='all', choices=['disable', 'basic', 'extended', 'all'])
+    p.set_defaults(func=bench_accuracy)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,21 @@
 """Face recognition system using InsightFace."""
 
-from insightface.app import FaceAnalysis
-import torch
-import cv2
+import functools
 import numpy as np
 import os
-import pickle
+import threading
+import time
 from src.utils import FancyText
+from src.search import create_index
+from src.templates import TEMPLATE_MODES, build_templates
+from src.embedding_store import EmbeddingStore, EmbeddingWriter
+from src.enrollment import EnrollmentLog, enroll_files
+from src.inference import InferenceQueue
+from src.inference_server import InferenceServer
+from src.enhance import enhance_face_crop
+from src.detection import detection_profile, detect_tiled
+from src.quality import quality_profile, score_face, best_face, undersized
+from src.runtime import inference_profile, resolve_model_pack, apply_session_options, select_device
 
 
 class FaceSystem():
@@ -17,70 +26,416 @@ class FaceSystem():
     and handles face registration and embeddings caching.
     """
     
-    def __init__(self, modelPath: str='buffalo_l', embPath: str='data/embeddings.pkl', threshold: float=0.4):
+    def __init__(self, modelPath: str='buffalo_l', embPath: str='data/embeddings.pkl', threshold: float=0.4,
+                 searchBackend: str='exact', searchOptions: dict=None, templateMode: str='off', templateK: int=3,
+                 flushInterval: float=2.0, flushBatch: int=32, cropEnhance: bool=False,
+                 detectionProfile: dict=None, qualityProfile: dict=None, inferenceProfile: dict=None,
+                 device: str='auto', loadInBackground: bool=False, inferenceWorkers: int=0,
+                 inferenceChunkFrames: int=1, inferenceSlotBytes: int=1280 * 720 * 3,
+                 inferenceTimeout: float=60.0):
         """
         Initialize Face System.
         
         Args:
-            modelPath (str): InsightFace model name (default: 'buffalo_l')
-            embPath (str): Path to embeddings pickle file
+            modelPath (str): InsightFace model name (default: 'buffalo_l'); the
+                inference profile's model_pack takes precedence
+            embPath (str): Path to the legacy embeddings pickle; the embedding store
+                lives next to it with the same base name (e.g. data/embeddings.f32)
             threshold (float): Recognition confidence threshold
+            searchBackend (str): Embedding search backend, 'exact' or 'ivf' (approximate)
+            searchOptions (dict): Extra options for the search backend (e.g. nprobe)
+            templateMode (str): 'off' to search every stored sample, 'mean' or 'medoids'
+                to search a compact per-person template instead
+            templateK (int): Number of medoids per person in 'medoids' mode
+            flushInterval (float): Maximum delay in seconds before new embeddings are written to disk
+            flushBatch (int): Number of queued embeddings that triggers an immediate disk write
+            cropEnhance (bool): Apply CLAHE to each aligned face crop before embedding
+            detectionProfile (dict): Model modules, detector size, pre-gate and tiling
+                (see src.detection.detection_profile)
+            qualityProfile (dict): Thresholds below which faces are not embedded
+                (see src.quality.quality_profile)
+            inferenceProfile (dict): Model pack, INT8 quantization and ONNX Runtime
+                session options (see src.runtime.inference_profile)
+            device (str): 'auto', 'cpu' or 'cuda'; the FACE_DEVICE environment variable overrides it
+            loadInBackground (bool): Return right away and load the model on a background
+                thread; detection waits until it is ready (see ready / wait_ready)
+            inferenceWorkers (int): Number of inference server processes, each with its
+                own model instance (0 runs the model in this process)
+            inferenceChunkFrames (int): Maximum frames per inference server request
+            inferenceSlotBytes (int): Size of one shared-memory frame buffer of the server
+            inferenceTimeout (float): Seconds to wait for the inference server before a detection fails
         """
-        self.ctx_id = (0 if torch.cuda.is_available() else (-1))
-        FancyText.info(f'Using {modelPath}')
-        FancyText.info(f"Using {('GPU' if (self.ctx_id >= 0) else 'CPU')} (ctx_id={self.ctx_id})")
-        self.detector = FaceAnalysis(name=modelPath)
-        self.detector.prepare(ctx_id=self.ctx_id, det_size=(480, 480))
+        self.inference_profile = inference_profile({'model_pack': modelPath, **(inferenceProfile or {})})
+        self.detection_profile = detection_profile(detectionProfile)
+        self.device = device
+        self.ctx_id = -1
+        self.detector = None
+        self.model_pack = None
+        self.ready = threading.Event()
+        self.load_error = None
+        self.inference_server = None
         self.embeddings_path = embPath
+        self.store = EmbeddingStore(os.path.splitext(embPath)[0])
         self.threshold = threshold
+        self.search_backend = searchBackend
+        self.search_options = searchOptions or {}
+        if templateMode not in TEMPLATE_MODES:
+            FancyText.warning(f'Unknown template mode "{templateMode}", using "off".')
+            templateMode = 'off'
+        self.template_mode = templateMode
+        self.template_k = templateK
         self.known_faces = self._load_embeddings()
-        self._emb_matrix = None
+        self.inference_queue = None
+        self.crop_enhance = cropEnhance
+        self.quality_profile = quality_profile(qualityProfile)
+        self.index = None
         self._name_list = []
-        self._norm_matrix = None
+        self._template_rows = {}
+        # Registrations (job pool) and searches (check-ins) run concurrently:
+        # _update_lock serializes changes to known_faces and the index, and
+        # _search_lock makes the index and its name list change together
+        self._update_lock = threading.RLock()
+        self._search_lock = threading.Lock()
         self._rebuild_cache()
+        # The inference server starts its workers (forked where available) before the
+        # writer thread exists, so no worker inherits a lock held by it
+        if inferenceWorkers > 0:
+            self._start_inference_server(inferenceWorkers, inferenceChunkFrames, inferenceSlotBytes, inferenceTimeout)
+        self.writer = EmbeddingWriter(self.store, flush_interval=flushInterval, batch_size=flushBatch)
+        if inferenceWorkers <= 0 and loadInBackground:
+            threading.Thread(target=self._load_model, daemon=True).start()
+        elif inferenceWorkers <= 0:
+            self._load_model()
+        if not loadInBackground:
+            self.wait_ready()
+
+    def _load_model(self, checkStore: bool=True) -> None:
+        """
+        Import InsightFace, load and prepare the models and run a warm-up inference.
+        
+        Logs how long each step took. Sets `ready` when done, also on failure
+        (with `load_error` set) so waiting callers do not hang.
+        
+        Args:
+            checkStore (bool): Check the embedding store against the recognition model
+        """
+        timings = {}
+        start = step = time.perf_counter()
+        try:
+            from insightface.app import FaceAnalysis
+            timings['import'] = time.perf_counter() - step
+            
+            step = time.perf_counter()
+            self.ctx_id, providers = select_device(self.device)
+            model_name = resolve_model_pack(self.inference_profile, cuda=self.ctx_id >= 0)
+            FancyText.info(f'Using {model_name}')
+            FancyText.info(f"Using {('GPU' if (self.ctx_id >= 0) else 'CPU')} (ctx_id={self.ctx_id})")
+            detector = FaceAnalysis(name=model_name, allowed_modules=self.detection_profile['modules'], providers=providers)
+            timings['load'] = time.perf_counter() - step
+            
+            step = time.perf_counter()
+            det_w, det_h = self.detection_profile['det_size']
+            detector.prepare(ctx_id=self.ctx_id, det_size=(det_w, det_h))
+            apply_session_options(detector, self.inference_profile)
+            self.detector = detector
+            self.model_pack = model_name
+            if checkStore:
+                self._check_model_compatibility()
+            timings['prepare'] = time.perf_counter() - step
+            
+            # The first ONNX Runtime run allocates buffers and picks kernels
+            step = time.perf_counter()
+            rec_model = detector.models['recognition']
+            detector.det_model.detect(np.zeros((det_h, det_w, 3), dtype=np.uint8), max_num=0, metric='default')
+            rec_model.get_feat([np.zeros((rec_model.input_size[1], rec_model.input_size[0], 3), dtype=np.uint8)])
+            timings['warm-up'] = time.perf_counter() - step
+            
+            breakdown = ', '.join(f'{name} {seconds:.2f}s' for name, seconds in timings.items())
+            FancyText.success(f'Face model ready in {time.perf_counter() - start:.2f}s ({breakdown})')
+        except Exception as e:
+            FancyText.error(f'Face model failed to load: {e}')
+            self.load_error = e
+        finally:
+            self.ready.set()
+
+    def wait_ready(self, timeout: float=None) -> None:
+        """
+        Block until the model is loaded.
+        
+        Args:
+            timeout (float): Maximum wait in seconds (None waits indefinitely)
+            
+        Raises:
+            RuntimeError: If the model failed to load or is not ready within the timeout
+        """
+        if not self.ready.wait(timeout):
+            raise RuntimeError('Face model is still loading.')
+        if self.load_error is not None:
+            raise RuntimeError(f'Face model failed to load: {self.load_error}')
+
+    def _start_inference_server(self, workers: int, chunk_frames: int, slot_bytes: int, timeout: float) -> None:
+        """
+        Serve detection from a pool of model processes instead of this process.
+        
+        Each process gets an even share of the cores for ONNX Runtime's
+        intra-op threads unless the inference profile sets them. Every worker
+        builds a model-only FaceSystem from a copy of this object's profiles
+        (see _load_inference_worker), so the workers can be forked or, on
+        Windows, spawned; later changes to crop_enhance or the profiles only
+        reach them after a restart.
+        
+        Args:
+            workers (int): Number of worker processes
+            chunk_frames (int): Maximum frames per worker request
+            slot_bytes (int): Size of one shared-memory frame buffer
+            timeout (float): Seconds a detection waits for the workers
+        """
+        if not self.inference_profile['intra_op_threads']:
+            self.inference_profile['intra_op_threads'] = max(1, (os.cpu_count() or 1) // workers)
+        if self.inference_profile['quantize'] != 'off':
+            # Quantize the pack once here instead of in every worker at the same time
+            try:
+                resolve_model_pack(self.inference_profile, cuda=select_device(self.device)[0] >= 0)
+            except Exception as e:
+                FancyText.error(f'Failed to prepare the quantized model pack: {e}')
+        options = {
+            'inference_profile': self.inference_profile,
+            'detection_profile': self.detection_profile,
+            'quality_profile': self.quality_profile,
+            'crop_enhance': self.crop_enhance,
+            'device': self.device
+        }
+        self.inference_server = InferenceServer(
+            functools.partial(_load_inference_worker, options), _detect_inference_worker,
+            workers=workers, chunk_frames=chunk_frames, slot_bytes=slot_bytes, timeout=timeout,
+            on_ready=self._inference_server_ready
+        )
+
+    @classmethod
+    def _for_inference_worker(cls, options: dict) -> 'FaceSystem':
+        """
+        Model-only FaceSystem for an inference server process.
+
+        Has no embedding store, search index or writer: it only loads the
+        model and runs _detect_batch_local.
+
+        Args:
+            options (dict): inference_profile, detection_profile, quality_profile,
+                crop_enhance and device of the parent FaceSystem
+
+        Returns:
+            FaceSystem: Instance whose model is not loaded yet
+        """
+        system = cls.__new__(cls)
+        system.inference_profile = dict(options['inference_profile'])
+        system.detection_profile = options['detection_profile']
+        system.quality_profile = options['quality_profile']
+        system.crop_enhance = options['crop_enhance']
+        system.device = options['device']
+        system.ctx_id = -1
+        system.detector = None
+        system.model_pack = None
+        system.ready = threading.Event()
+        system.load_error = None
+        system.inference_server = None
+        system.inference_queue = None
+        return system
+
+    def _load_server_model(self) -> dict:
+        """
+        Load the model inside an inference server process.
+        
+        Returns:
+            dict: Identity of the loaded recognition model, for the store compatibility check
+        """
+        self._load_model(checkStore=False)
+        if self.load_error is not None:
+            raise self.load_error
+        return self._model_identity()
+
+    def _inference_server_ready(self, identity: dict, error: str) -> None:
+        """Mark the model ready once the first inference server process has loaded it."""
+        if error is not None:
+            self.load_error = RuntimeError(error)
+        else:
+            self._check_model_compatibility(identity)
+        self.ready.set()
+
+    def _model_identity(self) -> dict:
+        """
+        What the embeddings of the loaded model depend on.
+        
+        Returns:
+            dict: Recognition model file name, loaded model pack (e.g. 'buffalo_l_int8')
+                and quantize mode
+        """
+        quantized = self.model_pack != self.inference_profile['model_pack']
+        return {
+            'file': os.path.basename(self.detector.models['recognition'].model_file),
+            'pack': self.model_pack,
+            'quantize': self.inference_profile['quantize'] if quantized else 'off'
+        }
+
+    def _check_model_compatibility(self, identity: dict=None) -> None:
+        """Warn when stored embeddings come from a different recognition model, pack or quantization."""
+        identity = identity or self._model_identity()
+        stored = self.store.model
+        if isinstance(stored, str) and stored == identity['file']:
+            # Manifests written before the pack and quantize mode were recorded
+            stored = self.store.model = identity
+        if stored is None:
+            self.store.model = identity
+        elif stored != identity:
+            describe = lambda m: (
+                f"{m['pack']}/{m['file']} (quantize {m['quantize']})" if isinstance(m, dict) else str(m)
+            )
+            FancyText.warning(
+                f'Stored embeddings were computed with {describe(stored)}, but the loaded model is {describe(identity)}. '
+                f'Re-enroll faces (python test.py) for reliable recognition.'
+            )
+
+    @property
+    def _norm_matrix(self):
+        """Normalized embedding matrix held by the search index, or None if empty."""
+        if self.index is None or len(self.index) == 0:
+            return None
+        return self.index.matrix
 
     def _load_embeddings(self) -> dict:
         """
-        Load face embeddings from disk.
+        Load face embeddings from the embedding store.
+        
+        Imports the legacy pickle file once if the store has not been created yet.
+        Embeddings are returned as row views into the memory-mapped matrix.
         
         Returns:
             dict: Dictionary mapping person names to embedding lists
+            
+        Raises:
+            RuntimeError: If the legacy pickle cannot be migrated. Starting with an
+                empty gallery instead would create the store without the legacy
+                faces, and the migration would never be retried.
         """
-        if os.path.exists(self.embeddings_path):
+        if not self.store.exists and os.path.exists(self.embeddings_path):
             try:
-                with open(self.embeddings_path, 'rb') as f:
-                    return pickle.load(f)
+                imported = self.store.migrate_pickle(self.embeddings_path)
+                FancyText.success(f'Migrated {imported} embeddings from {self.embeddings_path}')
             except Exception as e:
-                FancyText.error(f'Failed to load embeddings: {e}')
-                return {}
-        return {}
+                FancyText.error(f'Failed to migrate embeddings: {e}')
+                raise RuntimeError(
+                    f'Could not migrate {self.embeddings_path} ({e}); fix or move the file and restart.'
+                ) from e
+        known_faces = {}
+        matrix = self.store.matrix
+        for row, name in enumerate(self.store.row_names()):
+            known_faces.setdefault(name, []).append(matrix[row])
+        return known_faces
 
     def _save_embeddings(self) -> None:
-        """Save face embeddings to disk."""
-        os.makedirs(os.path.dirname(self.embeddings_path), exist_ok=True)
-        with open(self.embeddings_path, 'wb') as f:
-            pickle.dump(self.known_faces, f)
+        """Write all queued face embeddings to disk now."""
+        self.writer.flush()
+
+    @property
+    def pending_writes(self) -> int:
+        """Number of registered embeddings not yet written to disk."""
+        return self.writer.pending
+
+    def close(self) -> None:
+        """Flush queued embeddings, stop the background writer and the inference server."""
+        self.writer.close()
+        if self.inference_server is not None:
+            self.inference_server.close()
+
+    def _append_embedding(self, personName: str, embedding: np.ndarray, journal=None, entry=None) -> np.ndarray:
+        """
+        Record a new embedding in memory and queue it for the embedding store.
+        
+        Args:
+            personName (str): Name of the person
+            embedding (np.ndarray): Face embedding vector
+            journal: Log that records `entry` in the same commit step as the embedding
+                (see EmbeddingWriter.submit)
+            entry: Journal entry for the embedding
+            
+        Returns:
+            np.ndarray: The normalized float32 embedding that was stored
+        """
+        emb = embedding.astype(np.float32)
+        emb /= np.linalg.norm(emb)
+        with self._update_lock:
+            self.known_faces.setdefault(personName, []).append(emb)
+            self.writer.submit(personName, emb[None, :], journal, entry)
+        return emb
 
     def _rebuild_cache(self):
         """
-        Rebuild normalized embedding matrix for fast recognition.
-        
-        Concatenates all embeddings and normalizes them for cosine similarity search.
-        """
-        all_embeddings = []
-        all_names = []
-        for name, emb_list in self.known_faces.items():
-            for emb in emb_list:
-                all_embeddings.append(emb.astype(np.float32))
-                all_names.append(name)
-        if len(all_embeddings) == 0:
-            self._emb_matrix = None
-            self._norm_matrix = None
-            self._name_list = []
-            return
-        self._emb_matrix = np.vstack(all_embeddings).astype(np.float32)
-        self._name_list = all_names
-        self._norm_matrix = self._emb_matrix / np.linalg.norm(self._emb_matrix, axis=1, keepdims=True)
+        Rebuild the search index from all known embeddings.
+        
+        Normalizes every embedding for cosine similarity search. In template
+        mode each person contributes only their aggregated template rows; the
+        raw embeddings stay in known_faces and on disk for re-clustering.
+        Without templates, the committed store matrix is indexed directly as
+        a zero-copy view.
+        
+        The new index is built on the side and published together with its
+        name list, so concurrent searches see either the old or the new one.
+        """
+        with self._update_lock:
+            total = sum(len(v) for v in self.known_faces.values())
+            template_rows = {}
+            if self.template_mode == 'off' and total and total == len(self.store):
+                index = create_index(self.search_backend, dim=self.store.dim, **self.search_options)
+                names = self.store.row_names()
+                index.build(self.store.matrix)
+            else:
+                all_vectors = []
+                names = []
+                for name, emb_list in self.known_faces.items():
+                    if not emb_list:
+                        continue
+                    vectors = build_templates(np.vstack(emb_list), self.template_mode, self.template_k)
+                    all_vectors.append(vectors)
+                    template_rows[name] = list(range(len(names), len(names) + vectors.shape[0]))
+                    names.extend([name] * vectors.shape[0])
+                dim = all_vectors[0].shape[1] if all_vectors else 512
+                index = create_index(self.search_backend, dim=dim, **self.search_options)
+                if all_vectors:
+                    index.build(np.vstack(all_vectors))
+            with self._search_lock:
+                self.index, self._name_list = index, names
+            self._template_rows = template_rows
+
+    def _add_to_cache(self, personName: str, embedding: np.ndarray) -> None:
+        """
+        Add one embedding to the search index without a full rebuild.
+        
+        In template mode, a new embedding for an already known person changes
+        that person's template: only their templates are recomputed, and their
+        index rows are overwritten in place (new rows are appended when the
+        person gains a medoid).
+        
+        Args:
+            personName (str): Name of the person
+            embedding (np.ndarray): Face embedding vector
+        """
+        with self._update_lock:
+            if self.template_mode == 'off':
+                with self._search_lock:
+                    self.index.add(build_templates(embedding[None, :]))
+                    self._name_list.append(personName)
+                return
+            rows = self._template_rows.get(personName, [])
+            templates = build_templates(np.vstack(self.known_faces[personName]), self.template_mode, self.template_k)
+            if templates.shape[0] < len(rows):
+                self._rebuild_cache()
+                return
+            with self._search_lock:
+                if rows:
+                    self.index.replace(np.asarray(rows), templates[:len(rows)])
+                start = len(self._name_list)
+                self.index.add(templates[len(rows):])
+                self._name_list.extend([personName] * (templates.shape[0] - len(rows)))
+            self._template_rows[personName] = rows + list(range(start, len(self._name_list)))
 
     def detectFace(self, frame: np.ndarray) -> list:
         """
@@ -92,95 +447,179 @@ class FaceSystem():
         Returns:
             list: List of detected faces with bounding boxes and embeddings
         """
-        faceObjects = self.detector.get(frame)
-        results = []
-        for f in faceObjects:
-            results.append({'bbox': f.bbox.astype(int), 'embedding': f.normed_embedding})
-        return results
+        return self.detect_batch([frame])[0]
 
-    def _process_image(self, path: str, personName: str) -> bool:
+    def start_inference_queue(self, max_batch_frames: int=16) -> InferenceQueue:
         """
-        Process single image and extract face embedding.
+        Route all detection through one shared queue.
+        
+        Used when several cameras share this FaceSystem: concurrent check-ins
+        are batched together and the model is only ever called from one thread.
         
         Args:
-            path (str): Path to image file
-            personName (str): Name of the person in image
+            max_batch_frames (int): Maximum number of frames per model call
             
         Returns:
-            bool: True if embedding extracted successfully
+            InferenceQueue: The started queue
         """
-        img = cv2.imread(path)
-        if img is None:
-            FancyText.warning(f'Cannot read image: {path}')
-            return False
-        results = self.detectFace(img)
-        if not results:
-            FancyText.warning(f'No face detected in: {path}')
-            return False
-        embedding = results[0]['embedding']
-        if personName not in self.known_faces:
-            self.known_faces[personName] = []
-        self.known_faces[personName].append(embedding)
-        FancyText.success(f'Generated embedding for {personName}')
-        return True
+        if self.inference_queue is None:
+            self.inference_queue = InferenceQueue(self._detect_batch_local, max_batch_frames=max_batch_frames)
+        return self.inference_queue
 
-    def registerFace(self, path: str) -> None:
+    def detect_batch(self, frames: list, batch_size: int=64, pregate: bool=False) -> list:
+        """
+        Detect faces across several frames and embed them in batches.
+        
+        Goes through the inference server when one is running, otherwise
+        through the shared inference queue when one has been started.
+        
+        Args:
+            frames (list): List of BGR image frames (None entries are skipped)
+            batch_size (int): Maximum number of face crops per recognition call
+            pregate (bool): Apply the detection profile's 'faces' pre-gate. Only check-ins
+                set it; registration and enrollment images are always fully detected.
+            
+        Returns:
+            list: One list of detected faces per input frame, same format as detectFace
+        """
+        self.wait_ready()
+        if self.inference_server is not None:
+            return self.inference_server.detect_batch(frames, pregate=pregate)
+        if self.inference_queue is not None and not self.inference_queue.in_consumer_thread():
+            return self.inference_queue.detect_batch(frames, pregate=pregate)
+        return self._detect_batch_local(frames, batch_size, pregate)
+
+    def _detect_batch_local(self, frames: list, batch_size: int=64, pregate: bool=False) -> list:
+        """
+        Detect faces across several frames and embed them in batches.
+        
+        Detection runs frame by frame, then the aligned crops of every face
+        from every frame go through the recognition model together, so the
+        ONNX call overhead is paid once per batch instead of once per face.
+        Landmark and gender/age models are skipped since only the bounding
+        box and embedding are used. With crop_enhance set, only the small
+        aligned crops are contrast-enhanced, never the full frame.
+        With the 'faces' gate and `pregate` set, a frame is only fully
+        detected when a pass at the small gate_det_size finds a face;
+        configured tiles are detected in addition to the full frame and
+        merged with NMS.
+        Every face gets a 'quality' score (detection score, pose, blur);
+        faces below the quality profile's thresholds are returned without an
+        embedding and never reach the recognition model. Faces under
+        min_face_size are skipped before they are even aligned.
+        
+        Args:
+            frames (list): List of BGR image frames (None entries are skipped)
+            batch_size (int): Maximum number of face crops per recognition call
+            pregate (bool): Apply the 'faces' pre-gate; a list gives one flag per frame
+            
+        Returns:
+            list: One list of detected faces per input frame, same format as detectFace
+        """
+        from insightface.utils import face_align
+        
+        det_model = self.detector.det_model
+        rec_model = self.detector.models['recognition']
+        profile = self.detection_profile
+        results = [[] for _ in frames]
+        crops, owners = [], []
+        if isinstance(pregate, bool):
+            pregate = [pregate] * len(frames)
+        for i, frame in enumerate(frames):
+            if frame is None:
+                continue
+            if profile['gate'] == 'faces' and pregate[i]:
+                found, _ = det_model.detect(frame, input_size=tuple(profile['gate_det_size']), max_num=1)
+                if found.shape[0] == 0:
+                    continue
+            bboxes, kpss = detect_tiled(det_model, frame, profile)
+            if bboxes.shape[0] == 0 or kpss is None:
+                continue
+            for j in range(bboxes.shape[0]):
+                face = {
+                    'bbox': bboxes[j, :4].astype(int),
+                    'det_score': float(bboxes[j, 4]),
+                    'kps': kpss[j]
+                }
+                results[i].append(face)
+                if undersized(face, self.quality_profile):
+                    face['quality'] = 0.0
+                    continue
+                crop = face_align.norm_crop(frame, landmark=kpss[j], image_size=rec_model.input_size[0])
+                if score_face(face, crop, self.quality_profile) < self.quality_profile['min_quality']:
+                    continue
+                crops.append(enhance_face_crop(crop) if self.crop_enhance else crop)
+                owners.append((i, len(results[i]) - 1))
+        for start in range(0, len(crops), batch_size):
+            feats = rec_model.get_feat(crops[start:start + batch_size]).astype(np.float32)
+            feats /= np.linalg.norm(feats, axis=1, keepdims=True)
+            for (i, k), feat in zip(owners[start:start + batch_size], feats):
+                results[i][k]['embedding'] = feat
+        return results
+
+    def registerFace(self, path: str, workers: int=4, batch_size: int=16) -> dict:
         """
         Register faces from image file(s).
         
+        Images are read and decoded by a thread pool and detected in batches.
+        Files already enrolled (same content hash) are skipped, so an
+        interrupted run can simply be restarted.
+        
         Args:
             path (str): Path to single image or directory of images
+            workers (int): Number of image reader threads
+            batch_size (int): Number of images per detection batch
+            
+        Returns:
+            dict: Enrollment statistics (total, enrolled, skipped, no_face, failed)
         """
         if not os.path.exists(path):
             FancyText.error(f'Path does not exist: {path}')
-            return
+            return {}
         files = [path] if os.path.isfile(path) else [os.path.join(path, f) for f in os.listdir(path) if os.path.isfile(os.path.join(path, f))]
         if not files:
             FancyText.error(f'No files found in {path}')
-            return
-        count = 0
-        for filePath in files:
-            personName = os.path.splitext(os.path.basename(filePath))[0]
-            if self._process_image(filePath, personName):
-                count += 1
-        self._save_embeddings()
+            return {}
+        log = EnrollmentLog(os.path.splitext(self.embeddings_path)[0] + '.enrolled', committed=len(self.store))
+        stats = enroll_files(self, files, log, workers=workers, batch_size=batch_size)
         self._rebuild_cache()
         total_embeddings = sum(len(v) for v in self.known_faces.values())
         FancyText.success(
-            f'Updated embeddings for {count} images/people '
-            f'(total {len(self.known_faces)} people, {total_embeddings} embeddings)'
+            f"Updated embeddings for {stats['enrolled']} images/people "
+            f"(skipped {stats['skipped']}, no face {stats['no_face']}, failed {stats['failed']}; "
+            f'total {len(self.known_faces)} people, {total_embeddings} embeddings)'
         )
+        return stats
 
     def register_face_from_image(self, personName: str, image_data: np.ndarray) -> bool:
         """
         Register a single face from an image buffer.
         
+        Uses the highest-quality face in the image, not the first one detected.
+        
         Args:
             personName (str): Name of the person in the image.
             image_data (np.ndarray): Image data in a numpy array.
             
         Returns:
-            bool: True if embedding was extracted and saved successfully.
+            bool: True if embedding was extracted and registered successfully.
         """
         results = self.detectFace(image_data)
-        if not results:
-            FancyText.warning(f'No face detected for: {personName}')
+        face = best_face(results)
+        if face is None:
+            FancyText.warning(f'No usable face detected for: {personName}')
             return False
         
-        embedding = results[0]['embedding']
-        
-        if personName not in self.known_faces:
-            self.known_faces[personName] = []
-        
-        self.known_faces[personName].append(embedding)
-        FancyText.success(f'Generated embedding for {personName}')
-        
-        self._save_embeddings()
-        self._rebuild_cache()
+        # The search index is updated now; the disk write happens in the background
+        with self._update_lock:
+            embedding = self._append_embedding(personName, face['embedding'])
+            self._add_to_cache(personName, embedding)
+        FancyText.success(f"Generated embedding for {personName} (quality {face['quality']:.2f})")
         
         total_embeddings = sum(len(v) for v in self.known_faces.values())
         FancyText.success(
-            f'Updated embeddings. Total {len(self.known_faces)} people, {total_embeddings} embeddings.'
+            f'Updated embeddings. Total {len(self.known_faces)} people, {total_embeddings} embeddings '
+            f'({self.pending_writes} waiting to be written).'
         )
         return True
 
@@ -194,14 +633,77 @@ class FaceSystem():
         Returns:
             tuple: (person_name, confidence_score)
         """
-        if self._norm_matrix is None:
-            return ('Unknown', 0.0)
-        faceEmb = faceEmb.astype(np.float32)
-        face_norm = faceEmb / np.linalg.norm(faceEmb)
-        scores = np.dot(self._norm_matrix, face_norm)
-        best_idx = int(np.argmax(scores))
-        best_score = float(scores[best_idx])
-        best_name = self._name_list[best_idx]
-        if best_score > self.threshold:
-            return (best_name, best_score)
-        return ('Unknown', best_score)
+        names, scores, _ = self.recognize_many([faceEmb])
+        return (names[0], scores[0])
+
+    def recognize_many(self, embeddings: list, top_k: int=1, threshold: float=None) -> tuple[list, list, list]:
+        """
+        Recognize several faces with one matrix-matrix product.
+        
+        Args:
+            embeddings (list): Face embedding vectors (or an array of shape (m, dim))
+            top_k (int): Number of candidate people to return per face
+            threshold (float): Recognition threshold (default: self.threshold)
+            
+        Returns:
+            tuple: (names, scores, candidates) with one entry per face; candidates
+                are lists of (person_name, score) pairs, best first
+        """
+        count = len(embeddings)
+        if count == 0:
+            return ([], [], [])
+        threshold = self.threshold if threshold is None else threshold
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(count, -1)
+        # A zero query stays zero (scores 0, 'Unknown') instead of turning into NaN
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        with self._search_lock:
+            if self._norm_matrix is None:
+                return (['Unknown'] * count, [0.0] * count, [[] for _ in range(count)])
+            # Over-fetch rows so that people with several samples still yield top_k distinct candidates
+            ids, scores = self.index.search_many(queries, k=top_k * 4 if top_k > 1 else 1)
+            name_list = self._name_list
+            row_names = [[name_list[int(idx)] if idx >= 0 else None for idx in row_ids] for row_ids in ids]
+        names, best_scores, candidates = [], [], []
+        for row, row_scores in zip(row_names, scores):
+            ranked = []
+            for name, score in zip(row, row_scores):
+                if name is not None and name not in [n for n, _ in ranked]:
+                    ranked.append((name, float(score)))
+                if len(ranked) >= top_k:
+                    break
+            if not ranked:
+                names.append('Unknown')
+                best_scores.append(0.0)
+            else:
+                best_name, best_score = ranked[0]
+                names.append(best_name if best_score > threshold else 'Unknown')
+                best_scores.append(best_score)
+            candidates.append(ranked)
+        return (names, best_scores, candidates)
+
+
+# Model-only FaceSystem of this process when it is an inference server worker
+_worker_system = None
+
+
+def _load_inference_worker(options: dict) -> dict:
+    """
+    Inference server worker entry point: load the model in this process.
+
+    A module-level function (bound through functools.partial), so it can be
+    pickled for spawned workers.
+
+    Args:
+        options (dict): Profiles of the parent FaceSystem (see FaceSystem._for_inference_worker)
+
+    Returns:
+        dict: Identity of the loaded recognition model
+    """
+    global _worker_system
+    _worker_system = FaceSystem._for_inference_worker(options)
+    return _worker_system._load_server_model()
+
+
+def _detect_inference_worker(frames: list, pregate=False) -> list:
+    """Inference server worker entry point: detect and embed faces with the loaded model."""
+    return _worker_system._detect_batch_local(frames, pregate=pregate)
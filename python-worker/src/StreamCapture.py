@@ -1,10 +1,47 @@
 """RTSP stream capture with automatic reconnection."""
 
 import cv2
+import os
 import time
-import gc
+import numpy as np
 from src.utils import FancyText
 import threading
+from contextlib import contextmanager
+
+DECODE_MODES = ('always', 'on_demand')
+
+DEFAULT_CAPTURE_PROFILE = {
+    'transport': 'tcp',
+    'low_latency': True,
+    'decoder_threads': 2,
+    'hw_accel': False,
+    'stream': 'main',
+    'frame_size': [960, 540]
+}
+
+# OpenCV reads FFmpeg options from this environment variable when a capture is opened
+_FFMPEG_OPTIONS_ENV = 'OPENCV_FFMPEG_CAPTURE_OPTIONS'
+_open_lock = threading.Lock()
+
+
+def ffmpeg_capture_options(profile: dict) -> str:
+    """
+    Build the OpenCV FFmpeg capture option string for a capture profile.
+    
+    Args:
+        profile (dict): Capture profile (see DEFAULT_CAPTURE_PROFILE)
+        
+    Returns:
+        str: Options in OpenCV's "key;value|key;value" format
+    """
+    options = []
+    if profile.get('transport') in ('tcp', 'udp'):
+        options.append(f"rtsp_transport;{profile['transport']}")
+    if profile.get('low_latency'):
+        options += ['fflags;nobuffer', 'flags;low_delay', 'max_delay;0']
+    if profile.get('decoder_threads'):
+        options.append(f"threads;{int(profile['decoder_threads'])}")
+    return '|'.join(options)
 
 
 class StreamCapture():
@@ -12,10 +49,21 @@ class StreamCapture():
     RTSP stream capture with threaded frame reading and auto-reconnection.
     
     Maintains a background thread that continuously reads frames from RTSP stream.
+    Frames are resized straight into a preallocated ring of buffers and tagged
+    with increasing sequence numbers, so no per-frame allocation happens and
+    readers wake as soon as a new frame lands. read() returns a copy of the
+    latest frame; the pipeline takes frames out of the ring without copying
+    (take_seq(), iter_frames()), and a fresh buffer replaces each taken one.
+    Skipped frames are only grabbed (cap.grab) and never retrieved, which
+    avoids the color conversion and copy for frames nobody uses. In
+    'on_demand' decode mode frames are only retrieved while a consumer is
+    subscribed (see active()).
     Supports automatic reconnection on connection loss.
     """
     
-    def __init__(self, url: str, reconnectDelay: float = 3, readTimeout: float = 5):
+    def __init__(self, url: str, reconnectDelay: float = 3, readTimeout: float = 5,
+                 frameSize: tuple = (960, 540), ringSize: int = 4,
+                 skipFrames: int = 2, decodeMode: str = 'always', captureProfile: dict = None):
         """
         Initialize RTSP stream capture.
         
@@ -23,13 +71,34 @@ class StreamCapture():
             url (str): RTSP stream URL
             reconnectDelay (float): Delay in seconds before reconnection attempt
             readTimeout (float): Timeout in seconds for frame read operations
+            frameSize (tuple): (width, height) frames are resized to
+            ringSize (int): Number of preallocated frame buffers
+            skipFrames (int): Number of frames grabbed without decoding between retrieved frames
+            decodeMode (str): 'always' to keep the latest frame ready, or 'on_demand'
+                to retrieve frames only while a consumer is subscribed
+            captureProfile (dict): FFmpeg transport/latency/thread/hardware options
+                (see DEFAULT_CAPTURE_PROFILE); its frame_size overrides frameSize
         """
         self.url = url
         self.reconnectDelay = reconnectDelay
         self.readTimeout = readTimeout
+        self.captureProfile = {**DEFAULT_CAPTURE_PROFILE, **(captureProfile or {})}
+        if captureProfile and captureProfile.get('frame_size'):
+            frameSize = tuple(captureProfile['frame_size'])
+        self.frameSize = tuple(frameSize)
         self.cap = None
-        self.frame = None
+        self._ring = [np.empty((frameSize[1], frameSize[0], 3), dtype=np.uint8) for _ in range(max(2, ringSize))]
+        self._seq = 0
+        self._taken = -1
+        self.skipFrames = max(0, skipFrames)
+        if decodeMode not in DECODE_MODES:
+            FancyText.warning(f'Unknown decode mode "{decodeMode}", using "always".')
+            decodeMode = 'always'
+        self.decodeMode = decodeMode
+        self._subscribers = 0
+        self._fresh_after = 0
         self.lock = threading.Lock()
+        self._frame_ready = threading.Condition(self.lock)
         self.thread = threading.Thread(target=self._update, daemon=True)
         self.is_running = True
         self._connect()
@@ -38,7 +107,7 @@ class StreamCapture():
 
     def _connect(self):
         """Establish RTSP connection."""
-        self.cap = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG)
+        self.cap = self._open_capture()
         
         # Limit the buffer size to reduce memory consumption
         self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
@@ -51,8 +120,33 @@ class StreamCapture():
             # Pre-read a few frames to clear buffer
             for _ in range(3):
                 self.cap.read()
-            with self.lock:
-                self.frame = None
+
+    def _open_capture(self):
+        """
+        Open the FFmpeg capture with the options of the capture profile.
+        
+        FFmpeg options are passed through an environment variable that OpenCV
+        reads at open time, so opens are serialized to keep per-camera options
+        from leaking into each other.
+        
+        Returns:
+            cv2.VideoCapture: The capture (possibly not opened)
+        """
+        params = []
+        if self.captureProfile.get('hw_accel') and hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+            params += [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+        with _open_lock:
+            previous = os.environ.get(_FFMPEG_OPTIONS_ENV)
+            os.environ[_FFMPEG_OPTIONS_ENV] = ffmpeg_capture_options(self.captureProfile)
+            try:
+                if params:
+                    return cv2.VideoCapture(self.url, cv2.CAP_FFMPEG, params)
+                return cv2.VideoCapture(self.url, cv2.CAP_FFMPEG)
+            finally:
+                if previous is None:
+                    os.environ.pop(_FFMPEG_OPTIONS_ENV, None)
+                else:
+                    os.environ[_FFMPEG_OPTIONS_ENV] = previous
 
     def _reconnect(self):
         """Attempt to re-establish RTSP connection."""
@@ -66,28 +160,16 @@ class StreamCapture():
     def _update(self):
         """Background thread that continuously reads frames."""
         frame_count = 0
-        skip_frames = 2  # Process every 3rd frame to reduce memory pressure
         
         while self.is_running:
             if self.cap and self.cap.isOpened():
                 try:
-                    ret, frame = self.cap.read()
-                    if ret:
+                    if self.cap.grab():
                         frame_count += 1
-                        # Skip frames to reduce memory pressure
-                        if frame_count % (skip_frames + 1) == 0:
-                            # Resize to reduce memory footprint (~50% smaller)
-                            if frame is not None:
-                                resized = cv2.resize(frame, (960, 540), interpolation=cv2.INTER_LINEAR)
-                                with self.lock:
-                                    self.frame = resized
-                                del resized
-                            del frame
-                        else:
-                            del frame
-                        # Periodic garbage collection
-                        if frame_count % 30 == 0:
-                            gc.collect()
+                        if frame_count % (self.skipFrames + 1) == 0 and self._wants_frames():
+                            ret, frame = self.cap.retrieve()
+                            if ret and frame is not None:
+                                self._publish(frame)
                     else:
                         time.sleep(0.1)
                 except Exception as e:
@@ -98,6 +180,102 @@ class StreamCapture():
                 time.sleep(self.reconnectDelay)
             time.sleep(0.01)
 
+    def _wants_frames(self) -> bool:
+        """True if grabbed frames should be retrieved and published."""
+        return self.decodeMode == 'always' or self._subscribers > 0
+
+    def subscribe(self) -> None:
+        """
+        Register a consumer that needs decoded frames.
+        
+        In 'on_demand' mode the first subscriber starts frame retrieval and
+        frames published before this point are treated as stale.
+        """
+        with self._frame_ready:
+            if self._subscribers == 0 and self.decodeMode == 'on_demand':
+                self._fresh_after = self._seq
+            self._subscribers += 1
+
+    def unsubscribe(self) -> None:
+        """Unregister a consumer added with subscribe()."""
+        with self._frame_ready:
+            self._subscribers = max(0, self._subscribers - 1)
+
+    @contextmanager
+    def active(self):
+        """Context manager keeping frame retrieval on for the duration of a block."""
+        self.subscribe()
+        try:
+            yield self
+        finally:
+            self.unsubscribe()
+
+    def _publish(self, frame):
+        """
+        Resize a decoded frame into the next ring slot and wake waiting readers.
+        
+        The slot being written is never the latest published one, so a reader
+        holding the latest frame is not overwritten until the ring wraps.
+        
+        Args:
+            frame (np.ndarray): Decoded BGR frame
+        """
+        slot = (self._seq + 1) % len(self._ring)
+        cv2.resize(frame, self.frameSize, dst=self._ring[slot], interpolation=cv2.INTER_LINEAR)
+        with self._frame_ready:
+            self._seq += 1
+            self._frame_ready.notify_all()
+
+    def read_seq(self, after: int = 0, timeout: float = None) -> tuple:
+        """
+        Wait for a frame newer than a given sequence number.
+        
+        The returned array is a ring buffer slot that is reused once the ring
+        wraps around; copy it if it must outlive the next few frames.
+        
+        Args:
+            after (int): Only return a frame with a sequence number above this
+            timeout (float): Maximum wait in seconds (default: readTimeout)
+            
+        Returns:
+            tuple: (sequence_number, frame), or (after, None) on timeout
+        """
+        timeout = self.readTimeout if timeout is None else timeout
+        with self.active():
+            with self._frame_ready:
+                after = max(after, self._fresh_after)
+                if not self._frame_ready.wait_for(lambda: self._seq > after and self._seq != self._taken, timeout=timeout):
+                    return after, None
+                return self._seq, self._ring[self._seq % len(self._ring)]
+
+    def take_seq(self, after: int = 0, timeout: float = None) -> tuple:
+        """
+        Wait for a frame newer than a given sequence number and take it out of the ring.
+        
+        Zero-copy: the caller gets the ring buffer itself and a new buffer
+        takes its slot, so the capture thread never writes into the returned
+        array and the caller may keep or modify it.
+        
+        Args:
+            after (int): Only return a frame with a sequence number above this
+            timeout (float): Maximum wait in seconds (default: readTimeout)
+            
+        Returns:
+            tuple: (sequence_number, frame), or (after, None) on timeout
+        """
+        timeout = self.readTimeout if timeout is None else timeout
+        with self.active():
+            with self._frame_ready:
+                after = max(after, self._fresh_after)
+                if not self._frame_ready.wait_for(lambda: self._seq > after and self._seq != self._taken, timeout=timeout):
+                    return after, None
+                # The slot being written is never the latest one, so swapping it is safe
+                slot = self._seq % len(self._ring)
+                frame = self._ring[slot]
+                self._ring[slot] = np.empty_like(frame)
+                self._taken = self._seq
+                return self._seq, frame
+
     def read(self):
         """
         Read the latest frame from the stream.
@@ -105,17 +283,57 @@ class StreamCapture():
         Blocks until a frame is available or timeout is reached.
         
         Returns:
-            np.ndarray: Frame image, or None if timeout or connection lost
+            np.ndarray: Copy of the latest frame, or None if timeout or connection lost
         """
-        startTime = time.time()
-        while self.frame is None and time.time() - startTime < self.readTimeout:
-            time.sleep(0.1)
-        with self.lock:
-            frame_to_return = self.frame
+        _, frame_to_return = self.read_seq()
         if frame_to_return is None:
             FancyText.warning('RTSP frame read timeout (Frame buffer empty).')
             return None
-        return frame_to_return
+        return frame_to_return.copy()
+
+    def iter_frames(self, n: int, min_gap: float = 0.5):
+        """
+        Yield up to n distinct frames spaced at least `min_gap` seconds apart.
+        
+        Frames are yielded as soon as they arrive, so a consumer can process
+        one frame while the next is still being waited for. Frames are taken
+        out of the ring (see take_seq()), not copied.
+        
+        Args:
+            n (int): Number of frames to collect
+            min_gap (float): Minimum time in seconds between collected frames
+            
+        Yields:
+            np.ndarray: Each distinct frame, owned by the caller
+        """
+        seq = 0
+        next_time = 0.0
+        collected = 0
+        with self.active():
+            while collected < n:
+                delay = next_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                seq, frame = self.take_seq(after=seq)
+                if frame is None:
+                    FancyText.warning(f'RTSP frame read timeout after {collected}/{n} frames.')
+                    return
+                collected += 1
+                next_time = time.monotonic() + min_gap
+                yield frame
+
+    def read_many(self, n: int, min_gap: float = 0.5) -> list:
+        """
+        Collect several distinct frames spaced at least `min_gap` seconds apart.
+        
+        Args:
+            n (int): Number of frames to collect
+            min_gap (float): Minimum time in seconds between collected frames
+            
+        Returns:
+            list: Up to n distinct frames owned by the caller (fewer on timeout)
+        """
+        return list(self.iter_frames(n, min_gap))
 
     def stop(self):
         """Stop capturing and close connection."""
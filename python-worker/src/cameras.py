@@ -0,0 +1,161 @@
+"""Camera registry for workers covering several classrooms."""
+
+import os
+from src.utils import FancyText
+from src.StreamCapture import StreamCapture
+
+
+class Camera():
+    """A configured camera, its capture stream and the students it covers."""
+
+    def __init__(self, camera_id: str, url: str, stream: StreamCapture, roster: list = None, entry: dict = None):
+        self.id = camera_id
+        self.url = url
+        self.stream = stream
+        self.roster = roster
+        self.entry = entry
+
+
+class CameraRegistry():
+    """
+    Collection of cameras read from the `cameras` config list.
+
+    Each entry is ``{"id": "room-101", "url": "rtsp://..."}``; ``url_env`` may
+    name an environment variable holding the URL instead, to keep camera
+    credentials out of config.json. ``substream_url`` / ``substream_url_env``
+    give the camera's low-resolution stream, used when the capture profile
+    selects ``"stream": "sub"``, and ``profile`` overrides keys of the
+    global capture profile for that camera. ``roster`` lists the students of
+    the camera's classroom: a check-in on it reports only them, present or
+    absent. Without a roster the whole gallery is expected, which only fits
+    a worker with a single classroom. With no cameras configured, the
+    RTSP_URL environment variable is used as a single camera named 'default'
+    (with RTSP_SUBSTREAM_URL as its substream).
+    """
+
+    def __init__(self, cameras: list, stream_options: dict = None):
+        """
+        Args:
+            cameras (list): List of {'id': str, 'url': str} or {'id': str, 'url_env': str}
+            stream_options (dict): Keyword arguments passed to every StreamCapture
+        """
+        self.stream_options = stream_options or {}
+        self.cameras = {}
+        for entry in cameras:
+            self.add(entry)
+        self._check_rosters()
+
+    def _check_rosters(self) -> None:
+        """Warn when several cameras would each report the whole gallery."""
+        if len(self.cameras) > 1 and any(camera.roster is None for camera in self):
+            FancyText.warning(
+                'Several cameras without a "roster": their check-ins report every student of '
+                'the gallery, so students of other classrooms show up as absent.'
+            )
+
+    @classmethod
+    def from_config(cls, cameras: list, default_url: str = None, stream_options: dict = None) -> 'CameraRegistry':
+        """
+        Build the registry from config, falling back to a single default camera.
+
+        Args:
+            cameras (list): Camera entries from config
+            default_url (str): URL used when no cameras are configured
+            stream_options (dict): Keyword arguments passed to every StreamCapture
+
+        Returns:
+            CameraRegistry: The registry
+        """
+        return cls(cls._entries(cameras, default_url), stream_options)
+
+    @staticmethod
+    def _entries(cameras: list, default_url: str = None) -> list:
+        """Camera entries from config, or the default camera when none are configured."""
+        if not cameras and default_url:
+            return [{'id': 'default', 'url': default_url, 'substream_url_env': 'RTSP_SUBSTREAM_URL'}]
+        return list(cameras or [])
+
+    def reload(self, cameras: list, default_url: str = None) -> None:
+        """
+        Apply an updated `cameras` config list.
+
+        Cameras whose entry is unchanged keep their stream. Removed and changed
+        cameras are stopped (a check-in running on one of them ends with the
+        frames captured so far); changed and new ones are connected again.
+
+        Args:
+            cameras (list): Camera entries from config
+            default_url (str): URL used when no cameras are configured
+        """
+        entries = self._entries(cameras, default_url)
+        wanted = {str(entry.get('id', '')).strip(): entry for entry in entries}
+        for camera in list(self.cameras.values()):
+            if wanted.get(camera.id) != camera.entry:
+                FancyText.info(f'Disconnecting camera {camera.id}')
+                camera.stream.stop()
+                del self.cameras[camera.id]
+        for entry in entries:
+            if str(entry.get('id', '')).strip() not in self.cameras:
+                self.add(entry)
+        self._check_rosters()
+
+    def add(self, entry: dict) -> None:
+        """
+        Connect a camera and add it to the registry.
+
+        Args:
+            entry (dict): Camera config entry
+        """
+        camera_id = str(entry.get('id', '')).strip()
+        profile = {**self.stream_options.get('captureProfile', {}), **entry.get('profile', {})}
+        url = entry.get('url') or os.getenv(entry.get('url_env', ''), '')
+        if profile.get('stream') == 'sub':
+            substream = entry.get('substream_url') or os.getenv(entry.get('substream_url_env', ''), '')
+            if substream:
+                url = substream
+            else:
+                FancyText.warning(f'Camera {camera_id} has no substream URL, using the main stream.')
+        if not camera_id or not url:
+            FancyText.error(f'Invalid camera entry (id and url are required): {entry}')
+            return
+        if camera_id in self.cameras:
+            FancyText.warning(f'Duplicate camera id "{camera_id}" ignored.')
+            return
+        roster = entry.get('roster')
+        if roster is not None and not isinstance(roster, list):
+            FancyText.error(f'Invalid roster for camera {camera_id} (a list of names is required), using the whole gallery.')
+            roster = None
+        FancyText.info(f'Connecting to camera {camera_id}')
+        stream = StreamCapture(url, **{**self.stream_options, 'captureProfile': profile})
+        self.cameras[camera_id] = Camera(camera_id, url, stream, roster=roster, entry=dict(entry))
+
+    def __len__(self):
+        return len(self.cameras)
+
+    def __iter__(self):
+        # A snapshot, so a reload on another thread cannot break the iteration
+        return iter(list(self.cameras.values()))
+
+    def get(self, camera_id: str) -> Camera:
+        """Look up a camera by ID (None if unknown)."""
+        return self.cameras.get(camera_id)
+
+    def select(self, camera_id: str = None) -> list:
+        """
+        Resolve the cameras a command targets.
+
+        Args:
+            camera_id (str): Camera ID, or None for every camera
+
+        Returns:
+            list: Matching cameras (empty if the ID is unknown)
+        """
+        if camera_id is None or camera_id == '':
+            return list(self.cameras.values())
+        camera = self.get(camera_id)
+        return [camera] if camera else []
+
+    def stop_all(self) -> None:
+        """Stop every camera stream."""
+        for camera in self.cameras.values():
+            camera.stream.stop()
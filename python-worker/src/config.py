@@ -8,9 +8,79 @@ from src.utils import FancyText
 CONFIG_FILE = 'config.json'
 DEFAULT_CFG = {
     'image_capture_interval': ['07:00'],
+    'schedule_days': ['daily'],
+    'schedule_holidays': [],
+    'capture_schedule': [],
+    'schedule_catch_up': 'skip',
+    'schedule_grace': 60,
+    'schedule_catch_up_window': 1800,
     'retry_delay': 3,
     'face_recognition_threshold': 0.4,
-    'frame_count': 2
+    'frame_count': 2,
+    'checkin_batch_frames': 8,
+    'search_backend': 'exact',
+    'search_nprobe': 8,
+    'template_mode': 'off',
+    'template_k': 3,
+    'embedding_flush_interval': 2.0,
+    'embedding_flush_batch': 32,
+    'stream_decode_mode': 'always',
+    'stream_skip_frames': 2,
+    'cameras': [],
+    'inference_batch_frames': 16,
+    'inference_workers': 0,
+    'inference_chunk_frames': 1,
+    'inference_slot_mb': 3,
+    'inference_timeout': 60,
+    'job_workers': 4,
+    'max_concurrent_checkins': 3,
+    'schedule_spread': 60,
+    'attendance_transport': 'binary',
+    'http_connect_timeout': 3.05,
+    'http_read_timeout': 10,
+    'http_retries': 3,
+    'outbox_max_image_mb': 200,
+    'outbox_max_attempts': 10,
+    'enhance_mode': 'frame',
+    'device': 'auto',
+    'attendance_mode': 'snapshot',
+    'tracking_window': 20,
+    'tracking_fps': 2,
+    'tracking_iou': 0.3,
+    'tracking_similarity': 0.5,
+    'tracking_min_hits': 1,
+    'capture_profile': {
+        'transport': 'tcp',
+        'low_latency': True,
+        'decoder_threads': 2,
+        'hw_accel': False,
+        'stream': 'main',
+        'frame_size': [960, 540]
+    },
+    'detection_profile': {
+        'modules': ['detection', 'recognition'],
+        'det_size': [480, 480],
+        'gate': 'off',
+        'motion_threshold': 0.02,
+        'gate_det_size': [256, 256],
+        'tiles': [1, 1],
+        'tile_overlap': 0.2,
+        'tile_region': 1.0
+    },
+    'quality_profile': {
+        'min_quality': 0.01,
+        'min_face_size': 20,
+        'blur_reference': 100.0,
+        'max_yaw': 0.5
+    },
+    'inference_profile': {
+        'model_pack': 'buffalo_l',
+        'quantize': 'off',
+        'intra_op_threads': 0,
+        'inter_op_threads': 0,
+        'graph_optimization': 'all',
+        'execution_mode': 'sequential'
+    }
 }
 
 
@@ -36,6 +106,7 @@ class ConfigManager:
     def _init_config(self):
         """Initialize configuration with defaults."""
         self.config = DEFAULT_CFG.copy()
+        self._listeners = []
         self.load()
 
     def load(self):
@@ -93,6 +164,20 @@ class ConfigManager:
                 self.config.update(allowed_updates)
                 self.save()
                 FancyText.success('Configuration updated and saved.')
+        for callback in list(self._listeners) if allowed_updates else []:
+            try:
+                callback(list(allowed_updates))
+            except Exception as e:
+                FancyText.error(f'Configuration listener failed ({type(e).__name__}): {e}')
+
+    def subscribe(self, callback):
+        """
+        Register a callback for configuration updates.
+        
+        Args:
+            callback (callable): Called with the list of updated keys after each update
+        """
+        self._listeners.append(callback)
 
 
 # Global singleton instance for application-wide access
@@ -0,0 +1,183 @@
+"""Detection profile: model modules, pre-gating and tiled detection."""
+
+import cv2
+import numpy as np
+
+GATE_MODES = ('off', 'motion', 'faces')
+
+DEFAULT_DETECTION_PROFILE = {
+    'modules': ['detection', 'recognition'],
+    'det_size': [480, 480],
+    'gate': 'off',
+    'motion_threshold': 0.02,
+    'gate_det_size': [256, 256],
+    'tiles': [1, 1],
+    'tile_overlap': 0.2,
+    'tile_region': 1.0
+}
+
+
+def detection_profile(profile: dict = None) -> dict:
+    """
+    Merge a detection profile with the defaults.
+
+    Profile keys:
+        modules: InsightFace modules to load; detection and recognition are always kept
+        det_size: Detector input size of the full-frame pass
+        gate: 'off', 'motion' (skip frames that did not change) or 'faces'
+            (skip frames where a small detector pass finds no face)
+        motion_threshold: Fraction of changed pixels that counts as motion
+        gate_det_size: Detector input size of the 'faces' gate pass
+        tiles: [columns, rows] of extra detection tiles; [1, 1] disables tiling
+        tile_overlap: Overlap between neighbouring tiles, as a fraction of the tile size
+        tile_region: Fraction of the frame height, from the top, covered by tiles
+
+    Args:
+        profile (dict): Partial profile (e.g. from config)
+
+    Returns:
+        dict: Complete profile
+    """
+    merged = {**DEFAULT_DETECTION_PROFILE, **(profile or {})}
+    if merged['modules'] is not None:
+        merged['modules'] = sorted(set(merged['modules']) | {'detection', 'recognition'})
+    if merged['gate'] not in GATE_MODES:
+        merged['gate'] = 'off'
+    return merged
+
+
+def tile_boxes(width: int, height: int, tiles: list, overlap: float = 0.2, region: float = 1.0) -> list:
+    """
+    Overlapping tiles covering the top `region` of a frame.
+
+    Args:
+        width (int): Frame width
+        height (int): Frame height
+        tiles (list): [columns, rows]
+        overlap (float): Overlap as a fraction of the tile size
+        region (float): Fraction of the frame height covered, from the top
+
+    Returns:
+        list: (x0, y0, x1, y1) pixel boxes, empty when tiling is disabled
+    """
+    cols, rows = int(tiles[0]), int(tiles[1])
+    if cols * rows <= 1:
+        return []
+    region_h = max(1, int(height * min(max(region, 0.0), 1.0)))
+    tile_w = int(width / (cols - (cols - 1) * overlap))
+    tile_h = int(region_h / (rows - (rows - 1) * overlap))
+    step_x = (width - tile_w) / (cols - 1) if cols > 1 else 0
+    step_y = (region_h - tile_h) / (rows - 1) if rows > 1 else 0
+    boxes = []
+    for r in range(rows):
+        for c in range(cols):
+            x0, y0 = int(round(c * step_x)), int(round(r * step_y))
+            boxes.append((x0, y0, min(width, x0 + tile_w), min(region_h, y0 + tile_h)))
+    return boxes
+
+
+def nms(bboxes: np.ndarray, kpss: np.ndarray, iou: float = 0.4) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Non-maximum suppression over merged detections.
+
+    Args:
+        bboxes (np.ndarray): (N, 5) boxes as x0, y0, x1, y1, score
+        kpss (np.ndarray): (N, 5, 2) landmarks
+        iou (float): Overlap above which the lower-scoring box is dropped
+
+    Returns:
+        tuple: (bboxes, kpss) that were kept, highest score first
+    """
+    order = np.argsort(-bboxes[:, 4])
+    areas = (bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.maximum(0, np.minimum(bboxes[i, 2], bboxes[rest, 2]) - np.maximum(bboxes[i, 0], bboxes[rest, 0]))
+        h = np.maximum(0, np.minimum(bboxes[i, 3], bboxes[rest, 3]) - np.maximum(bboxes[i, 1], bboxes[rest, 1]))
+        inter = w * h
+        order = rest[inter / (areas[i] + areas[rest] - inter + 1e-9) <= iou]
+    return bboxes[keep], kpss[keep]
+
+
+def detect_tiled(det_model, frame: np.ndarray, profile: dict) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Full-frame detection plus detection on tiles, merged with NMS.
+
+    Each tile is scaled up to the detector input size on its own, so faces
+    in the back rows are seen at a larger scale than in the full-frame pass.
+
+    Args:
+        det_model: InsightFace detection model
+        frame (np.ndarray): BGR image frame
+        profile (dict): Detection profile
+
+    Returns:
+        tuple: (bboxes (N, 5), kpss (N, 5, 2))
+    """
+    bboxes, kpss = det_model.detect(frame, max_num=0, metric='default')
+    if kpss is None:
+        kpss = np.zeros((bboxes.shape[0], 5, 2), dtype=np.float32)
+    boxes = tile_boxes(frame.shape[1], frame.shape[0], profile['tiles'], profile['tile_overlap'], profile['tile_region'])
+    if not boxes:
+        return bboxes, kpss
+    all_bboxes, all_kpss = [bboxes], [kpss]
+    for x0, y0, x1, y1 in boxes:
+        tile_bboxes, tile_kpss = det_model.detect(frame[y0:y1, x0:x1], max_num=0, metric='default')
+        if tile_bboxes.shape[0] == 0 or tile_kpss is None:
+            continue
+        tile_bboxes = tile_bboxes.copy()
+        tile_bboxes[:, [0, 2]] += x0
+        tile_bboxes[:, [1, 3]] += y0
+        all_bboxes.append(tile_bboxes)
+        all_kpss.append(tile_kpss + np.array([x0, y0], dtype=tile_kpss.dtype))
+    bboxes, kpss = np.concatenate(all_bboxes), np.concatenate(all_kpss)
+    if bboxes.shape[0] == 0:
+        return bboxes, kpss
+    return nms(bboxes, kpss)
+
+
+class MotionGate():
+    """
+    Frame differencing against the last frame that went through detection.
+
+    Works on a small blurred grayscale copy, so sensor noise and compression
+    artifacts do not count as motion. Frames that barely differ from the last
+    detected frame can reuse its detections.
+    """
+
+    def __init__(self, threshold: float = 0.02, width: int = 160, pixel_delta: int = 25):
+        """
+        Args:
+            threshold (float): Fraction of changed pixels that counts as motion
+            width (int): Width of the comparison image in pixels
+            pixel_delta (int): Gray-level difference that counts as a changed pixel
+        """
+        self.threshold = threshold
+        self.width = width
+        self.pixel_delta = pixel_delta
+        self._reference = None
+        self.skipped = 0
+
+    def changed(self, frame: np.ndarray) -> bool:
+        """
+        Check a frame against the reference and make it the new reference if it changed.
+
+        Args:
+            frame (np.ndarray): BGR image frame
+
+        Returns:
+            bool: True for the first frame and for frames with enough motion
+        """
+        h, w = frame.shape[:2]
+        small = cv2.resize(frame, (self.width, max(1, h * self.width // w)), interpolation=cv2.INTER_AREA)
+        small = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        if self._reference is not None and self._reference.shape == small.shape:
+            diff = cv2.absdiff(small, self._reference)
+            if np.count_nonzero(diff > self.pixel_delta) < self.threshold * diff.size:
+                self.skipped += 1
+                return False
+        self._reference = small
+        return True
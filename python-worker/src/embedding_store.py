@@ -0,0 +1,343 @@
+"""Append-only, memory-mapped storage for face embeddings."""
+
+import json
+import os
+import pickle
+import threading
+import time
+import numpy as np
+from src.utils import FancyText
+
+# Backoff after a failed background write, doubling from RETRY_DELAY up to MAX_RETRY_DELAY seconds
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 60.0
+
+
+class EmbeddingStore():
+    """
+    Columnar embedding store backed by flat binary files.
+
+    Layout for a prefix such as ``data/embeddings``:
+
+    - ``embeddings.f32``: contiguous float32 matrix, one normalized embedding per row
+    - ``embeddings.ids``: uint32 person id for every row
+    - ``embeddings.json``: manifest with the embedding dimension, the number of
+      committed rows, the person names (the id is the position in the list)
+      and the recognition model the embeddings were computed with (model file,
+      model pack and quantize mode)
+
+    Rows are appended to the binary files and only become visible once the
+    manifest is atomically replaced by ``commit()``. Bytes past the committed
+    row count (from a crash mid-write) are truncated on the next open, so the
+    store is never left half-written. The committed matrix is exposed as a
+    read-only ``np.memmap``, so loading costs no copies or Python objects.
+    """
+
+    def __init__(self, prefix: str):
+        """
+        Open (or create) an embedding store.
+
+        Args:
+            prefix (str): Path prefix without extension (e.g. 'data/embeddings')
+        """
+        self.data_path = f'{prefix}.f32'
+        self.ids_path = f'{prefix}.ids'
+        self.manifest_path = f'{prefix}.json'
+        self.dim = None
+        self.model = None
+        self.count = 0
+        self.names = []
+        self._name_ids = {}
+        self._pending = 0
+        self._matrix = None
+        self._ids = None
+        self._load_manifest()
+        self._truncate_uncommitted()
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def uncommitted(self) -> int:
+        """Number of rows appended since the last commit."""
+        return self._pending
+
+    @property
+    def exists(self) -> bool:
+        """True if a manifest has been committed before."""
+        return os.path.exists(self.manifest_path)
+
+    def _load_manifest(self) -> None:
+        """Read dimension, model, committed row count and names from the manifest."""
+        if not self.exists:
+            return
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.dim = manifest.get('dim')
+        self.model = manifest.get('model')
+        self.count = int(manifest.get('count', 0))
+        self.names = list(manifest.get('names', []))
+        self._name_ids = {name: i for i, name in enumerate(self.names)}
+
+    def _truncate_uncommitted(self) -> None:
+        """Drop rows written after the last commit (e.g. by a crash)."""
+        if not self.dim:
+            return
+        for path, row_bytes in ((self.data_path, self.dim * 4), (self.ids_path, 4)):
+            expected = self.count * row_bytes
+            if os.path.exists(path) and os.path.getsize(path) > expected:
+                FancyText.warning(f'Discarding uncommitted data in {path}')
+                with open(path, 'r+b') as f:
+                    f.truncate(expected)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Committed embeddings as a read-only (count, dim) memory map."""
+        if self.count == 0:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        if self._matrix is None or self._matrix.shape[0] != self.count:
+            self._matrix = np.memmap(self.data_path, dtype=np.float32, mode='r', shape=(self.count, self.dim))
+        return self._matrix
+
+    @property
+    def ids(self) -> np.ndarray:
+        """Committed person ids as a read-only uint32 memory map."""
+        if self.count == 0:
+            return np.empty(0, dtype=np.uint32)
+        if self._ids is None or self._ids.shape[0] != self.count:
+            self._ids = np.memmap(self.ids_path, dtype=np.uint32, mode='r', shape=(self.count,))
+        return self._ids
+
+    def row_names(self) -> list:
+        """Person name of every committed row."""
+        return [self.names[i] for i in self.ids.tolist()]
+
+    def append(self, name: str, vectors: np.ndarray) -> None:
+        """
+        Append embeddings for a person; visible after the next commit().
+
+        Args:
+            name (str): Person name
+            vectors (np.ndarray): Normalized embeddings of shape (n, dim)
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f'Embedding dimension {vectors.shape[1]} does not match store dimension {self.dim}')
+        if name not in self._name_ids:
+            self._name_ids[name] = len(self.names)
+            self.names.append(name)
+        os.makedirs(os.path.dirname(self.data_path) or '.', exist_ok=True)
+        with open(self.data_path, 'ab') as f:
+            f.write(vectors.tobytes())
+        with open(self.ids_path, 'ab') as f:
+            f.write(np.full(vectors.shape[0], self._name_ids[name], dtype=np.uint32).tobytes())
+        self._pending += vectors.shape[0]
+
+    def commit(self) -> None:
+        """Make all appended rows durable and visible by atomically replacing the manifest."""
+        if self._pending == 0 and self.exists:
+            return
+        for path in (self.data_path, self.ids_path):
+            if os.path.exists(path):
+                with open(path, 'ab') as f:
+                    f.flush()
+                    os.fsync(f.fileno())
+        manifest = {
+            'version': 1, 'dim': self.dim, 'model': self.model, 'count': self.count + self._pending, 'names': self.names
+        }
+        tmp_path = f'{self.manifest_path}.tmp'
+        os.makedirs(os.path.dirname(self.manifest_path) or '.', exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+        self.count += self._pending
+        self._pending = 0
+
+    def discard(self) -> None:
+        """Drop everything appended since the last commit, in memory and on disk."""
+        self.dim = self.model = None
+        self.count = 0
+        self.names = []
+        self._name_ids = {}
+        self._pending = 0
+        self._matrix = self._ids = None
+        self._load_manifest()
+        for path, row_bytes in ((self.data_path, (self.dim or 0) * 4), (self.ids_path, 4)):
+            if os.path.exists(path) and os.path.getsize(path) > self.count * row_bytes:
+                with open(path, 'r+b') as f:
+                    f.truncate(self.count * row_bytes)
+
+    def migrate_pickle(self, pickle_path: str) -> int:
+        """
+        One-time import of a legacy ``{name: [embedding, ...]}`` pickle file.
+
+        The pickle file is left untouched. The import is all or nothing: if it
+        fails, the rows staged so far are discarded before the error is raised,
+        so a later commit cannot publish half of it.
+
+        Args:
+            pickle_path (str): Path to the legacy embeddings pickle
+
+        Returns:
+            int: Number of embeddings imported
+        """
+        imported = 0
+        try:
+            with open(pickle_path, 'rb') as f:
+                legacy = pickle.load(f)
+            for name, emb_list in legacy.items():
+                if not len(emb_list):
+                    continue
+                vectors = np.vstack(emb_list).astype(np.float32)
+                vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+                self.append(name, vectors)
+                imported += vectors.shape[0]
+            self.commit()
+        except Exception:
+            self.discard()
+            raise
+        return imported
+
+
+class EmbeddingWriter():
+    """
+    Write-behind persistence for an EmbeddingStore.
+
+    Registrations are queued in memory and written by a background thread
+    once `batch_size` embeddings are waiting or `flush_interval` seconds have
+    passed since the first one, so bulk onboarding costs one append and one
+    commit per batch instead of per student.
+
+    An embedding may carry a journal entry (such as the enrollment log record
+    of its source image). Journal entries are written by the same drain,
+    right before the manifest commit that makes their rows durable.
+    """
+
+    def __init__(self, store: EmbeddingStore, flush_interval: float = 2.0, batch_size: int = 32):
+        """
+        Start the background writer.
+
+        Args:
+            store (EmbeddingStore): Store to persist into
+            flush_interval (float): Maximum delay in seconds before queued embeddings are written
+            batch_size (int): Number of queued embeddings that triggers an immediate write
+        """
+        self.store = store
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = []
+        self._queued_rows = 0
+        self._in_flight = 0
+        # Journal entries of rows appended to the store but not yet journaled
+        self._journal = []
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self) -> int:
+        """Number of embeddings accepted but not yet committed to disk."""
+        with self._cond:
+            return self._queued_rows + max(self._in_flight, self.store.uncommitted)
+
+    def submit(self, name: str, vectors: np.ndarray, journal=None, entry=None) -> None:
+        """
+        Queue embeddings for a person to be written in the background.
+
+        Args:
+            name (str): Person name
+            vectors (np.ndarray): Normalized embeddings of shape (n, dim)
+            journal: Object whose add(entries, rows) records `entry` in the commit step
+                of these embeddings (e.g. an EnrollmentLog)
+            entry: Journal entry for these embeddings
+        """
+        with self._cond:
+            self._queue.append((name, vectors, journal, entry))
+            self._queued_rows += vectors.shape[0]
+            self._cond.notify()
+
+    def _drain(self) -> bool:
+        """
+        Write and commit everything queued so far.
+
+        Returns:
+            bool: False if the write failed and the embeddings were queued again
+        """
+        with self._io_lock:
+            with self._cond:
+                batch, self._queue = self._queue, []
+                self._in_flight, self._queued_rows = self._queued_rows, 0
+            if not batch and not self.store.uncommitted:
+                return True
+            written = 0
+            try:
+                for name, vectors, journal, entry in batch:
+                    self.store.append(name, vectors)
+                    written += 1
+                    if journal is not None:
+                        self._journal.append((journal, entry))
+                # Journal entries are tagged with the row count of this commit, so entries
+                # written before a failed or interrupted commit are ignored on load
+                rows = len(self.store) + self.store.uncommitted
+                journals = {}
+                for journal, entry in self._journal:
+                    journals.setdefault(id(journal), (journal, []))[1].append(entry)
+                for journal, entries in journals.values():
+                    journal.add(entries, rows)
+                self._journal = []
+                self.store.commit()
+                return True
+            except Exception as e:
+                # Rows already appended stay staged in the store and go out with the next commit
+                FancyText.error(f'Failed to persist embeddings: {e}')
+                with self._cond:
+                    self._queue = batch[written:] + self._queue
+                    self._queued_rows += sum(item[1].shape[0] for item in batch[written:])
+                return False
+            finally:
+                with self._cond:
+                    self._in_flight = 0
+
+    def _run(self) -> None:
+        """Background loop: wait for work, debounce, then write; back off after a failed write."""
+        delay = 0.0
+        while True:
+            with self._cond:
+                # After a failed write, retry rows left staged in the store even without new work
+                while self._running and not self._queue and not delay:
+                    self._cond.wait()
+                if not self._running and not self._queue:
+                    return
+                deadline = time.monotonic() + self.flush_interval
+                while self._running and self._queued_rows < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            if self._drain():
+                delay = 0.0
+                continue
+            # Disk full or file locked: retrying right away would spin and flood the log
+            delay = min(max(delay * 2, RETRY_DELAY), MAX_RETRY_DELAY)
+            with self._cond:
+                if not self._running:
+                    return
+                self._cond.wait_for(lambda: not self._running, timeout=delay)
+
+    def flush(self) -> None:
+        """Synchronously write and commit all queued embeddings."""
+        self._drain()
+
+    def close(self) -> None:
+        """Flush remaining embeddings and stop the background thread."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+        self._drain()
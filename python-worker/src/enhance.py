@@ -0,0 +1,118 @@
+"""Image enhancement before face recognition, using precomputed lookup tables."""
+
+import threading
+import cv2
+import numpy as np
+from src.utils import FancyText
+
+# off:      frames and face crops are used as captured
+# frame:    the original rules on the whole frame (brighten dark frames,
+#           gamma 0.8 on very bright frames, sharpen blurry frames)
+# adaptive: gamma chosen per frame to move its mean brightness to TARGET_BRIGHTNESS
+# faces:    no full-frame processing; CLAHE on each aligned face crop before embedding
+ENHANCE_MODES = ('off', 'frame', 'adaptive', 'faces')
+
+DARK_BELOW = 80
+BRIGHT_ABOVE = 200
+SHARPEN_BELOW = 100
+TARGET_BRIGHTNESS = 128
+
+GAMMA_STEP = 0.05
+GAMMA_RANGE = (0.4, 2.5)
+
+_LEVELS = np.arange(256, dtype=np.float32) / 255.0
+_GAMMAS = np.round(np.arange(GAMMA_RANGE[0], GAMMA_RANGE[1] + GAMMA_STEP / 2, GAMMA_STEP), 2)
+# One 256-entry table per gamma step, built once at import
+GAMMA_LUTS = {float(g): (np.power(_LEVELS, g) * 255).astype(np.uint8) for g in _GAMMAS}
+BRIGHTEN_LUT = np.clip(np.round(np.arange(256, dtype=np.float32) * 1.2 + 20), 0, 255).astype(np.uint8)
+SHARPEN_KERNEL = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]], dtype=np.float32)
+
+_clahe = threading.local()
+
+
+def gamma_lut(gamma: float) -> np.ndarray:
+    """
+    Precomputed gamma table nearest to `gamma`.
+
+    Args:
+        gamma (float): Gamma exponent; values outside GAMMA_RANGE are clamped
+
+    Returns:
+        np.ndarray: 256-entry uint8 lookup table
+    """
+    gamma = min(max(gamma, GAMMA_RANGE[0]), GAMMA_RANGE[1])
+    return GAMMA_LUTS[float(np.round(np.round(gamma / GAMMA_STEP) * GAMMA_STEP, 2))]
+
+
+def frame_stats(frame: np.ndarray) -> tuple[float, float]:
+    """
+    Brightness and sharpness of a frame, measured on its grayscale copy.
+
+    The frame is converted to grayscale once; both statistics come from that
+    image. Sharpness is taken at full resolution on purpose: downscaling
+    removes blur, so the Laplacian variance of a small copy is many times
+    larger and SHARPEN_BELOW would no longer match the frames it was tuned on.
+
+    Args:
+        frame (np.ndarray): BGR image frame
+
+    Returns:
+        tuple: (mean brightness 0-255, variance of the Laplacian)
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    mean = cv2.mean(gray)[0]
+    _, std = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_32F))
+    return mean, float(std[0, 0]) ** 2
+
+
+def enhance_frame(frame: np.ndarray, mode: str = 'frame') -> np.ndarray:
+    """
+    Enhance brightness and sharpness of a whole frame.
+
+    Args:
+        frame (np.ndarray): Input BGR image frame
+        mode (str): One of ENHANCE_MODES; 'off' and 'faces' return the frame unchanged
+
+    Returns:
+        np.ndarray: Enhanced image frame, or the input frame if nothing applies or processing fails
+    """
+    if mode not in ('frame', 'adaptive'):
+        return frame
+    try:
+        brightness, sharpness = frame_stats(frame)
+        lut = None
+        if mode == 'frame':
+            if brightness < DARK_BELOW:
+                lut = BRIGHTEN_LUT
+            elif brightness > BRIGHT_ABOVE:
+                lut = GAMMA_LUTS[0.8]
+        elif not DARK_BELOW <= brightness <= BRIGHT_ABOVE:
+            # Gamma that maps the current mean onto the target mean
+            mean = min(max(brightness, 1.0), 254.0) / 255.0
+            lut = gamma_lut(np.log(TARGET_BRIGHTNESS / 255.0) / np.log(mean))
+        enhanced = cv2.LUT(frame, lut) if lut is not None else frame
+        # A LUT changes contrast only slightly; the sharpness of the original frame is close enough
+        if sharpness < SHARPEN_BELOW:
+            enhanced = cv2.filter2D(enhanced, -1, SHARPEN_KERNEL)
+        return enhanced
+    except Exception as e:
+        FancyText.error(f'Image enhancement error: {e}')
+        return frame
+
+
+def enhance_face_crop(crop: np.ndarray) -> np.ndarray:
+    """
+    Equalize local contrast of an aligned face crop with CLAHE on its luminance.
+
+    Args:
+        crop (np.ndarray): Aligned BGR face crop (e.g. 112x112)
+
+    Returns:
+        np.ndarray: Enhanced crop
+    """
+    clahe = getattr(_clahe, 'instance', None)
+    if clahe is None:
+        clahe = _clahe.instance = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(4, 4))
+    lab = cv2.cvtColor(crop, cv2.COLOR_BGR2LAB)
+    lab[:, :, 0] = clahe.apply(lab[:, :, 0])
+    return cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
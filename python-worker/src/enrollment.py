@@ -0,0 +1,208 @@
+"""Parallel offline face enrollment from a folder of images."""
+
+import hashlib
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from src.utils import FancyText
+from src.quality import best_face
+
+
+class EnrollmentLog():
+    """
+    Record of image files already enrolled, keyed by content hash.
+
+    Stored as ``<sha1>\\t<name>\\t<rows>`` lines next to the embedding store,
+    so an interrupted enrollment resumes where it stopped and renamed or
+    copied photos are not embedded twice. Entries are written by the
+    embedding writer in the commit step of their embeddings, tagged with the
+    store row count of that commit; an entry whose commit never completed is
+    dropped on load, so the log and the store cannot disagree.
+    """
+
+    def __init__(self, path: str, committed: int = None):
+        """
+        Args:
+            path (str): Path to the log file
+            committed (int): Committed row count of the embedding store (None keeps every entry)
+        """
+        self.path = path
+        self.hashes = {}
+        self._lock = threading.Lock()
+        if not os.path.exists(path):
+            return
+        kept, dropped = [], 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                digest, name, rows = (line.rstrip('\n').split('\t') + ['', ''])[:3]
+                if not digest:
+                    continue
+                if committed is not None and rows and int(rows) > committed:
+                    dropped += 1
+                    continue
+                self.hashes[digest] = name
+                kept.append(line if line.endswith('\n') else line + '\n')
+        if dropped:
+            # Rewrite without the stale entries, so a later commit cannot make them valid
+            FancyText.warning(f'Dropping {dropped} enrollment log entries whose embeddings were never committed')
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.writelines(kept)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self.hashes
+
+    def add(self, entries: list, rows: int) -> None:
+        """
+        Durably record enrolled files (called by the embedding writer before its commit).
+
+        Args:
+            entries (list): List of (digest, name) pairs
+            rows (int): Store row count once the commit of these entries completes
+        """
+        if not entries:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            for digest, name in entries:
+                f.write(f'{digest}\t{name}\t{rows}\n')
+                self.hashes[digest] = name
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _read_image(path: str) -> tuple[str, bytes]:
+    """
+    Read and hash one image file.
+
+    Args:
+        path (str): Image file path
+
+    Returns:
+        tuple: (sha1 hex digest, encoded file content)
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    return hashlib.sha1(data).hexdigest(), data
+
+
+def enroll_files(face_system, files: list, log: EnrollmentLog, workers: int = 4,
+                 batch_size: int = 16, commit_every: int = 256) -> dict:
+    """
+    Enroll image files into a FaceSystem in parallel.
+
+    A thread pool reads and hashes images, and decodes only those whose hash
+    is neither in the log nor already claimed by another file of this run,
+    into a bounded queue; the calling thread pulls them in batches for
+    detect_batch(), so decoding of the next images overlaps with detection of
+    the current batch. The person name is the file name without extension;
+    the highest-quality face of each image is enrolled, and its log entry is
+    written in the commit step of its embedding.
+
+    Args:
+        face_system: FaceSystem instance to enroll into
+        files (list): Image file paths
+        log (EnrollmentLog): Log of already enrolled content hashes
+        workers (int): Number of reader/decoder threads
+        batch_size (int): Number of images per detection batch
+        commit_every (int): Number of new embeddings between disk commits
+
+    Returns:
+        dict: Counts of total, enrolled, skipped, no_face and failed files
+    """
+    stats = {'total': len(files), 'enrolled': 0, 'skipped': 0, 'no_face': 0, 'failed': 0}
+    if not files:
+        return stats
+    decoded = queue.Queue(maxsize=max(1, workers * batch_size))
+    seen = set()
+    seen_lock = threading.Lock()
+    # Set when enrollment fails, so readers blocked on the full queue give up
+    stop = threading.Event()
+    appended = 0
+    start = time.perf_counter()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                decoded.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def load(path):
+        if stop.is_set():
+            return
+        try:
+            digest, data = _read_image(path)
+        except Exception as e:
+            FancyText.warning(f'Cannot read image {path}: {e}')
+            put((path, None, False, None))
+            return
+        with seen_lock:
+            duplicate = digest in log or digest in seen
+            seen.add(digest)
+        if duplicate:
+            put((path, digest, True, None))
+            return
+        try:
+            img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        except Exception:
+            img = None
+        put((path, digest, False, img))
+
+    def process(batch):
+        nonlocal appended
+        faces_per_image = face_system.detect_batch([img for _, _, img in batch], batch_size=batch_size * 4)
+        for (path, digest, _), faces in zip(batch, faces_per_image):
+            face = best_face(faces)
+            if face is None:
+                FancyText.warning(f'No usable face detected in: {path}')
+                stats['no_face'] += 1
+                continue
+            name = os.path.splitext(os.path.basename(path))[0]
+            face_system._append_embedding(name, face['embedding'], journal=log, entry=(digest, name))
+            appended += 1
+            stats['enrolled'] += 1
+        if appended >= commit_every:
+            face_system._save_embeddings()
+            appended = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for path in files:
+            pool.submit(load, path)
+        try:
+            batch = []
+            for done in range(1, len(files) + 1):
+                path, digest, skipped, img = decoded.get()
+                if digest is None:
+                    stats['failed'] += 1
+                elif skipped:
+                    stats['skipped'] += 1
+                elif img is None:
+                    FancyText.warning(f'Cannot decode image: {path}')
+                    stats['failed'] += 1
+                else:
+                    batch.append((path, digest, img))
+                if len(batch) >= batch_size or (batch and done == len(files)):
+                    process(batch)
+                    batch = []
+                    elapsed = time.perf_counter() - start
+                    FancyText.info(
+                        f'Enrollment progress: {done}/{len(files)} files ({done / elapsed:.1f}/s), '
+                        f"enrolled {stats['enrolled']}, skipped {stats['skipped']}, "
+                        f"no face {stats['no_face']}, failed {stats['failed']}"
+                    )
+        except BaseException:
+            # Release the readers, or leaving the pool would wait for them forever
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+    face_system._save_embeddings()
+    return stats
@@ -1,10 +1,15 @@
 """Gateway communication module for API and WebSocket interactions."""
 
+import gzip
 import os
+import random
+import threading
 import time
 import json
+import struct
 import requests
 import websocket
+from requests.adapters import HTTPAdapter
 from src.utils import FancyText
 
 
@@ -18,46 +23,264 @@ def get_api_url() -> str:
     return os.getenv('API_GATEWAY_URL', '')
 
 
-def safe_post(path: str, payload: dict) -> dict:
+class GatewayClient():
+    """
+    HTTP client for the API Gateway with connection pooling and retries.
+    
+    Uses one keep-alive requests.Session, gzip-compresses larger JSON bodies,
+    retries with exponential backoff and jitter, and keeps per-endpoint
+    latency and error counters.
+    
+    Idempotent requests are retried on connection errors, timeouts, 429 and
+    5xx responses. Other requests are only retried when they cannot have
+    reached the server (connection errors) or were explicitly refused (429).
+    A read timeout or 5xx may come after the server committed the request,
+    so repeating it could record it twice.
+    """
+    
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+    
+    def __init__(self, connect_timeout: float = 3.05, read_timeout: float = 10, retries: int = 3,
+                 backoff: float = 0.5, max_backoff: float = 8, gzip_min_bytes: int = 1024, pool_size: int = 8):
+        """
+        Args:
+            connect_timeout (float): TCP connect timeout in seconds
+            read_timeout (float): Response read timeout in seconds
+            retries (int): Number of retries after the first attempt
+            backoff (float): Base delay in seconds for exponential backoff
+            max_backoff (float): Maximum delay in seconds between attempts
+            gzip_min_bytes (int): JSON bodies at least this large are gzip-compressed
+            pool_size (int): Maximum number of pooled connections
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.gzip_min_bytes = gzip_min_bytes
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+    
+    def _record(self, path: str, seconds: float, ok: bool, retried: int) -> None:
+        """Update the counters of an endpoint."""
+        with self._stats_lock:
+            stats = self._stats.setdefault(path, {'requests': 0, 'errors': 0, 'retries': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stats['requests'] += 1
+            stats['errors'] += 0 if ok else 1
+            stats['retries'] += retried
+            stats['total_ms'] += seconds * 1000
+            stats['max_ms'] = max(stats['max_ms'], seconds * 1000)
+    
+    def stats(self) -> dict:
+        """
+        Per-endpoint request counters.
+        
+        Returns:
+            dict: {path: {requests, errors, retries, avg_ms, max_ms}}
+        """
+        with self._stats_lock:
+            return {
+                path: {
+                    'requests': s['requests'],
+                    'errors': s['errors'],
+                    'retries': s['retries'],
+                    'avg_ms': round(s['total_ms'] / s['requests'], 1) if s['requests'] else 0.0,
+                    'max_ms': round(s['max_ms'], 1)
+                }
+                for path, s in self._stats.items()
+            }
+    
+    def _sleep_before_retry(self, attempt: int) -> None:
+        """Exponential backoff with full jitter."""
+        time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt))))
+    
+    def post(self, path: str, payload: dict = None, data: bytes = None, headers: dict = None,
+             idempotent: bool = False) -> dict:
+        """
+        Send an HTTP POST request with retries.
+        
+        Args:
+            path (str): API endpoint path
+            payload (dict): JSON request payload
+            data (bytes): Raw request body, used instead of payload
+            headers (dict): Extra request headers
+            idempotent (bool): The Gateway handles a repeat of this request safely
+                (e.g. it carries an idempotency key), so any transient failure is retried
+            
+        Returns:
+            dict: API response
+            
+        Raises:
+            Exception: The last error once all retries are exhausted
+        """
+        base_url = get_api_url()
+        if not base_url:
+            raise RuntimeError('API_GATEWAY_URL not configured.')
+        url = f"{base_url.rstrip('/')}{path}"
+        headers = dict(headers or {})
+        if data is None:
+            data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+            if len(data) >= self.gzip_min_bytes:
+                data = gzip.compress(data, compresslevel=5)
+                headers['Content-Encoding'] = 'gzip'
+        
+        retry_status = self.RETRY_STATUS if idempotent else (429,)
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                resp = self.session.post(url, data=data, headers=headers, timeout=self.timeout)
+                if resp.status_code in retry_status and attempt < self.retries:
+                    raise requests.HTTPError(f'{resp.status_code} Server Error', response=resp)
+                resp.raise_for_status()
+                result = resp.json()
+                self._record(path, time.perf_counter() - start, True, attempt)
+                return result
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                if isinstance(e, requests.HTTPError):
+                    retryable = e.response.status_code in retry_status
+                else:
+                    # ConnectTimeout is a ConnectionError: the request was never sent
+                    retryable = idempotent or isinstance(e, requests.ConnectionError)
+                if not retryable or attempt >= self.retries:
+                    self._record(path, time.perf_counter() - start, False, attempt)
+                    raise
+                FancyText.warning(f'HTTP POST {path} failed ({e}), retry {attempt + 1}/{self.retries}')
+                self._sleep_before_retry(attempt)
+                attempt += 1
+            except Exception:
+                self._record(path, time.perf_counter() - start, False, attempt)
+                raise
+
+
+client = GatewayClient()
+
+
+def get_stats() -> dict:
+    """
+    Per-endpoint latency and error counters of the Gateway client.
+    
+    Returns:
+        dict: {path: {requests, errors, retries, avg_ms, max_ms}}
+    """
+    return client.stats()
+
+
+def safe_post(path: str, payload: dict = None, data: bytes = None, headers: dict = None,
+              idempotent: bool = False) -> dict:
     """
     Send HTTP POST request with error handling.
     
     Args:
         path (str): API endpoint path
-        payload (dict): Request payload
+        payload (dict): JSON request payload
+        data (bytes): Raw request body, used instead of payload
+        headers (dict): Extra request headers
+        idempotent (bool): Retry every transient failure (see GatewayClient.post)
         
     Returns:
         dict: API response or empty dict if request fails
     """
-    base_url = get_api_url()
-    if not base_url:
-        FancyText.error('API_GATEWAY_URL not configured.')
-        return {}
-    
-    url = f"{base_url.rstrip('/')}{path}"
     try:
-        resp = requests.post(url, json=payload, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        if not data.get('success', True):
-            FancyText.warning(f'API returned error: {data}')
-        return data
+        result = client.post(path, payload, data=data, headers=headers, idempotent=idempotent)
+        if not result.get('success', True):
+            FancyText.warning(f'API returned error: {result}')
+        return result
     except Exception as e:
         FancyText.error(f'HTTP POST error at {path}: {e}')
         return {}
 
 
+def is_rejection(error: Exception) -> bool:
+    """
+    Whether a failed request was refused by the Gateway itself.
+    
+    A 4xx answer (other than 408 and 429) means the request is wrong and
+    repeating it cannot succeed; connection errors, timeouts and 5xx answers
+    may pass on a later attempt.
+    
+    Args:
+        error (Exception): Exception raised by GatewayClient.post
+        
+    Returns:
+        bool: True for a permanent rejection
+    """
+    response = getattr(error, 'response', None)
+    if not isinstance(error, requests.HTTPError) or response is None:
+        return False
+    return 400 <= response.status_code < 500 and response.status_code not in (408, 429)
+
+
 def post_attendance(payload: dict) -> dict:
     """
     Send attendance check-in data to Gateway.
     
+    Retried like an idempotent request only when the payload carries an
+    idempotency_key, which the Gateway uses to drop repeats.
+    
     Args:
         payload (dict): Attendance data
         
     Returns:
         dict: API response
+        
+    Raises:
+        requests.RequestException: If the request fails after retries (see is_rejection)
+    """
+    return client.post('/api/attendance', payload, idempotent=bool(payload.get('idempotency_key')))
+
+
+def encode_attendance_bundle(payload: dict, images: list) -> list:
+    """
+    Frame attendance metadata and images as a length-prefixed binary body.
+    
+    Layout: a big-endian uint32 length followed by the UTF-8 JSON metadata,
+    then for each image a big-endian uint32 length followed by its bytes.
+    
+    Args:
+        payload (dict): Attendance metadata (without images)
+        images (list): Encoded image bytes
+        
+    Returns:
+        list: Body chunks; the image buffers are referenced here, and copied
+            once when the chunks are joined into a request body
+    """
+    meta = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    chunks = [struct.pack('>I', len(meta)), meta]
+    for img in images:
+        chunks += [struct.pack('>I', len(img)), img]
+    return chunks
+
+
+def post_attendance_binary(payload: dict, images: list) -> dict:
+    """
+    Send attendance check-in data with raw image bytes to Gateway.
+    
+    Avoids the base64 step and the large JSON document of post_attendance.
+    Retried like post_attendance. The bundle is joined into one bytes body,
+    a single copy of the (small, already compressed) WebP images that lets
+    every retry send the same body with a Content-Length.
+    
+    Args:
+        payload (dict): Attendance metadata (without images)
+        images (list): Encoded WebP image bytes
+        
+    Returns:
+        dict: API response
+        
+    Raises:
+        requests.RequestException: If the request fails after retries (see is_rejection)
     """
-    return safe_post('/api/attendance', payload)
+    return client.post(
+        '/api/attendance/frames',
+        data=b''.join(encode_attendance_bundle(payload, images)),
+        headers={'Content-Type': 'application/octet-stream'},
+        idempotent=bool(payload.get('idempotency_key'))
+    )
 
 
 def upload_image(attendance_id: int, image_b64: str, is_primary: int):
@@ -77,20 +300,64 @@ def upload_image(attendance_id: int, image_b64: str, is_primary: int):
     safe_post('/api/attendance/upload_image', payload)
 
 
+_ws_app = None
+_ws_lock = threading.Lock()
+
+
+def _send_ws(message: dict) -> bool:
+    """
+    Send a message over the open worker WebSocket.
+    
+    Args:
+        message (dict): JSON-serializable message
+        
+    Returns:
+        bool: True if the message was sent
+    """
+    with _ws_lock:
+        ws = _ws_app
+        if ws is None or not ws.sock or not ws.sock.connected:
+            return False
+        try:
+            ws.send(json.dumps(message, ensure_ascii=False))
+            return True
+        except Exception as e:
+            FancyText.warning(f'WebSocket send failed: {e}')
+            return False
+
+
 def post_ack(command_id: str, status: str, detail: dict = None):
     """
     Send command acknowledgment to Gateway.
     
+    Uses the open WebSocket when connected, otherwise the HTTP endpoint.
+    
     Args:
         command_id (str): Command ID
         status (str): Processing status
         detail (dict): Additional details
     """
     payload = {'id': command_id, 'status': status, 'detail': detail or {}}
-    safe_post('/api/command/ack', payload)
+    if _send_ws({'type': 'ack', 'payload': payload}):
+        return
+    # The Gateway only logs acks, so a repeated one is harmless
+    safe_post('/api/command/ack', payload, idempotent=True)
+
+
+def report_status(status: dict) -> bool:
+    """
+    Send the worker status (e.g. model readiness) over the open WebSocket.
+    
+    Args:
+        status (dict): Status details
+        
+    Returns:
+        bool: True if the status was sent
+    """
+    return _send_ws({'type': 'worker_status', 'payload': status})
 
 
-def connect_websocket(on_message_callback):
+def connect_websocket(on_message_callback, on_open_callback=None):
     """
     Connect to WebSocket and maintain connection with auto-reconnect.
     
@@ -99,7 +366,9 @@ def connect_websocket(on_message_callback):
     
     Args:
         on_message_callback (callable): Callback function to handle messages
+        on_open_callback (callable): Called without arguments after each (re)connect
     """
+    global _ws_app
     base_url = get_api_url()
     if not base_url:
         FancyText.error('API_GATEWAY_URL not configured, skipping WebSocket.')
@@ -127,6 +396,11 @@ def connect_websocket(on_message_callback):
     def on_open(ws):
         """Handle WebSocket open event."""
         FancyText.success('WebSocket connected to Gateway (Worker)!')
+        if on_open_callback is not None:
+            try:
+                on_open_callback()
+            except Exception as e:
+                FancyText.error(f'WebSocket open callback error: {e}')
 
     while True:
         try:
@@ -138,9 +412,14 @@ def connect_websocket(on_message_callback):
                 on_error=on_error,
                 on_close=on_close
             )
+            with _ws_lock:
+                _ws_app = ws
             ws.run_forever()
         except Exception as e:
             FancyText.error(f'WebSocket connection failed: {e}')
+        finally:
+            with _ws_lock:
+                _ws_app = None
         
         FancyText.info('Attempting WebSocket reconnect in 5 seconds...')
         time.sleep(5)
\ No newline at end of file
@@ -0,0 +1,89 @@
+"""Shared inference queue batching detection requests across cameras."""
+
+import queue
+import threading
+from concurrent.futures import Future
+from src.utils import FancyText
+
+
+class InferenceQueue():
+    """
+    Single consumer thread that owns all calls into the face model.
+
+    Check-ins from every camera submit their frames here. The consumer takes
+    every request waiting in the queue (up to `max_batch_frames` frames),
+    runs them through one batched detection call and hands each request its
+    own slice of the results. The model is loaded once per process and is
+    never called from two threads at the same time.
+    """
+
+    def __init__(self, detect_fn, max_batch_frames: int = 16):
+        """
+        Start the consumer thread.
+
+        Args:
+            detect_fn (callable): Function taking a list of frames (and a per-frame
+                `pregate` list) and returning one list of faces per frame
+                (e.g. FaceSystem._detect_batch_local)
+            max_batch_frames (int): Maximum number of frames per model call
+        """
+        self.detect_fn = detect_fn
+        self.max_batch_frames = max_batch_frames
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        """Number of requests waiting for the model."""
+        return self._requests.qsize()
+
+    def in_consumer_thread(self) -> bool:
+        """True when called from the consumer thread itself."""
+        return threading.current_thread() is self._thread
+
+    def submit(self, frames: list, pregate: bool = False) -> Future:
+        """
+        Queue frames for detection.
+
+        Args:
+            frames (list): BGR image frames
+            pregate (bool): Apply the 'faces' pre-gate to these frames (check-ins only)
+
+        Returns:
+            Future: Resolves to one list of faces per frame
+        """
+        future = Future()
+        self._requests.put((frames, pregate, future))
+        return future
+
+    def detect_batch(self, frames: list, pregate: bool = False) -> list:
+        """Blocking helper: submit frames and wait for their results."""
+        return self.submit(frames, pregate).result()
+
+    def _run(self) -> None:
+        """Consumer loop: gather waiting requests, detect once, split results."""
+        while True:
+            batch = [self._requests.get()]
+            total = len(batch[0][0])
+            while total < self.max_batch_frames:
+                try:
+                    request = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(request)
+                total += len(request[0])
+            frames = [frame for request_frames, _, _ in batch for frame in request_frames]
+            # Requests of different callers share the call, so the pre-gate is passed per frame
+            pregate = [gated for request_frames, gated, _ in batch for _ in request_frames]
+            try:
+                results = self.detect_fn(frames, pregate=pregate)
+            except Exception as e:
+                FancyText.error(f'Inference error: {e}')
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for request_frames, _, future in batch:
+                future.set_result(results[offset:offset + len(request_frames)])
+                offset += len(request_frames)
@@ -0,0 +1,346 @@
+"""Multi-process inference server fed through shared-memory frame buffers."""
+
+import collections
+import itertools
+import multiprocessing as mp
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from multiprocessing import connection, shared_memory
+import numpy as np
+from src.utils import FancyText
+
+
+def _serve(worker_id: int, load_fn, detect_fn, conn, slots: list) -> None:
+    """
+    Worker process loop: load the model once, then detect frames from shared memory.
+
+    Args:
+        worker_id (int): Index of this worker
+        load_fn (callable): Loads the model in this process; returns a description of it
+        detect_fn (callable): Maps a list of frames to one list of faces per frame
+        conn: This worker's end of its pipe; receives (frame specs, pregate) requests
+            (None to stop) and sends ('ready' | 'result', worker_id, value, error) messages
+        slots (list): Shared memory blocks inherited from the parent
+    """
+    try:
+        info = load_fn()
+    except Exception as e:
+        conn.send(('ready', worker_id, None, str(e)))
+        return
+    conn.send(('ready', worker_id, info, None))
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        specs, pregate = message
+        frames = []
+        for slot, shape, inline in specs:
+            if slot is not None:
+                frames.append(np.ndarray(shape, dtype=np.uint8, buffer=slots[slot].buf))
+            else:
+                frames.append(inline)
+        try:
+            conn.send(('result', worker_id, detect_fn(frames, pregate=pregate), None))
+        except Exception as e:
+            conn.send(('result', worker_id, None, str(e)))
+        finally:
+            del frames
+
+
+class InferenceServer():
+    """
+    Pool of worker processes, each holding its own model instance.
+
+    Frames are copied into a fixed pool of ``multiprocessing.shared_memory``
+    blocks and only their slot index and shape cross the process boundary,
+    so no frame is pickled; only the small per-face results come back. A
+    batch of frames is split into chunks that run on several workers at
+    once, so throughput grows with the number of processes instead of being
+    bound to one process's intra-op threads.
+
+    Every worker has its own pipe and the parent hands a request to an idle
+    worker itself, recording the assignment before sending it. No lock is
+    shared between processes, so a worker killed at any point cannot block
+    the others, and the request it held is failed as soon as its process
+    sentinel fires. Requests wait in the parent until a worker is idle.
+
+    Workers are forked where the platform supports it; start the server
+    before the parent spawns threads that import modules, load the model or
+    hold locks. On Windows they are spawned: the model loader and detection
+    function are then pickled (so they must be module-level functions or
+    partials of them), and the parent's main module is imported again in
+    every worker, so it must keep its setup under ``if __name__ == '__main__'``.
+    """
+
+    def __init__(self, load_fn, detect_fn, workers: int = 2, chunk_frames: int = 1,
+                 slot_bytes: int = 1280 * 720 * 3, timeout: float = 60.0, on_ready=None,
+                 start_method: str = None):
+        """
+        Start the worker processes.
+
+        Args:
+            load_fn (callable): Loads the model inside a worker; returns a description of it
+            detect_fn (callable): Maps a list of frames to one list of faces per frame (run in the
+                workers); also takes the `pregate` flag of the request
+            workers (int): Number of worker processes
+            chunk_frames (int): Maximum number of frames per worker request
+            slot_bytes (int): Size of one shared frame buffer; larger frames are sent inline
+            timeout (float): Seconds detect_batch waits for a result (None waits indefinitely)
+            on_ready (callable): Called once with (info, error) when the first worker is
+                ready, or with (None, error) when every worker failed to load
+            start_method (str): 'fork' or 'spawn' (None: fork where available, else spawn)
+        """
+        self.workers = workers
+        self.chunk_frames = max(1, chunk_frames)
+        self.slot_bytes = slot_bytes
+        self.timeout = timeout
+        self.on_ready = on_ready
+        if start_method is None:
+            start_method = 'fork' if 'fork' in mp.get_all_start_methods() else 'spawn'
+        self.start_method = start_method
+        ctx = mp.get_context(start_method)
+        self.slots = [shared_memory.SharedMemory(create=True, size=slot_bytes)
+                      for _ in range(workers * self.chunk_frames * 2)]
+        self._free = queue.Queue()
+        for i in range(len(self.slots)):
+            self._free.put(i)
+        self._alloc_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._pending = {}
+        self._backlog = collections.deque()
+        self._busy = {}
+        self._idle = collections.deque()
+        self._ready_workers = set()
+        self._failed_workers = set()
+        self._closed = False
+        self._conns, self.processes = [], []
+        for i in range(workers):
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(target=_serve, args=(i, load_fn, detect_fn, child_conn, self.slots),
+                                  name=f'inference-{i}', daemon=True)
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self.processes.append(process)
+        self._reader = threading.Thread(target=self._read_responses, daemon=True)
+        self._reader.start()
+        FancyText.info(
+            f'Inference server started: {workers} {start_method}ed processes, {len(self.slots)} shared frame buffers'
+        )
+
+    @property
+    def alive(self) -> int:
+        """Number of worker processes that loaded their model and are still running."""
+        return sum(1 for i in self._ready_workers if self.processes[i].is_alive())
+
+    def submit(self, frames: list, pregate: bool = False, deadline: float = None) -> Future:
+        """
+        Queue frames for detection on one worker.
+
+        Waits for free shared frame buffers while every buffer is held by
+        earlier requests, but never past `deadline`.
+
+        Args:
+            frames (list): BGR image frames (at most chunk_frames; None entries are skipped)
+            pregate (bool): Apply the 'faces' pre-gate to these frames (check-ins only)
+            deadline (float): time.monotonic() by which buffers must be free (None waits indefinitely)
+
+        Returns:
+            Future: Resolves to one list of faces per frame
+
+        Raises:
+            TimeoutError: If no frame buffer became free before the deadline
+        """
+        if self._closed:
+            raise RuntimeError('Inference server is closed.')
+        future = Future()
+        specs, used = [], []
+        remaining = lambda: None if deadline is None else max(0.0, deadline - time.monotonic())
+        wait = remaining()
+        if not self._alloc_lock.acquire(timeout=-1 if wait is None else wait):
+            raise TimeoutError('No shared frame buffer became free in time')
+        try:
+            for frame in frames:
+                if frame is None:
+                    specs.append((None, None, None))
+                elif frame.dtype == np.uint8 and frame.nbytes <= self.slot_bytes:
+                    slot = self._free.get(timeout=remaining())
+                    np.ndarray(frame.shape, dtype=np.uint8, buffer=self.slots[slot].buf)[...] = frame
+                    specs.append((slot, frame.shape, None))
+                    used.append(slot)
+                else:
+                    specs.append((None, None, frame))
+        except queue.Empty:
+            for slot in used:
+                self._free.put(slot)
+            raise TimeoutError('No shared frame buffer became free in time') from None
+        finally:
+            self._alloc_lock.release()
+        request_id = next(self._ids)
+        with self._lock:
+            self._pending[request_id] = (future, used, (specs, pregate))
+            self._backlog.append(request_id)
+            self._dispatch()
+        if len(self._failed_workers) == self.workers:
+            self._finish(request_id, error='No inference workers left')
+        return future
+
+    def _dispatch(self) -> None:
+        """Hand waiting requests to idle workers, recording each assignment first (lock held)."""
+        while self._backlog and self._idle:
+            request_id = self._backlog.popleft()
+            if request_id not in self._pending:
+                continue
+            worker_id = self._idle.popleft()
+            self._busy[worker_id] = request_id
+            try:
+                self._conns[worker_id].send(self._pending[request_id][2])
+            except (OSError, ValueError):
+                # The worker is gone; _check_workers fails the request
+                continue
+
+    def detect_batch(self, frames: list, timeout: float = None, pregate: bool = False) -> list:
+        """
+        Detect faces in frames, spread over the workers in chunks.
+
+        Args:
+            frames (list): BGR image frames
+            timeout (float): Seconds to wait for all results (defaults to the server timeout)
+            pregate (bool): Apply the 'faces' pre-gate (check-ins only)
+
+        Returns:
+            list: One list of faces per frame, in input order
+
+        Raises:
+            TimeoutError: If the workers did not answer in time
+            RuntimeError: If a worker failed or died while processing the frames
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        futures = [
+            self.submit(frames[i:i + self.chunk_frames], pregate, deadline)
+            for i in range(0, len(frames), self.chunk_frames)
+        ]
+        results = []
+        for future in futures:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                results.extend(future.result(remaining))
+            except FutureTimeout:
+                raise TimeoutError(f'Inference server did not answer within {timeout:.0f}s') from None
+        return results
+
+    def _finish(self, request_id: int, result: list = None, error: str = None) -> None:
+        """Resolve a request and return its buffers to the pool."""
+        with self._lock:
+            entry = self._pending.pop(request_id, None)
+        if entry is None:
+            return
+        future, used, _ = entry
+        for slot in used:
+            self._free.put(slot)
+        if error is not None:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result(result)
+
+    def _read_responses(self) -> None:
+        """Resolve futures from worker responses and watch for dead workers."""
+        while not self._closed:
+            with self._lock:
+                watched = [(conn, i) for i, conn in enumerate(self._conns) if i not in self._failed_workers]
+            waitables = {conn: i for conn, i in watched}
+            waitables.update({self.processes[i].sentinel: i for _, i in watched})
+            if not waitables:
+                return
+            ready = connection.wait(list(waitables), timeout=1)
+            for handle in ready:
+                if handle not in waitables or isinstance(handle, int):
+                    continue
+                try:
+                    kind, worker_id, value, error = handle.recv()
+                except (EOFError, OSError):
+                    continue
+                if kind == 'ready':
+                    self._worker_ready(worker_id, value, error)
+                elif kind == 'result':
+                    with self._lock:
+                        request_id = self._busy.pop(worker_id, None)
+                        self._idle.append(worker_id)
+                        self._dispatch()
+                    if request_id is not None:
+                        self._finish(request_id, value, error)
+            self._check_workers()
+
+    def _worker_ready(self, worker_id: int, info, error: str) -> None:
+        """Track worker start-up and report the first success (or total failure)."""
+        if error is not None:
+            FancyText.error(f'Inference worker {worker_id} failed to load the model: {error}')
+            self._failed_workers.add(worker_id)
+        else:
+            self._ready_workers.add(worker_id)
+            with self._lock:
+                self._idle.append(worker_id)
+                self._dispatch()
+        if len(self._failed_workers) == self.workers:
+            self._fail_pending()
+        if self.on_ready is None:
+            return
+        if error is None and len(self._ready_workers) == 1:
+            self.on_ready(info, None)
+        elif len(self._failed_workers) == self.workers:
+            self.on_ready(None, error)
+
+    def _check_workers(self) -> None:
+        """Fail the request of any worker that died and report it."""
+        for i, process in enumerate(self.processes):
+            if process.is_alive() or i in self._failed_workers:
+                continue
+            with self._lock:
+                self._failed_workers.add(i)
+                self._ready_workers.discard(i)
+                if i in self._idle:
+                    self._idle.remove(i)
+                request_id = self._busy.pop(i, None)
+            FancyText.error(f'Inference worker {i} exited with code {process.exitcode}.')
+            if request_id is not None:
+                self._finish(request_id, error=f'Inference worker {i} died')
+        if self.processes and len(self._failed_workers) == self.workers:
+            self._fail_pending()
+
+    def _fail_pending(self) -> None:
+        """Fail every waiting request once no worker is left."""
+        with self._lock:
+            pending = list(self._pending)
+            self._backlog.clear()
+        for request_id in pending:
+            self._finish(request_id, error='No inference workers left')
+
+    def close(self) -> None:
+        """Stop the workers and release the shared memory."""
+        if self._closed:
+            return
+        self._closed = True
+        with self._lock:
+            for conn in self._conns:
+                try:
+                    conn.send(None)
+                except (OSError, ValueError):
+                    pass
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._reader.join(timeout=2)
+        for conn in self._conns:
+            conn.close()
+        for shm in self.slots:
+            shm.close()
+            shm.unlink()
+        self._fail_pending()
@@ -0,0 +1,441 @@
+"""Job scheduler running WebSocket commands off the WebSocket thread."""
+
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from src.utils import FancyText
+
+
+class Job():
+    """A unit of work submitted to the JobScheduler."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, job_type: str, key: str, fn, msg_id: str = None, meta: dict = None,
+                 priority: int = 0, group: str = None, delay: float = 0.0):
+        """
+        Args:
+            job_type (str): Job type (e.g. 'trigger_checkin')
+            key (str): Serialization key; jobs sharing a key never run concurrently
+            fn (callable): Function called with the job, returning a result dict
+            msg_id (str): ID of the command that created the job (for acks)
+            meta (dict): Extra details included in status reports (e.g. camera_id)
+            priority (int): Lower values start first when jobs wait for a free slot
+            group (str): Concurrency group whose limit applies to this job (None for no limit)
+            delay (float): Seconds after submission before the job may start
+        """
+        self.id = f'job_{next(Job._ids)}'
+        self.type = job_type
+        self.key = key
+        self.fn = fn
+        self.msg_id = msg_id
+        self.meta = meta or {}
+        self.status = 'accepted'
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.priority = priority
+        self.group = group
+        self.created_at = time.monotonic()
+        self.eligible_at = self.created_at + max(0.0, delay)
+        self.started_at = None
+        self.finished_at = None
+        self.command = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('processed', 'failed', 'cancelled')
+
+    @property
+    def order(self) -> tuple:
+        """Sort key among waiting jobs: priority, then first eligible first."""
+        return (self.priority, self.eligible_at, self.created_at)
+
+    def to_detail(self) -> dict:
+        """
+        Status details for acknowledgments.
+
+        Returns:
+            dict: Job ID, type, status, timings and result or error
+        """
+        detail = {'job_id': self.id, 'type': self.type, 'status': self.status, **self.meta}
+        if self.started_at is not None:
+            detail['queued_s'] = round(self.started_at - self.created_at, 3)
+        if self.finished_at is not None:
+            detail['run_s'] = round(self.finished_at - self.started_at, 3)
+        if self.result is not None:
+            detail.update(self.result)
+        if self.error is not None:
+            detail['error'] = self.error
+        return detail
+
+
+class Command():
+    """
+    The jobs created by one command, acknowledged as one.
+
+    A check-in on every camera creates one job per camera; the command
+    reports 'accepted' once all of them are queued, 'running' when the first
+    starts and a single final status when the last one is done. It has the
+    same msg_id / type / done / to_detail() interface as a Job, so status
+    callbacks handle both.
+    """
+
+    def __init__(self, job_type: str, msg_id: str):
+        """
+        Args:
+            job_type (str): Type of the command's jobs
+            msg_id (str): Command ID
+        """
+        self.type = job_type
+        self.msg_id = msg_id
+        self.jobs = []
+        self.duplicates = []
+        self.status = None
+        self.sealed = False
+        self._reported = set()
+
+    @property
+    def done(self) -> bool:
+        return self.sealed and all(job.done for job in self.jobs)
+
+    def _final_status(self) -> str:
+        """Overall outcome: 'failed' if any job failed, 'cancelled' if all were cancelled."""
+        statuses = {job.status for job in self.jobs}
+        if 'failed' in statuses:
+            return 'failed'
+        if statuses == {'cancelled'}:
+            return 'cancelled'
+        return 'processed'
+
+    def to_detail(self) -> dict:
+        """
+        Status details for acknowledgments.
+
+        Returns:
+            dict: The job's details for a single-job command, otherwise
+                {'type', 'status', 'jobs': [...], 'duplicates': [...]}
+        """
+        if len(self.jobs) == 1 and not self.duplicates:
+            return self.jobs[0].to_detail()
+        return {
+            'type': self.type,
+            'status': self.status,
+            'jobs': [job.to_detail() for job in self.jobs],
+            'duplicates': [job.to_detail() for job in self.duplicates]
+        }
+
+    def update(self) -> list:
+        """
+        Statuses to report after a change of one of the jobs (notifier thread only).
+
+        Returns:
+            list: New command statuses, in order
+        """
+        if not self.sealed:
+            return []
+        statuses = []
+        if not self.jobs:
+            statuses.append('duplicate')
+        else:
+            statuses.append('accepted')
+            if any(job.started_at is not None for job in self.jobs):
+                statuses.append('running')
+            if all(job.done for job in self.jobs):
+                statuses.append(self._final_status())
+        statuses = [status for status in statuses if status not in self._reported]
+        self._reported.update(statuses)
+        if statuses:
+            self.status = statuses[-1]
+        return statuses
+
+
+class JobScheduler():
+    """
+    Worker pool with per-key serialization, deduplication and cancellation.
+
+    Jobs with the same key (e.g. one camera) run one after another; jobs
+    with different keys run in parallel on the pool. Jobs of a group (e.g.
+    all check-ins) run at most `limits[group]` at a time; the rest wait and
+    start in priority order, so a manual check-in overtakes queued automatic
+    ones. A job submitted with a delay waits in its queue until it becomes
+    eligible. Every status change (accepted, running, processed, failed,
+    cancelled) is passed to the `on_status` callback on a dedicated thread,
+    in order. stats() reports queue depth and wait times per group.
+    """
+
+    def __init__(self, max_workers: int = 4, on_status=None, limits: dict = None):
+        """
+        Args:
+            max_workers (int): Number of jobs that may run at the same time
+            on_status (callable): Called with (job, status) on every status change
+            limits (dict): Maximum number of running jobs per group (0 or missing for no limit)
+        """
+        self.on_status = on_status
+        self.limits = dict(limits or {})
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._notifier = ThreadPoolExecutor(max_workers=1, thread_name_prefix='job-status')
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._running = {}
+        self._jobs = {}
+        self._group_running = {}
+        self._waits = {}
+        self._peak_queued = {}
+
+    def _notify(self, job: Job, status: str) -> None:
+        """Report a status change without blocking the caller; jobs of a command report through it."""
+        if self.on_status is None:
+            return
+
+        def report():
+            try:
+                if job.command is None:
+                    self.on_status(job, status)
+                    return
+                for command_status in job.command.update():
+                    self.on_status(job.command, command_status)
+            except Exception as e:
+                FancyText.error(f'Job status report failed for {job.id}: {e}')
+
+        self._notifier.submit(report)
+
+    def command(self, job_type: str, msg_id: str) -> Command:
+        """
+        Start a command whose jobs are acknowledged together.
+
+        Pass it to submit() for each of its jobs, then call seal().
+
+        Args:
+            job_type (str): Type of the command's jobs
+            msg_id (str): Command ID
+
+        Returns:
+            Command: The new command
+        """
+        return Command(job_type, msg_id)
+
+    def seal(self, command: Command) -> None:
+        """
+        Mark a command as complete once all its jobs are submitted.
+
+        Reports 'accepted' (or 'duplicate' when every job was merged into an
+        existing one), plus any progress its jobs made in the meantime.
+
+        Args:
+            command (Command): The command
+        """
+        if self.on_status is None:
+            command.sealed = True
+            return
+
+        def report():
+            command.sealed = True
+            try:
+                for status in command.update():
+                    self.on_status(command, status)
+            except Exception as e:
+                FancyText.error(f'Status report failed for command {command.msg_id}: {e}')
+
+        self._notifier.submit(report)
+
+    def submit(self, job_type: str, key: str, fn, msg_id: str = None, meta: dict = None,
+               dedup: bool = False, priority: int = 0, group: str = None, delay: float = 0.0,
+               command: Command = None) -> tuple[Job, bool]:
+        """
+        Queue a job.
+
+        Args:
+            job_type (str): Job type
+            key (str): Serialization key
+            fn (callable): Function called with the job
+            msg_id (str): Originating command ID
+            meta (dict): Extra details for status reports
+            dedup (bool): Reuse a queued or running job of the same type and key instead;
+                a queued job takes over the better priority and earlier start of the new one
+            priority (int): Lower values start first
+            group (str): Concurrency group
+            delay (float): Seconds before the job may start
+            command (Command): Command the job belongs to (reported together with its other jobs)
+
+        Returns:
+            tuple: (job, is_new); is_new is False when an existing job was reused
+        """
+        with self._lock:
+            if dedup:
+                existing = self._find(job_type, key)
+                if existing is not None:
+                    if existing.started_at is None:
+                        existing.priority = min(existing.priority, priority)
+                        existing.eligible_at = min(existing.eligible_at, time.monotonic() + max(0.0, delay))
+                        self._dispatch()
+                    if command is not None:
+                        command.duplicates.append(existing)
+                    return existing, False
+            job = Job(job_type, key, fn, msg_id, meta, priority, group, delay)
+            if command is not None:
+                job.command = command
+                command.jobs.append(job)
+            self._jobs[job.id] = job
+            self._queues.setdefault(key, deque()).append(job)
+            self._notify(job, 'accepted')
+            self._dispatch()
+        if delay > 0:
+            timer = threading.Timer(delay, self._wake)
+            timer.daemon = True
+            timer.start()
+        return job, True
+
+    def _find(self, job_type: str, key: str) -> Job:
+        """Queued or running job of a type and key (lock held)."""
+        running = self._running.get(key)
+        if running is not None and running.type == job_type and not running.cancel_event.is_set():
+            return running
+        for job in self._queues.get(key, ()):
+            if job.type == job_type and not job.cancel_event.is_set():
+                return job
+        return None
+
+    def set_limit(self, group: str, limit: int) -> None:
+        """
+        Change the concurrency limit of a group and start jobs it now allows.
+
+        Args:
+            group (str): Job group
+            limit (int): Maximum number of running jobs (0 or None for no limit)
+        """
+        with self._lock:
+            if limit:
+                self.limits[group] = limit
+            else:
+                self.limits.pop(group, None)
+            self._dispatch()
+
+    def _wake(self) -> None:
+        """Start jobs whose delay has passed."""
+        with self._lock:
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        """
+        Start eligible jobs on keys with nothing running, best priority first,
+        as far as their group limits allow (lock held).
+        """
+        now = time.monotonic()
+        candidates = []
+        for key, queue in self._queues.items():
+            if key in self._running:
+                continue
+            ready = [job for job in queue if job.eligible_at <= now and not job.cancel_event.is_set()]
+            if ready:
+                candidates.append(min(ready, key=lambda job: job.order))
+        for job in sorted(candidates, key=lambda job: job.order):
+            limit = self.limits.get(job.group)
+            if limit and self._group_running.get(job.group, 0) >= limit:
+                continue
+            self._queues[job.key].remove(job)
+            self._running[job.key] = job
+            self._group_running[job.group] = self._group_running.get(job.group, 0) + 1
+            self._pool.submit(self._run, job)
+        queued = {}
+        for queue in self._queues.values():
+            for job in queue:
+                if job.eligible_at <= now:
+                    queued[job.group] = queued.get(job.group, 0) + 1
+        for group, count in queued.items():
+            self._peak_queued[group] = max(self._peak_queued.get(group, 0), count)
+
+    def _run(self, job: Job) -> None:
+        """Execute a job, report its outcome and start the next waiting jobs."""
+        job.started_at = time.monotonic()
+        with self._lock:
+            self._waits.setdefault(job.group, deque(maxlen=1000)).append(max(0.0, job.started_at - job.eligible_at))
+        job.status = 'running'
+        self._notify(job, 'running')
+        try:
+            job.result = job.fn(job) or {}
+            job.status = 'cancelled' if job.cancel_event.is_set() else 'processed'
+        except Exception as e:
+            FancyText.error(f'Job {job.id} ({job.type}) failed: {e}')
+            job.error = str(e)
+            job.status = 'failed'
+        job.finished_at = time.monotonic()
+        self._notify(job, job.status)
+        with self._lock:
+            self._running.pop(job.key, None)
+            self._group_running[job.group] -= 1
+            self._forget_finished()
+            self._dispatch()
+
+    def _forget_finished(self, keep: int = 200) -> None:
+        """Drop the oldest finished jobs beyond `keep` (lock held)."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - keep)]:
+            del self._jobs[job_id]
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a queued job, or ask a running job to stop at its next checkpoint.
+
+        Args:
+            job_id (str): Job ID
+
+        Returns:
+            bool: True if the job existed and was not finished yet
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.done:
+                return False
+            job.cancel_event.set()
+            queue = self._queues.get(job.key)
+            if queue and job in queue:
+                queue.remove(job)
+                job.status = 'cancelled'
+                job.finished_at = time.monotonic()
+                self._notify(job, 'cancelled')
+        return True
+
+    def stats(self) -> dict:
+        """
+        Queue depth and wait times per concurrency group.
+
+        Wait times run from when a job became eligible (after its delay)
+        until it started, over the last 1000 started jobs of the group.
+
+        Returns:
+            dict: {group: {running, queued, delayed, limit, peak_queued, oldest_wait_s,
+                wait_avg_s, wait_p95_s, wait_max_s}}; jobs without a group are under 'default'
+        """
+        now = time.monotonic()
+        with self._lock:
+            result = {}
+            for group in set(self._group_running) | set(self._waits) | set(self.limits):
+                waiting = [job for queue in self._queues.values() for job in queue if job.group == group]
+                ready = [job for job in waiting if job.eligible_at <= now]
+                waits = np.array(self._waits.get(group, ()), dtype=np.float64)
+                result[group or 'default'] = {
+                    'running': self._group_running.get(group, 0),
+                    'queued': len(ready),
+                    'delayed': len(waiting) - len(ready),
+                    'limit': self.limits.get(group) or None,
+                    'peak_queued': self._peak_queued.get(group, 0),
+                    'oldest_wait_s': round(max((now - job.eligible_at for job in ready), default=0.0), 3),
+                    'wait_avg_s': round(float(waits.mean()), 3) if waits.size else 0.0,
+                    'wait_p95_s': round(float(np.percentile(waits, 95)), 3) if waits.size else 0.0,
+                    'wait_max_s': round(float(waits.max()), 3) if waits.size else 0.0
+                }
+        return result
+
+    def get(self, job_id: str) -> Job:
+        """Look up a job by ID (None if unknown or forgotten)."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Stop accepting work and optionally wait for running jobs."""
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+        self._notifier.shutdown(wait=wait)
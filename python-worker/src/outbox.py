@@ -0,0 +1,269 @@
+"""Durable on-disk outbox for attendance results."""
+
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from src.utils import FancyText
+
+
+class DeliveryRejected(Exception):
+    """The Gateway refused an entry for good; sending it again cannot succeed."""
+
+
+class GatewayUnreachable(Exception):
+    """The Gateway could not be reached; the entry itself is not at fault."""
+
+
+class AttendanceOutbox():
+    """
+    Append-only SQLite queue between check-ins and the Gateway.
+
+    Every attendance result is committed to disk before it is sent, so a
+    Gateway or network outage delays records instead of losing them. A
+    background thread drains the outbox oldest first and deletes an entry
+    only after the Gateway accepted it (at-least-once delivery); each entry
+    carries an ``idempotency_key`` the Gateway uses to ignore repeats. When
+    the stored images exceed `max_image_bytes`, the images of the oldest
+    entries are dropped first; their attendance lists are always kept.
+
+    send_fn signals why a delivery failed: GatewayUnreachable is an outage
+    and only delays the queue, DeliveryRejected moves the entry to the dead
+    letter state at once, and any other failure counts against the entry's
+    `max_attempts`. Dead entries (attempts >= max_attempts) stay on disk for
+    inspection but are skipped, so one bad record cannot block the records
+    behind it. Entries are read from disk `batch_size` at a time; each one is
+    still posted as its own request.
+    """
+
+    def __init__(self, path: str, send_fn, max_image_bytes: int = 200 * 1024 * 1024, batch_size: int = 8,
+                 backoff: float = 2.0, max_backoff: float = 300.0, max_attempts: int = 10):
+        """
+        Open the outbox and start the sender thread.
+
+        Args:
+            path (str): SQLite database file (e.g. 'data/outbox.db')
+            send_fn (callable): Called with (payload, images); returns True once the Gateway accepted it
+                and raises DeliveryRejected or GatewayUnreachable to classify a failure
+            max_image_bytes (int): Total size of stored images before the oldest are evicted
+            batch_size (int): Number of entries read from disk per round
+            backoff (float): Delay in seconds after the first failed send, doubled on every further failure
+            max_backoff (float): Maximum delay in seconds between send attempts
+            max_attempts (int): Failed attempts after which an entry is dead-lettered
+        """
+        self.path = path
+        self.send_fn = send_fn
+        self.max_image_bytes = max_image_bytes
+        self.batch_size = batch_size
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=FULL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'idempotency_key TEXT UNIQUE NOT NULL, '
+            'created_at REAL NOT NULL, '
+            'payload TEXT NOT NULL, '
+            'attempts INTEGER NOT NULL DEFAULT 0, '
+            'last_error TEXT)'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS images ('
+            'entry_id INTEGER NOT NULL, '
+            'idx INTEGER NOT NULL, '
+            'data BLOB NOT NULL, '
+            'PRIMARY KEY (entry_id, idx))'
+        )
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._failures = 0
+        pending, dead = self.pending(), self.dead()
+        if pending:
+            FancyText.info(f'Outbox has {pending} unsent attendance records.')
+        if dead:
+            FancyText.warning(f'Outbox holds {dead} undeliverable attendance records.')
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, payload: dict, images: list) -> str:
+        """
+        Durably queue an attendance result for sending.
+
+        Args:
+            payload (dict): Attendance metadata (without images)
+            images (list): Encoded image bytes
+
+        Returns:
+            str: Idempotency key of the entry
+        """
+        key = uuid.uuid4().hex
+        payload = {**payload, 'idempotency_key': key}
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = self._db.execute(
+                    'INSERT INTO entries (idempotency_key, created_at, payload) VALUES (?, ?, ?)',
+                    (key, time.time(), json.dumps(payload, ensure_ascii=False))
+                )
+                self._db.executemany(
+                    'INSERT INTO images (entry_id, idx, data) VALUES (?, ?, ?)',
+                    [(cursor.lastrowid, idx, sqlite3.Binary(img)) for idx, img in enumerate(images)]
+                )
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+            self._evict()
+        self._wakeup.set()
+        return key
+
+    def _evict(self) -> None:
+        """Drop the images of the oldest entries beyond max_image_bytes (lock held)."""
+        total = self._db.execute('SELECT COALESCE(SUM(LENGTH(data)), 0) FROM images').fetchone()[0]
+        if total <= self.max_image_bytes:
+            return
+        rows = self._db.execute(
+            'SELECT entry_id, SUM(LENGTH(data)) FROM images GROUP BY entry_id ORDER BY entry_id'
+        ).fetchall()
+        evicted = []
+        for entry_id, size in rows:
+            if total <= self.max_image_bytes:
+                break
+            evicted.append(entry_id)
+            total -= size
+        self._db.executemany('DELETE FROM images WHERE entry_id = ?', [(entry_id,) for entry_id in evicted])
+        FancyText.warning(f'Outbox over {self.max_image_bytes / 1e6:.0f} MB, dropped images of {len(evicted)} oldest records.')
+
+    def pending(self) -> int:
+        """Number of entries still to be sent (dead entries excluded)."""
+        with self._lock:
+            return self._db.execute(
+                'SELECT COUNT(*) FROM entries WHERE attempts < ?', (self.max_attempts,)
+            ).fetchone()[0]
+
+    def dead(self) -> int:
+        """Number of dead-lettered entries."""
+        with self._lock:
+            return self._db.execute(
+                'SELECT COUNT(*) FROM entries WHERE attempts >= ?', (self.max_attempts,)
+            ).fetchone()[0]
+
+    def stats(self) -> dict:
+        """
+        Outbox size and delivery state.
+
+        Returns:
+            dict: Pending and dead entries, stored image bytes, age of the oldest pending entry
+                and consecutive failures
+        """
+        with self._lock:
+            count, oldest = self._db.execute(
+                'SELECT COUNT(*), MIN(created_at) FROM entries WHERE attempts < ?', (self.max_attempts,)
+            ).fetchone()
+            dead = self._db.execute(
+                'SELECT COUNT(*) FROM entries WHERE attempts >= ?', (self.max_attempts,)
+            ).fetchone()[0]
+            image_bytes = self._db.execute('SELECT COALESCE(SUM(LENGTH(data)), 0) FROM images').fetchone()[0]
+        return {
+            'pending': count,
+            'dead': dead,
+            'image_bytes': image_bytes,
+            'oldest_age_s': round(time.time() - oldest, 1) if oldest else 0.0,
+            'failures': self._failures
+        }
+
+    def _load_batch(self) -> list:
+        """Oldest live entries with their images, in send order."""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT id, payload FROM entries WHERE attempts < ? ORDER BY id LIMIT ?',
+                (self.max_attempts, self.batch_size)
+            ).fetchall()
+            batch = []
+            for entry_id, payload in rows:
+                images = [bytes(data) for (data,) in self._db.execute(
+                    'SELECT data FROM images WHERE entry_id = ? ORDER BY idx', (entry_id,)
+                )]
+                batch.append((entry_id, json.loads(payload), images))
+        return batch
+
+    def _delete(self, entry_id: int) -> None:
+        """Remove a delivered entry."""
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            self._db.execute('DELETE FROM images WHERE entry_id = ?', (entry_id,))
+            self._db.execute('DELETE FROM entries WHERE id = ?', (entry_id,))
+            self._db.execute('COMMIT')
+
+    def _mark_failed(self, entry_id: int, error: str, dead: bool = False) -> bool:
+        """
+        Record a failed delivery attempt.
+
+        Args:
+            entry_id (int): Entry that failed
+            error (str): Failure description kept in last_error
+            dead (bool): Dead-letter the entry regardless of its attempt count
+
+        Returns:
+            bool: True if the entry is now dead
+        """
+        with self._lock:
+            self._db.execute(
+                'UPDATE entries SET attempts = MAX(attempts + 1, ?), last_error = ? WHERE id = ?',
+                (self.max_attempts if dead else 0, error, entry_id)
+            )
+            attempts = self._db.execute('SELECT attempts FROM entries WHERE id = ?', (entry_id,)).fetchone()[0]
+        return attempts >= self.max_attempts
+
+    def _run(self) -> None:
+        """Sender loop: drain the outbox in order, backing off while the Gateway is unreachable."""
+        while not self._stop.is_set():
+            batch = self._load_batch()
+            if not batch:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            for entry_id, payload, images in batch:
+                if self._stop.is_set():
+                    return
+                rejected = unreachable = False
+                try:
+                    sent, error = bool(self.send_fn(payload, images)), 'not accepted'
+                except DeliveryRejected as e:
+                    sent, error, rejected = False, str(e), True
+                except GatewayUnreachable as e:
+                    sent, error, unreachable = False, str(e), True
+                except Exception as e:
+                    sent, error = False, str(e)
+                if not sent:
+                    # An outage says nothing about the entry, so it does not use up its attempts
+                    if not unreachable and self._mark_failed(entry_id, error, dead=rejected):
+                        FancyText.error(f'Outbox gave up on attendance record {payload.get("idempotency_key")}: {error}')
+                        continue
+                    self._failures += 1
+                    delay = min(self.max_backoff, self.backoff * (2 ** (self._failures - 1)))
+                    delay *= random.uniform(0.5, 1.0)
+                    FancyText.warning(f'Outbox send failed ({self.pending()} pending), retrying in {delay:.0f}s.')
+                    self._stop.wait(delay)
+                    break
+                if self._failures:
+                    FancyText.success('Gateway reachable again, sending queued attendance.')
+                self._failures = 0
+                self._delete(entry_id)
+
+    def close(self) -> None:
+        """Stop the sender thread; unsent entries stay on disk for the next start."""
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        if not self._thread.is_alive():
+            with self._lock:
+                self._db.close()
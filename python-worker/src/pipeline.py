@@ -1,53 +1,58 @@
 import cv2
 import numpy as np
 import base64
+import json
 import time
+import uuid
+import requests
 from datetime import datetime
 from src.utils import FancyText
 from src.config import cfg
 import src.gateway as gateway
+from src.outbox import DeliveryRejected, GatewayUnreachable
+from src.stages import StagedPipeline
+from src.enhance import enhance_frame
+from src.detection import MotionGate
+from src.tracking import FaceTracker
 
+# express.json body limit of the Gateway (api-gateway/server.js)
+JSON_BODY_LIMIT = 10 * 1024 * 1024
 
-def enhance_image(frame: np.ndarray) -> np.ndarray:
+
+def encode_webp(frame: np.ndarray, width: int = 640, quality: int = 40) -> bytes:
     """
-    Enhance image brightness and sharpness before face recognition.
+    Compress image to WebP bytes for network transmission.
     
-    Applies adaptive brightness adjustment and sharpening based on image characteristics.
+    Resizes image and applies WebP compression for efficient transfer.
     
     Args:
-        frame (np.ndarray): Input BGR image frame
+        frame (np.ndarray): Input BGR image
+        width (int): Target width in pixels (default: 640)
+        quality (int): WebP quality (1-100, default: 40)
         
     Returns:
-        np.ndarray: Enhanced image frame, or original if processing fails
+        bytes: WebP image data, empty if encoding fails
     """
     try:
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        brightness = np.mean(gray)
-        enhanced = frame.copy()
-        
-        if brightness < 80:
-            enhanced = cv2.convertScaleAbs(enhanced, alpha=1.2, beta=20)
-        elif brightness > 200:
-            gamma = 0.8
-            table = np.array([(((i / 255.0) ** gamma) * 255) for i in range(256)]).astype('uint8')
-            enhanced = cv2.LUT(enhanced, table)
+        h, w = frame.shape[:2]
+        scale = width / w
+        new_height = int(h * scale)
+        resized = cv2.resize(frame, (width, new_height))
         
-        if cv2.Laplacian(cv2.cvtColor(enhanced, cv2.COLOR_BGR2GRAY), cv2.CV_64F).var() < 100:
-            kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
-            enhanced = cv2.filter2D(enhanced, -1, kernel)
-            
-        return enhanced
+        encode_param = [int(cv2.IMWRITE_WEBP_QUALITY), quality]
+        success, buffer = cv2.imencode('.webp', resized, encode_param)
+        if not success:
+            return b''
+        return buffer.tobytes()
     except Exception as e:
-        FancyText.error(f'Image enhancement error: {e}')
-        return frame
+        FancyText.error(f'Image encoding error: {e}')
+        return b''
 
 
 def encode_base64(frame: np.ndarray, width: int = 640, quality: int = 40) -> str:
     """
     Compress image to WebP base64 format for network transmission.
     
-    Resizes image and applies WebP compression for efficient transfer.
-    
     Args:
         frame (np.ndarray): Input BGR image
         width (int): Target width in pixels (default: 640)
@@ -56,35 +61,81 @@ def encode_base64(frame: np.ndarray, width: int = 640, quality: int = 40) -> str
     Returns:
         str: Base64-encoded WebP image string, empty if encoding fails
     """
-    try:
-        h, w = frame.shape[:2]
-        scale = width / w
-        new_height = int(h * scale)
-        resized = cv2.resize(frame, (width, new_height))
+    return base64.b64encode(encode_webp(frame, width, quality)).decode('utf-8')
+
+
+def _capture_frames(stream, frame_count: int, retry_delay: float, cancel_event=None, min_gap: float = 0.5):
+    """
+    Yield frames for a check-in, retrying once if the camera stalls.
+    
+    Args:
+        stream: StreamCapture instance
+        frame_count (int): Number of frames to capture
+        retry_delay (float): Delay in seconds before the retry
+        cancel_event (threading.Event): Stops capturing when set
+        min_gap (float): Minimum time in seconds between frames
         
-        encode_param = [int(cv2.IMWRITE_WEBP_QUALITY), quality]
-        success, buffer = cv2.imencode('.webp', resized, encode_param)
-        if not success:
-            return ''
-        return base64.b64encode(buffer).decode('utf-8')
-    except Exception as e:
-        FancyText.error(f'Image encoding error: {e}')
-        return ''
+    Yields:
+        np.ndarray: Captured BGR frames, spaced `min_gap` seconds apart
+    """
+    captured = 0
+    for attempt in range(2):
+        for frame in stream.iter_frames(frame_count - captured, min_gap=min_gap):
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            captured += 1
+            yield frame
+        if captured >= frame_count or attempt == 1:
+            return
+        FancyText.warning('Unable to read frame from camera.')
+        time.sleep(retry_delay)
+
+
+def _annotate(frame: np.ndarray, faces: list, names: list, scores: list, threshold: float) -> None:
+    """
+    Draw recognition results onto a frame in place.
+    
+    Args:
+        frame (np.ndarray): BGR frame
+        faces (list): Detected faces with bounding boxes
+        names (list): Recognized name per face
+        scores (list): Recognition score per face
+        threshold (float): Recognition threshold used for the box color
+    """
+    for face, name, score in zip(faces, names, scores):
+        color = (0, 255, 0) if score >= threshold else (0, 0, 255)
+        x1, y1, x2, y2 = face['bbox']
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        cv2.putText(frame, f'{name} {score:.2f}', (x1, y1 - 5),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
 
 
-def capture_and_recognize(face_system, stream, frame_count: int) -> tuple[list[str], set[str]]:
+def capture_and_recognize(face_system, stream, frame_count: int, cancel_event=None) -> tuple[list[str], set[str]]:
     """
     Capture frames from stream and perform face recognition.
     
-    Processes multiple frames, detects faces, and returns recognized names and images.
+    Runs as a staged pipeline (capture -> enhance -> detect -> recognize -> encode)
+    with one thread per stage, so frames are captured and enhanced while
+    earlier ones are in detection or being encoded. Per-stage timing is
+    logged at the end. The enhance stage only runs for the 'frame' and
+    'adaptive' enhance modes; 'faces' enhances the face crops inside detection.
+    
+    Detection and recognition work on micro-batches of checkin_batch_frames
+    frames: one detect_batch call embeds the faces of the whole batch and one
+    recognize_many call matches them. Larger batches mean fewer model calls
+    but less overlap, since a batch is only detected once its last frame has
+    been captured; with the default, a check-in of up to that many frames
+    runs detection and recognition once. A frame whose detection or
+    recognition fails is dropped; the other frames keep their results.
     
     Args:
         face_system: FaceSystem instance for face detection and recognition
         stream: StreamCapture instance for reading frames
         frame_count (int): Number of frames to capture
+        cancel_event (threading.Event): Stops the capture before detection when set
         
     Returns:
-        tuple: (encoded_images list, detected_names set)
+        tuple: (WebP image bytes list, detected_names set)
     """
     frames, detected_names = [], set()
     if not stream:
@@ -92,45 +143,210 @@ def capture_and_recognize(face_system, stream, frame_count: int) -> tuple[list[s
         return frames, detected_names
         
     retry_delay = cfg.get('retry_delay', 3)
+    threshold = cfg.get('face_recognition_threshold', 0.32)
+    enhance_mode = cfg.get('enhance_mode', 'frame')
+    profile = face_system.detection_profile
+    gate = MotionGate(profile['motion_threshold']) if profile['gate'] == 'motion' else None
+    batch = max(1, cfg.get('checkin_batch_frames', 8))
+    last_faces = []
     
-    for idx in range(frame_count):
-        try:
-            frame = stream.read()
-            if frame is None:
-                FancyText.warning('Unable to read frame from camera.')
-                time.sleep(retry_delay)
-                continue
-                
-            frame_processed = enhance_image(frame.copy())
-            faces = face_system.detectFace(frame_processed)
-            
-            for face in faces:
-                try:
-                    name, score = face_system.recognize(face['embedding'])
-                    threshold = cfg.get('face_recognition_threshold', 0.32)
-                    color = (0, 255, 0) if score >= threshold else (0, 0, 255)
-                    x1, y1, x2, y2 = face['bbox']
-                    
-                    cv2.rectangle(frame_processed, (x1, y1), (x2, y2), color, 2)
-                    cv2.putText(frame_processed, f'{name} {score:.2f}', (x1, y1 - 5),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
-                                
-                    if name != 'Unknown' and score >= threshold:
-                        detected_names.add(name)
-                except Exception as e:
-                    FancyText.error(f'Face processing error: {e}')
-                    
-            frames.append(encode_base64(frame_processed))
-            
-            if idx < frame_count - 1:
-                time.sleep(0.5)
-        except Exception as e:
-            FancyText.error(f'Capture loop error: {e}')
-            
+    def detect(batch_frames):
+        # Frames that barely differ from the last detected one reuse its faces
+        changed = [gate is None or gate.changed(frame) for frame in batch_frames]
+        detected = iter(face_system.detect_batch([f for f, c in zip(batch_frames, changed) if c], pregate=True))
+        items = []
+        for frame, is_changed in zip(batch_frames, changed):
+            if is_changed:
+                last_faces.append(next(detected))
+            items.append((frame, last_faces[-1]))
+        return items
+    
+    def recognize(items):
+        faces = [[face for face in frame_faces if 'embedding' in face] for _, frame_faces in items]
+        names, scores, _ = face_system.recognize_many(
+            [face['embedding'] for frame_faces in faces for face in frame_faces], threshold=threshold
+        )
+        frames_out, offset = [], 0
+        for (frame, _), frame_faces in zip(items, faces):
+            frame_names = names[offset:offset + len(frame_faces)]
+            frame_scores = scores[offset:offset + len(frame_faces)]
+            offset += len(frame_faces)
+            for name, score in zip(frame_names, frame_scores):
+                if name != 'Unknown' and score >= threshold:
+                    detected_names.add(name)
+            _annotate(frame, frame_faces, frame_names, frame_scores, threshold)
+            frames_out.append(frame)
+        return frames_out
+    
+    stages = [
+        ('detect', detect, batch),
+        ('recognize', recognize, batch),
+        ('encode', encode_webp),
+    ]
+    if enhance_mode in ('frame', 'adaptive'):
+        stages.insert(0, ('enhance', lambda frame: enhance_frame(frame, enhance_mode)))
+    pipeline = StagedPipeline(stages)
+    try:
+        frames = pipeline.run(_capture_frames(stream, frame_count, retry_delay, cancel_event))
+        FancyText.info(pipeline.report())
+        if gate is not None:
+            FancyText.info(f'Motion gate: {gate.skipped}/{len(frames)} frames reused the previous detection')
+    except Exception as e:
+        FancyText.error(f'Capture loop error: {e}')
+        frames = list(pipeline.results)
+    
+    if cancel_event is not None and cancel_event.is_set():
+        return [], set()
     return frames, detected_names
 
 
-def run_checkin_workflow(face_system, stream, command_meta: dict) -> dict:
+def track_and_recognize(face_system, stream, window: float, fps: float, snapshot_count: int,
+                        cancel_event=None) -> tuple[list[bytes], set[str]]:
+    """
+    Follow faces over a time window and recognize each person once.
+    
+    Frames are sampled at `fps` for `window` seconds and run through a staged
+    pipeline (capture -> enhance -> detect -> track). The tracker links faces
+    across frames by box overlap and embedding similarity, so a student who
+    looks down for a moment still joins their track. After the window, each
+    track's quality-weighted mean embedding is recognized in a single
+    recognize_many call: one query per person instead of one per face per
+    frame. `snapshot_count` evenly spaced frames are annotated with the track
+    names and encoded for the attendance record.
+    
+    Args:
+        face_system: FaceSystem instance for face detection and recognition
+        stream: StreamCapture instance for reading frames
+        window (float): Tracking window in seconds
+        fps (float): Frames per second sampled from the stream
+        snapshot_count (int): Number of annotated frames to return
+        cancel_event (threading.Event): Stops the capture when set
+        
+    Returns:
+        tuple: (WebP image bytes list, detected_names set)
+    """
+    if not stream:
+        FancyText.error('StreamCapture not initialized.')
+        return [], set()
+    
+    threshold = cfg.get('face_recognition_threshold', 0.32)
+    enhance_mode = cfg.get('enhance_mode', 'frame')
+    profile = face_system.detection_profile
+    gate = MotionGate(profile['motion_threshold']) if profile['gate'] == 'motion' else None
+    frame_total = max(1, int(window * fps))
+    snapshot_at = set(np.linspace(0, frame_total - 1, max(1, snapshot_count)).astype(int).tolist())
+    tracker = FaceTracker(
+        iou_threshold=cfg.get('tracking_iou', 0.3),
+        sim_threshold=cfg.get('tracking_similarity', 0.5),
+        max_age=max(1, int(fps * 2))
+    )
+    snapshots = []
+    previous = [[], []]
+    
+    def detect(frame):
+        # Unchanged frames add nothing to the tracks
+        if gate is not None and not gate.changed(frame):
+            return frame, None
+        return frame, face_system.detect_batch([frame], pregate=True)[0]
+    
+    def track(item):
+        frame, faces = item
+        if faces is None:
+            # Advance the tracker without detections; snapshots show the previous boxes
+            tracker.update([])
+            faces, ids = previous
+        else:
+            ids = tracker.update(faces)
+            previous[:] = [faces, ids]
+        if tracker.frame_index in snapshot_at:
+            snapshots.append((frame, faces, ids))
+    
+    stages = [('detect', detect), ('track', track)]
+    if enhance_mode in ('frame', 'adaptive'):
+        stages.insert(0, ('enhance', lambda frame: enhance_frame(frame, enhance_mode)))
+    pipeline = StagedPipeline(stages)
+    try:
+        pipeline.run(_capture_frames(stream, frame_total, cfg.get('retry_delay', 3), cancel_event, min_gap=1.0 / fps))
+        FancyText.info(pipeline.report())
+    except Exception as e:
+        FancyText.error(f'Tracking loop error: {e}')
+    if cancel_event is not None and cancel_event.is_set():
+        return [], set()
+    
+    tracks = tracker.confirmed(cfg.get('tracking_min_hits', 1))
+    names, scores, _ = face_system.recognize_many([t.embedding for t in tracks], threshold=threshold)
+    by_track = {t.id: (name, score) for t, name, score in zip(tracks, names, scores)}
+    detected_names = {name for name, score in by_track.values() if name != 'Unknown' and score >= threshold}
+    FancyText.info(f'Tracking: {tracker.frame_index + 1} frames, {len(tracker.tracks)} tracks, '
+                   f'{len(tracks)} recognized in one batch, {len(detected_names)} students')
+    
+    images = []
+    for frame, faces, ids in snapshots:
+        shown = [(face, by_track[tid]) for face, tid in zip(faces, ids) if tid in by_track]
+        _annotate(frame, [f for f, _ in shown], [n for _, (n, _) in shown], [sc for _, (_, sc) in shown], threshold)
+        images.append(encode_webp(frame))
+    return images, detected_names
+
+
+def _json_body_size(payload: dict, images: list) -> int:
+    """Approximate size of the JSON attendance body with base64 images."""
+    meta = len(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+    return meta + sum(4 * ((len(img) + 2) // 3) + 3 for img in images)
+
+
+def send_attendance(payload: dict, images: list) -> bool:
+    """
+    Send one attendance result to the Gateway.
+    
+    Uses raw WebP bytes unless the JSON transport is configured. The JSON
+    upload is only tried as a fallback when the Gateway refuses the binary
+    endpoint (e.g. an older Gateway without it); a transient binary failure
+    is reported as is so the caller retries the whole delivery later
+    instead of multiplying attempts.
+    
+    Args:
+        payload (dict): Attendance metadata (without images)
+        images (list): Encoded WebP image bytes
+        
+    Returns:
+        bool: True if the Gateway accepted the result
+        
+    Raises:
+        DeliveryRejected: The Gateway refused the result, or it is too large for the JSON body limit
+        GatewayUnreachable: The Gateway could not be reached
+        requests.RequestException: Any other (transient) failure
+    """
+    try:
+        if cfg.get('attendance_transport', 'binary') == 'binary':
+            try:
+                result = gateway.post_attendance_binary(payload, images)
+            except requests.HTTPError as e:
+                if not gateway.is_rejection(e) or e.response.status_code == 413:
+                    raise
+                FancyText.warning(f'Binary attendance upload refused ({e}), falling back to JSON.')
+            else:
+                return _accepted(result)
+        if _json_body_size(payload, images) > JSON_BODY_LIMIT:
+            raise DeliveryRejected(f'Attendance result too large for a JSON upload ({len(images)} images).')
+        result = gateway.post_attendance({**payload, 'images': [base64.b64encode(img).decode('utf-8') for img in images]})
+        return _accepted(result)
+    except requests.ConnectionError as e:
+        raise GatewayUnreachable(str(e)) from e
+    except requests.HTTPError as e:
+        if gateway.is_rejection(e):
+            raise DeliveryRejected(str(e)) from e
+        raise
+
+
+def _accepted(result: dict) -> bool:
+    """Check the Gateway's answer; an explicit success: false is final."""
+    if not result.get('success', True):
+        raise DeliveryRejected(f'Gateway refused the attendance result: {result.get("message", result)}')
+    return True
+
+
+def run_checkin_workflow(face_system, stream, command_meta: dict, cancel_event=None, outbox=None,
+                         roster: list = None) -> dict:
     """
     Execute complete check-in workflow: capture, recognize, send, upload images.
     
@@ -140,35 +356,63 @@ def run_checkin_workflow(face_system, stream, command_meta: dict) -> dict:
     Args:
         face_system: FaceSystem instance
         stream: StreamCapture instance
-        command_meta (dict): Command metadata with frame_count and source
+        command_meta (dict): Command metadata with frame_count and source; optional
+            mode ('snapshot' or 'tracking') and window override the config
+        cancel_event (threading.Event): Aborts the check-in (nothing is posted) when set
+        outbox (AttendanceOutbox): Durable queue the result is written to; sent directly if None
+        roster (list): Students expected in front of this camera; None for everyone in the gallery.
+            Recognized people outside the roster are logged but not reported present.
         
     Returns:
         dict: Result dictionary with number of detected students
     """
     try:
         frame_count = command_meta.get('frame_count', cfg.get('frame_count', 2))
-        imgs, names = capture_and_recognize(face_system, stream, frame_count)
+        if command_meta.get('mode', cfg.get('attendance_mode', 'snapshot')) == 'tracking':
+            imgs, names = track_and_recognize(
+                face_system, stream,
+                window=command_meta.get('window', cfg.get('tracking_window', 20)),
+                fps=cfg.get('tracking_fps', 2),
+                snapshot_count=frame_count,
+                cancel_event=cancel_event
+            )
+        else:
+            imgs, names = capture_and_recognize(face_system, stream, frame_count, cancel_event)
+        if cancel_event is not None and cancel_event.is_set():
+            FancyText.warning('Check-in cancelled.')
+            return {'detected': 0, 'cancelled': True}
         
-        # Get list of all students and determine attendance status
-        all_students = sorted(list(face_system.known_faces.keys()))
-        present_names = sorted(list(names))
+        # Get list of expected students and determine attendance status
+        all_students = sorted(set(roster) if roster is not None else face_system.known_faces.keys())
+        present_names = sorted(name for name in names if name in all_students)
         absent_names = [s for s in all_students if s not in present_names]
+        others = sorted(set(names) - set(present_names))
+        if others:
+            FancyText.info(f"Recognized outside the roster of camera {command_meta.get('camera_id')}: {', '.join(others)}")
         
         payload = {
             'source': command_meta.get('source', 'manual'),
+            'camera_id': command_meta.get('camera_id'),
             'total': len(all_students),
             'present_names': present_names,
             'absent_names': absent_names,
-            'images': imgs,  # Send all captured images as array
             'last_update': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
         
-        # Send attendance data with all images to gateway
-        result = gateway.post_attendance(payload)
+        # Commit to the outbox first so a Gateway outage cannot lose the check-in
+        if outbox is not None:
+            outbox.put(payload, imgs)
+        else:
+            try:
+                # The key lets the Gateway drop a repeat after a retried request
+                send_attendance({**payload, 'idempotency_key': uuid.uuid4().hex}, imgs)
+            except Exception as e:
+                FancyText.error(f'Attendance upload failed, check-in result not delivered: {e}')
                 
         FancyText.success(f"Check-in complete. Present: {len(present_names)}/{len(all_students)}")
         return {'detected': len(present_names)}
         
     except Exception as e:
         FancyText.error(f'Check-in workflow error: {e}')
-        return {'detected': 0}
\ No newline at end of file
+        return {'detected': 0}
+
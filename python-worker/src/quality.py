@@ -0,0 +1,144 @@
+"""Face quality scoring from detection score, landmark pose and blur."""
+
+import cv2
+import numpy as np
+
+DEFAULT_QUALITY_PROFILE = {
+    'min_quality': 0.01,
+    'min_face_size': 20,
+    'blur_reference': 100.0,
+    'max_yaw': 0.5
+}
+
+
+def quality_profile(profile: dict = None) -> dict:
+    """
+    Merge a quality profile with the defaults.
+
+    Profile keys:
+        min_quality: Faces scoring below this are not embedded. The default only drops faces
+            scoring (almost) 0, such as profiles, and keeps the small back-row faces; above
+            it the score weights faces, e.g. in tracking and when picking the best face
+        min_face_size: Faces with a shorter side (pixels) are never embedded, whatever min_quality
+        blur_reference: Laplacian variance of the aligned crop from which the blur score is 1
+        max_yaw: Nose offset from the eye midpoint, relative to the eye distance, at which the pose score reaches 0
+
+    Args:
+        profile (dict): Partial profile (e.g. from config)
+
+    Returns:
+        dict: Complete profile
+    """
+    return {**DEFAULT_QUALITY_PROFILE, **(profile or {})}
+
+
+def pose_score(kps: np.ndarray, max_yaw: float = 0.5) -> float:
+    """
+    Frontalness of a face from its five landmarks.
+
+    Measured in the eye-aligned frame, so in-plane rotation does not count:
+    yaw is the sideways offset of the nose from the eye midpoint, pitch the
+    nose height between the eye line and the mouth line.
+
+    Args:
+        kps (np.ndarray): (5, 2) landmarks: left eye, right eye, nose, left and right mouth corner
+        max_yaw (float): Relative nose offset at which the score reaches 0
+
+    Returns:
+        float: 1 for a frontal face, down to 0 for a profile or strongly tilted face
+    """
+    kps = np.asarray(kps, dtype=np.float32)
+    eye_mid = (kps[0] + kps[1]) / 2
+    eye_axis = kps[1] - kps[0]
+    eye_dist = float(np.linalg.norm(eye_axis))
+    if eye_dist < 1e-6:
+        return 0.0
+    u = eye_axis / eye_dist
+    v = np.array([-u[1], u[0]], dtype=np.float32)
+    nose = kps[2] - eye_mid
+    mouth = (kps[3] + kps[4]) / 2 - eye_mid
+    yaw = abs(float(nose @ u)) / eye_dist
+    mouth_depth = float(mouth @ v)
+    if mouth_depth <= 1e-6:
+        return 0.0
+    pitch = abs(float(nose @ v) / mouth_depth - 0.5)
+    return float(np.clip(1 - yaw / max_yaw, 0, 1) * np.clip(1 - pitch / 0.4, 0, 1))
+
+
+def blur_score(crop: np.ndarray, reference: float = 100.0) -> float:
+    """
+    Sharpness of an aligned face crop.
+
+    Args:
+        crop (np.ndarray): Aligned BGR face crop
+        reference (float): Laplacian variance from which the score is 1
+
+    Returns:
+        float: Score between 0 (flat) and 1 (sharp)
+    """
+    _, std = cv2.meanStdDev(cv2.Laplacian(cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY), cv2.CV_32F))
+    return float(min(1.0, float(std[0, 0]) ** 2 / reference))
+
+
+def undersized(face: dict, profile: dict) -> bool:
+    """
+    True if a face is smaller than the profile's min_face_size.
+
+    Checked before the face is aligned, so undersized faces cost neither the
+    crop nor the recognition model.
+
+    Args:
+        face (dict): Detected face with bbox
+        profile (dict): Quality profile
+
+    Returns:
+        bool: True if the shorter side of the box is below min_face_size
+    """
+    x0, y0, x1, y1 = face['bbox']
+    return min(x1 - x0, y1 - y0) < profile['min_face_size']
+
+
+def score_face(face: dict, crop: np.ndarray, profile: dict) -> float:
+    """
+    Overall quality of a detected face, stored in face['quality'].
+
+    The product of the detection score and the pose and blur scores, so a
+    face that is bad on any one of them scores low. Face size has no factor
+    of its own: a small face is upscaled to the crop size, which already
+    lowers its blur score, and counting it twice would push the distant
+    back-row faces far below the frontal ones.
+
+    Args:
+        face (dict): Detected face with bbox, det_score and kps
+        crop (np.ndarray): Aligned BGR face crop
+        profile (dict): Quality profile
+
+    Returns:
+        float: Quality between 0 and 1
+    """
+    if undersized(face, profile):
+        face['quality'] = 0.0
+        return 0.0
+    quality = (
+        face.get('det_score', 1.0)
+        * pose_score(face['kps'], profile['max_yaw'])
+        * blur_score(crop, profile['blur_reference'])
+    )
+    face['quality'] = float(quality)
+    return face['quality']
+
+
+def best_face(faces: list) -> dict:
+    """
+    Highest-quality face that has an embedding.
+
+    Args:
+        faces (list): Detected faces
+
+    Returns:
+        dict: The best face, or None if no face has an embedding
+    """
+    embedded = [face for face in faces if 'embedding' in face]
+    if not embedded:
+        return None
+    return max(embedded, key=lambda face: face.get('quality', face.get('det_score', 0.0)))
@@ -0,0 +1,240 @@
+"""ONNX Runtime inference profile: model pack, INT8 quantization and session tuning."""
+
+import os
+import shutil
+from src.utils import FancyText
+
+DEVICES = ('auto', 'cpu', 'cuda')
+QUANTIZE_MODES = ('off', 'dynamic')
+GRAPH_OPTIMIZATION_LEVELS = ('disable', 'basic', 'extended', 'all')
+
+DEFAULT_INFERENCE_PROFILE = {
+    'model_pack': 'buffalo_l',
+    'quantize': 'off',
+    'intra_op_threads': 0,
+    'inter_op_threads': 0,
+    'graph_optimization': 'all',
+    'execution_mode': 'sequential'
+}
+
+MODEL_ROOT = '~/.insightface'
+DEVICE_ENV = 'FACE_DEVICE'
+
+
+def select_device(preference: str = 'auto') -> tuple[int, list]:
+    """
+    Choose the inference device from ONNX Runtime's execution providers.
+
+    The FACE_DEVICE environment variable overrides `preference`. 'auto' uses
+    CUDA when the installed onnxruntime build provides it, otherwise the CPU.
+
+    Args:
+        preference (str): 'auto', 'cpu' or 'cuda'
+
+    Returns:
+        tuple: (InsightFace ctx_id, ONNX Runtime provider list)
+    """
+    import onnxruntime as ort
+
+    preference = (os.getenv(DEVICE_ENV) or preference or 'auto').strip().lower()
+    if preference not in DEVICES:
+        FancyText.warning(f'Unknown device "{preference}", using "auto".')
+        preference = 'auto'
+    if preference != 'cpu' and 'CUDAExecutionProvider' in ort.get_available_providers():
+        return 0, ['CUDAExecutionProvider', 'CPUExecutionProvider']
+    if preference == 'cuda':
+        FancyText.warning('CUDA requested but onnxruntime has no CUDAExecutionProvider, using the CPU.')
+    return -1, ['CPUExecutionProvider']
+
+
+def inference_profile(profile: dict = None) -> dict:
+    """
+    Merge an inference profile with the defaults.
+
+    Profile keys:
+        model_pack: InsightFace model pack (buffalo_l, buffalo_m, buffalo_s, buffalo_sc, ...)
+        quantize: 'off', or 'dynamic' to run INT8-quantized detection and recognition models
+            (see quantize_model_pack: usually slower than FP32 for these CNNs; benchmark first)
+        intra_op_threads: Threads used inside one operator (0 lets ONNX Runtime decide)
+        inter_op_threads: Threads used across operators in 'parallel' execution mode (0 = default)
+        graph_optimization: 'disable', 'basic', 'extended' or 'all'
+        execution_mode: 'sequential' or 'parallel'
+
+    Args:
+        profile (dict): Partial profile (e.g. from config)
+
+    Returns:
+        dict: Complete profile
+    """
+    merged = {**DEFAULT_INFERENCE_PROFILE, **(profile or {})}
+    if merged['quantize'] not in QUANTIZE_MODES:
+        FancyText.warning(f"Unknown quantize mode \"{merged['quantize']}\", using \"off\".")
+        merged['quantize'] = 'off'
+    if merged['graph_optimization'] not in GRAPH_OPTIMIZATION_LEVELS:
+        merged['graph_optimization'] = 'all'
+    return merged
+
+
+def session_options(profile: dict):
+    """
+    ONNX Runtime session options for a profile.
+
+    Args:
+        profile (dict): Inference profile
+
+    Returns:
+        onnxruntime.SessionOptions: Configured options
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = int(profile['intra_op_threads'])
+    options.inter_op_num_threads = int(profile['inter_op_threads'])
+    options.graph_optimization_level = {
+        'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    }[profile['graph_optimization']]
+    options.execution_mode = (
+        ort.ExecutionMode.ORT_PARALLEL if profile['execution_mode'] == 'parallel' else ort.ExecutionMode.ORT_SEQUENTIAL
+    )
+    return options
+
+
+def has_custom_session(profile: dict) -> bool:
+    """True when the profile changes any ONNX Runtime session default."""
+    keys = ('intra_op_threads', 'inter_op_threads', 'graph_optimization', 'execution_mode')
+    return any(profile[key] != DEFAULT_INFERENCE_PROFILE[key] for key in keys)
+
+
+def apply_session_options(face_analysis, profile: dict) -> None:
+    """
+    Recreate the sessions of loaded InsightFace models with the profile's options.
+
+    FaceAnalysis does not pass session options through to ONNX Runtime, so
+    each model's session is rebuilt from its model file with the same
+    execution providers.
+
+    Args:
+        face_analysis: Prepared insightface FaceAnalysis instance
+        profile (dict): Inference profile
+    """
+    if not has_custom_session(profile):
+        return
+    import onnxruntime as ort
+
+    options = session_options(profile)
+    for model in face_analysis.models.values():
+        providers = model.session.get_providers()
+        model.session = ort.InferenceSession(model.model_file, sess_options=options, providers=providers)
+    FancyText.info(
+        f"ONNX Runtime sessions: {profile['intra_op_threads']} intra-op / {profile['inter_op_threads']} inter-op threads, "
+        f"graph optimization {profile['graph_optimization']}, {profile['execution_mode']} execution"
+    )
+
+
+def _model_task(path: str) -> str:
+    """
+    Task of an InsightFace ONNX file, decided from its graph like insightface's model router.
+
+    Args:
+        path (str): ONNX model file
+
+    Returns:
+        str: 'detection', 'recognition' or 'other'
+    """
+    import onnx
+
+    graph = onnx.load(path, load_external_data=False).graph
+    if len(graph.output) >= 5:
+        return 'detection'
+    dims = [d.dim_value for d in graph.input[0].type.tensor_type.shape.dim]
+    if len(dims) == 4 and dims[2] == dims[3] and dims[2] >= 112 and dims[2] % 16 == 0 and len(graph.output) == 1:
+        return 'recognition'
+    return 'other'
+
+
+def quantize_model_pack(pack: str, root: str = MODEL_ROOT) -> str:
+    """
+    Create an INT8 copy of a model pack next to the original.
+
+    The detection and recognition models are quantized with ONNX Runtime's
+    dynamic quantization (INT8 weights, activations quantized at run time);
+    the other models of the pack are copied unchanged. Done once: an
+    existing quantized pack is reused. Each process stages the pack in its
+    own directory and publishes it with one rename, so processes that
+    quantize at the same time cannot clobber each other; the first rename
+    wins and the others discard their copy.
+
+    Dynamic quantization is aimed at MatMul-heavy models. The InsightFace
+    models are convolutional, and their Conv nodes become ConvInteger,
+    which ONNX Runtime's CPU kernels run slower than FP32 Conv on most
+    hardware, and which the CUDA execution provider does not support at
+    all. The pack is smaller on disk, but detection and recognition are
+    usually slower; run `python benchmark.py accuracy --images <dir> --quantize`
+    on the target machine before enabling it.
+
+    Args:
+        pack (str): Model pack name (must already be downloaded)
+        root (str): InsightFace model root
+
+    Returns:
+        str: Name of the quantized pack (e.g. 'buffalo_l_int8')
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    models_dir = os.path.join(os.path.expanduser(root), 'models')
+    source = os.path.join(models_dir, pack)
+    name = f'{pack}_int8'
+    target = os.path.join(models_dir, name)
+    if os.path.isdir(target):
+        return name
+    if not os.path.isdir(source):
+        raise FileNotFoundError(f'Model pack {pack} not found in {models_dir}; load it once without quantization first.')
+    staging = f'{target}.tmp{os.getpid()}'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for file in sorted(os.listdir(source)):
+        src_path, dst_path = os.path.join(source, file), os.path.join(staging, file)
+        if file.endswith('.onnx') and _model_task(src_path) in ('detection', 'recognition'):
+            FancyText.info(f'Quantizing {pack}/{file} to INT8...')
+            quantize_dynamic(src_path, dst_path, weight_type=QuantType.QInt8, per_channel=True)
+        else:
+            shutil.copy2(src_path, dst_path)
+    try:
+        os.replace(staging, target)
+    except OSError:
+        if not os.path.isdir(target):
+            raise
+        # Another process published the pack first
+        shutil.rmtree(staging, ignore_errors=True)
+        return name
+    FancyText.success(f'Quantized model pack written to {target}')
+    return name
+
+
+def resolve_model_pack(profile: dict, root: str = MODEL_ROOT, cuda: bool = False) -> str:
+    """
+    Model pack name to load for a profile, quantizing it first if needed.
+
+    Args:
+        profile (dict): Inference profile
+        root (str): InsightFace model root
+        cuda (bool): The models run on the CUDA execution provider, which has no
+            ConvInteger kernel; the FP32 pack is used instead of a quantized one
+
+    Returns:
+        str: Model pack name for FaceAnalysis
+    """
+    pack = profile['model_pack']
+    if profile['quantize'] == 'off':
+        return pack
+    if cuda:
+        FancyText.warning('Dynamic INT8 models cannot run on CUDA (no ConvInteger kernel), using the FP32 pack.')
+        return pack
+    if not os.path.isdir(os.path.join(os.path.expanduser(root), 'models', pack)):
+        # Let insightface download the FP32 pack once, then quantize it
+        from insightface.app import FaceAnalysis
+        FaceAnalysis(name=pack, root=root, allowed_modules=['detection'])
+    return quantize_model_pack(pack, root)
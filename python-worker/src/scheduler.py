@@ -1,38 +1,313 @@
-import time
-from datetime import datetime
+"""Event-driven auto check-in scheduler with calendar rules and catch-up policies."""
+
+import heapq
+import json
+import os
+import threading
+from datetime import date, datetime, timedelta
 from src.utils import FancyText
 from src.config import cfg
-from src.pipeline import run_checkin_workflow
 
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+DAY_GROUPS = {'daily': WEEKDAYS, 'weekdays': WEEKDAYS[:5], 'weekends': WEEKDAYS[5:]}
+CATCH_UP_POLICIES = ('skip', 'latest')
+SCHEDULE_KEYS = (
+    'image_capture_interval', 'capture_schedule', 'cameras', 'schedule_days', 'schedule_holidays',
+    'schedule_catch_up', 'schedule_grace', 'schedule_catch_up_window'
+)
+# Condition waits run on the monotonic clock, which stops while the machine is
+# suspended; re-reading the wall clock this often bounds how late a run can be
+MAX_SLEEP = 600
+
+
+def parse_days(days) -> frozenset:
+    """
+    Weekday numbers (Monday = 0) from day names and groups.
+
+    Args:
+        days: List of 'mon'..'sun', 'daily', 'weekdays' or 'weekends' (a single string is allowed)
+
+    Returns:
+        frozenset: Weekday numbers; all seven days when `days` is empty
+    """
+    if not days:
+        return frozenset(range(7))
+    if isinstance(days, str):
+        days = [days]
+    result = set()
+    for day in days:
+        day = str(day).strip().lower()
+        for name in DAY_GROUPS.get(day, (day[:3],)):
+            if name not in WEEKDAYS:
+                raise ValueError(f'Unknown day "{name}"')
+            result.add(WEEKDAYS.index(name))
+    return frozenset(result)
+
+
+def _parse_dates(dates) -> frozenset:
+    """Dates from 'YYYY-MM-DD' strings."""
+    return frozenset(date.fromisoformat(str(d).strip()) for d in (dates or []))
 
-def run_auto_capture(face_system, stream):
+
+class Rule():
+    """One recurring check-in time with its calendar and cameras."""
+
+    def __init__(self, at: str, days=None, dates=None, except_dates=None, cameras=None, catch_up: str = None):
+        """
+        Args:
+            at (str): Time of day as 'HH:MM'
+            days: Weekdays the rule applies to (see parse_days)
+            dates (list): If set, the only dates ('YYYY-MM-DD') the rule applies to
+            except_dates (list): Dates the rule is skipped (holidays)
+            cameras (list): Camera IDs to check in (None for every camera)
+            catch_up (str): 'skip' or 'latest' (None for the schedule_catch_up setting)
+        """
+        self.at = datetime.strptime(str(at).strip(), '%H:%M').time()
+        self.days = parse_days(days)
+        self.dates = _parse_dates(dates) or None
+        self.except_dates = _parse_dates(except_dates)
+        self.cameras = [str(c) for c in cameras] if cameras else None
+        if catch_up is not None and catch_up not in CATCH_UP_POLICIES:
+            raise ValueError(f'Unknown catch-up policy "{catch_up}"')
+        self.catch_up = catch_up
+
+    def __repr__(self):
+        cameras = ','.join(self.cameras) if self.cameras else 'all cameras'
+        return f'{self.at:%H:%M} ({cameras})'
+
+    def matches(self, day: date) -> bool:
+        """True if the rule runs on `day`."""
+        if day in self.except_dates:
+            return False
+        if self.dates is not None:
+            return day in self.dates
+        return day.weekday() in self.days
+
+    def next_after(self, moment: datetime, horizon_days: int = 366):
+        """
+        First run of the rule strictly after `moment`.
+
+        Args:
+            moment (datetime): Reference time
+            horizon_days (int): How far ahead to look
+
+        Returns:
+            datetime: Next run, or None if the rule never runs again within the horizon
+        """
+        for offset in range(horizon_days + 1):
+            day = moment.date() + timedelta(days=offset)
+            if self.matches(day):
+                run = datetime.combine(day, self.at)
+                if run > moment:
+                    return run
+        return None
+
+
+def build_rules(config=cfg) -> list:
     """
-    Automated check-in scheduler.
-    
-    Continuously monitors time and triggers automatic check-in workflow
-    at configured intervals.
-    
+    Schedule rules from the configuration.
+
+    - image_capture_interval: 'HH:MM' times for every camera on schedule_days
+    - capture_schedule: rule dicts with 'time' (or 'times'), and optionally
+      'days', 'dates', 'except_dates', 'cameras' and 'catch_up'
+    - cameras[].schedule: rule dicts (or 'HH:MM' strings) for that camera only
+
+    schedule_holidays are skipped by every rule. Invalid entries are logged
+    and ignored.
+
     Args:
-        face_system: FaceSystem instance for face recognition
-        stream: StreamCapture instance for video capture
-        
+        config: Configuration (defaults to the global cfg)
+
     Returns:
-        None (infinite loop until interrupted)
+        list: Rule objects
+    """
+    holidays = list(config.get('schedule_holidays', []) or [])
+    entries = [{'time': t, 'days': config.get('schedule_days')} for t in config.get('image_capture_interval', []) or []]
+    entries += list(config.get('capture_schedule', []) or [])
+    for camera in config.get('cameras', []) or []:
+        for entry in camera.get('schedule', []) or []:
+            entry = {'time': entry} if isinstance(entry, str) else entry
+            entries.append({**entry, 'cameras': [camera.get('id')]})
+    rules = []
+    for entry in entries:
+        try:
+            if isinstance(entry, str):
+                entry = {'time': entry}
+            times = entry.get('times') or [entry.get('time')]
+            for at in times:
+                rules.append(Rule(
+                    at, days=entry.get('days'), dates=entry.get('dates'),
+                    except_dates=list(entry.get('except_dates', []) or []) + holidays,
+                    cameras=entry.get('cameras'), catch_up=entry.get('catch_up')
+                ))
+        except (TypeError, ValueError, AttributeError) as e:
+            FancyText.warning(f'Ignoring invalid schedule entry {entry!r}: {e}')
+    return rules
+
+
+class CaptureScheduler():
     """
-    last_triggered_minute = -1
-    
-    while True:
+    Timer scheduler for automatic check-ins.
+
+    The next run of every rule sits in a heap; the scheduler thread sleeps on
+    a condition variable until the earliest one is due, so it stays idle
+    between sessions. A configuration update of any schedule key wakes it to
+    rebuild the heap. Runs are absolute times, so a slow check-in cannot make
+    a slot fire twice or be missed.
+
+    A run that is more than schedule_grace seconds late (worker down, machine
+    suspended) is missed. With the 'skip' catch-up policy it is dropped; with
+    'latest' the most recent missed run of a rule is fired once if it is at
+    most schedule_catch_up_window seconds old. The time of the last handled
+    run is kept in a small state file so runs missed while the worker was
+    down are caught up after a restart. A reload rebuilds the heap from the
+    previous wake-up, so a run that came due while the reload was pending
+    still goes through these rules instead of being dropped.
+    """
+
+    def __init__(self, submit_checkin, state_path: str = 'data/schedule_state.json'):
+        """
+        Args:
+            submit_checkin (callable): Queues a check-in, called with the command payload
+            state_path (str): File that records the last handled run
+        """
+        self.submit_checkin = submit_checkin
+        self.state_path = state_path
+        self.checkpoint = self._load_checkpoint()
+        self.rules = []
+        self._heap = []
+        self._cond = threading.Condition()
+        self._dirty = True
+        self._stopped = False
+        cfg.subscribe(self._on_config_update)
+
+    def _load_checkpoint(self):
+        """Time of the last handled run from the state file, or None."""
         try:
-            now = datetime.now()
-            current_time_str = now.strftime('%H:%M')
-            current_minute = now.minute
-            capture_intervals = cfg.get('image_capture_interval', [])
-            
-            if current_time_str in capture_intervals and current_minute != last_triggered_minute:
-                FancyText.info(f'⏰ Auto Capture triggered at {current_time_str}')
-                meta = {'source': 'auto', 'frame_count': cfg.get('frame_count', 2)}
-                run_checkin_workflow(face_system, stream, meta)
-                last_triggered_minute = current_minute
-        except Exception as e:
-            FancyText.error(f'Auto Capture Scheduler Error: {e}')
-        time.sleep(1)
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return datetime.fromisoformat(json.load(f)['checked_until'])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            FancyText.warning(f'Ignoring unreadable schedule state {self.state_path}: {e}')
+            return None
+
+    def _save_checkpoint(self) -> None:
+        """Write the time of the last handled run, replacing the state file atomically."""
+        try:
+            tmp_path = self.state_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'checked_until': self.checkpoint.isoformat()}, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            FancyText.error(f'Failed to save schedule state: {e}')
+
+    def _on_config_update(self, keys: list) -> None:
+        """Rebuild the schedule when a schedule setting changed."""
+        if any(key in SCHEDULE_KEYS for key in keys):
+            self.reload()
+
+    def reload(self) -> None:
+        """Re-read the schedule from the configuration and wake the scheduler."""
+        with self._cond:
+            self._dirty = True
+            self._cond.notify()
+
+    def stop(self) -> None:
+        """Stop the scheduler thread."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _rebuild(self, now: datetime, start: datetime) -> None:
+        """
+        Rebuild the heap with every rule's first run after `start`.
+
+        Args:
+            now (datetime): Current time
+            start (datetime): Runs after this time are scheduled (earlier than now to catch up)
+        """
+        self.rules = build_rules()
+        self._heap = []
+        for i, rule in enumerate(self.rules):
+            run = rule.next_after(start)
+            if run is not None:
+                self._heap.append((run, i))
+        heapq.heapify(self._heap)
+        self._dirty = False
+        if self._heap:
+            FancyText.info(f'Auto capture: {len(self.rules)} rules, next run at {self._heap[0][0]:%Y-%m-%d %H:%M}')
+        else:
+            FancyText.info('Auto capture: no scheduled runs')
+
+    def _pop_due(self, now: datetime) -> list:
+        """
+        Take every rule whose run is due and schedule its next run.
+
+        Returns:
+            list: (rule, latest due run, number of earlier due runs superseded by it)
+        """
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            run, i = heapq.heappop(self._heap)
+            rule, superseded = self.rules[i], 0
+            following = rule.next_after(run)
+            while following is not None and following <= now:
+                run, superseded = following, superseded + 1
+                following = rule.next_after(run)
+            if following is not None:
+                heapq.heappush(self._heap, (following, i))
+            due.append((rule, run, superseded))
+            self.checkpoint = max(self.checkpoint or run, run)
+        return due
+
+    def _fire(self, rule: Rule, run: datetime, superseded: int, now: datetime) -> None:
+        """Trigger a due run, or catch it up or drop it when it was missed."""
+        if superseded:
+            FancyText.warning(f'Auto capture {rule}: {superseded} earlier missed runs dropped')
+        late = (now - run).total_seconds()
+        policy = rule.catch_up or cfg.get('schedule_catch_up', 'skip')
+        if late > cfg.get('schedule_grace', 60):
+            if policy != 'latest' or late > cfg.get('schedule_catch_up_window', 1800):
+                FancyText.warning(f'Auto capture {rule} missed the run at {run:%Y-%m-%d %H:%M}')
+                return
+            FancyText.warning(f'Auto capture {rule}: catching up the run at {run:%Y-%m-%d %H:%M}')
+        FancyText.info(f'⏰ Auto Capture triggered: {rule}')
+        for camera_id in rule.cameras or [None]:
+            meta = {'source': 'auto', 'frame_count': cfg.get('frame_count', 2), 'scheduled_for': run.isoformat()}
+            if camera_id is not None:
+                meta['camera_id'] = camera_id
+            try:
+                self.submit_checkin(meta)
+            except Exception as e:
+                FancyText.error(f'Auto Capture Scheduler Error: {e}')
+
+    def run(self) -> None:
+        """Scheduler loop: sleep until the next run or a configuration change (runs until stop())."""
+        first = True
+        last_wake = None
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                now = datetime.now()
+                if self._dirty:
+                    start = now
+                    if first and self.checkpoint is not None:
+                        # Catch up runs missed while the worker was down
+                        horizon = max(cfg.get('schedule_grace', 60), cfg.get('schedule_catch_up_window', 1800))
+                        start = max(self.checkpoint, now - timedelta(seconds=horizon))
+                    elif last_wake is not None:
+                        # Runs due since the last pass are still due after a reload
+                        start = last_wake
+                    self._rebuild(now, start)
+                    first = False
+                last_wake = now
+                due = self._pop_due(now)
+                if not due:
+                    timeout = min((self._heap[0][0] - now).total_seconds(), MAX_SLEEP) if self._heap else None
+                    self._cond.wait(timeout)
+                    continue
+            for rule, run, superseded in due:
+                self._fire(rule, run, superseded, now)
+            self._save_checkpoint()
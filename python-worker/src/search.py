@@ -0,0 +1,385 @@
+"""Nearest-neighbour search backends for face embeddings."""
+
+import numpy as np
+from src.utils import FancyText
+
+
+class _GrowableMatrix():
+    """
+    Row-appendable float32 matrix with amortized O(1) appends.
+
+    Keeps a preallocated buffer that doubles when full, so adding one
+    embedding does not copy the whole matrix like np.vstack does.
+    """
+
+    def __init__(self, dim: int, capacity: int = 64):
+        self.dim = dim
+        self._buf = np.empty((max(capacity, 1), dim), dtype=np.float32)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @classmethod
+    def wrap(cls, array: np.ndarray) -> '_GrowableMatrix':
+        """
+        Use an existing float32 matrix (e.g. a memory map) as the buffer without copying.
+
+        The buffer is full, so the first append copies into a new, writable buffer
+        and the wrapped array is never written to.
+        """
+        matrix = cls.__new__(cls)
+        matrix.dim = array.shape[1]
+        matrix._buf = array
+        matrix._size = array.shape[0]
+        return matrix
+
+    @property
+    def data(self) -> np.ndarray:
+        """View of the filled rows (no copy)."""
+        return self._buf[:self._size]
+
+    def append(self, rows: np.ndarray) -> None:
+        """
+        Append rows to the matrix, growing the buffer if needed.
+
+        Args:
+            rows (np.ndarray): Array of shape (n, dim)
+        """
+        n = rows.shape[0]
+        if self._size + n > self._buf.shape[0]:
+            new_cap = max(self._buf.shape[0] * 2, self._size + n)
+            buf = np.empty((new_cap, self.dim), dtype=np.float32)
+            buf[:self._size] = self._buf[:self._size]
+            self._buf = buf
+        self._buf[self._size:self._size + n] = rows
+        self._size += n
+
+
+def _topk(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    if k >= scores.shape[0]:
+        return np.argsort(-scores)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx])]
+
+
+def _topk_rows(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Per-row indices and values of the k highest scores in a 2D array, best first."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    if k == 1:
+        idx = np.argmax(scores, axis=1)[:, None]
+    else:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, idx, axis=1), axis=1)
+        idx = np.take_along_axis(idx, order, axis=1)
+    return idx, np.take_along_axis(scores, idx, axis=1)
+
+
+class ExactIndex():
+    """
+    Exact brute-force cosine search over all stored embeddings.
+
+    Vectors must be L2-normalized; the score is the dot product.
+    """
+
+    name = 'exact'
+
+    def __init__(self, dim: int = 512, **_):
+        self.dim = dim
+        self._matrix = _GrowableMatrix(dim)
+
+    def __len__(self):
+        return len(self._matrix)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Normalized embedding matrix, one row per stored vector."""
+        return self._matrix.data
+
+    def build(self, vectors: np.ndarray) -> None:
+        """
+        Replace the index content.
+
+        Args:
+            vectors (np.ndarray): Normalized embeddings of shape (n, dim)
+        """
+        if vectors.dtype == np.float32 and vectors.shape[0]:
+            self._matrix = _GrowableMatrix.wrap(vectors)
+        else:
+            self._matrix = _GrowableMatrix(self.dim, capacity=max(64, vectors.shape[0]))
+            self.add(vectors)
+
+    def add(self, vectors: np.ndarray) -> None:
+        """
+        Append normalized embeddings; row ids continue from the current size.
+
+        Args:
+            vectors (np.ndarray): Normalized embeddings of shape (n, dim)
+        """
+        if vectors.shape[0]:
+            self._matrix.append(vectors)
+
+    def replace(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        """
+        Overwrite stored rows in place; row ids are unchanged.
+
+        Args:
+            ids (np.ndarray): Row ids to overwrite
+            vectors (np.ndarray): Normalized embeddings of shape (len(ids), dim)
+        """
+        if not self.matrix.flags.writeable:
+            # Wrapped read-only buffer (e.g. a memory map): copy before writing
+            self._matrix = _GrowableMatrix.wrap(self.matrix.copy())
+        self.matrix[ids] = vectors
+
+    def search(self, query: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k most similar stored vectors.
+
+        Args:
+            query (np.ndarray): Normalized query embedding of shape (dim,)
+            k (int): Number of neighbours to return
+
+        Returns:
+            tuple: (row_ids, scores), best first
+        """
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = self.matrix @ query
+        idx = _topk(scores, k)
+        return idx, scores[idx]
+
+    def search_many(self, queries: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k most similar stored vectors for several queries at once.
+
+        Args:
+            queries (np.ndarray): Normalized query embeddings of shape (m, dim)
+            k (int): Number of neighbours to return per query
+
+        Returns:
+            tuple: (row_ids, scores), each of shape (m, min(k, n)), best first
+        """
+        return _topk_rows(queries @ self.matrix.T, k)
+
+
+class IVFIndex():
+    """
+    Approximate inverted-file (IVF) cosine search in pure NumPy.
+
+    Vectors are clustered into `nlist` cells with spherical k-means; a query
+    only scans the `nprobe` cells whose centroids are closest to it. New
+    vectors are assigned to their nearest existing cell, so additions never
+    trigger a full rebuild. Until `min_train` vectors exist the index scans
+    everything, like ExactIndex.
+    """
+
+    name = 'ivf'
+
+    def __init__(self, dim: int = 512, nlist: int = 0, nprobe: int = 8, min_train: int = 1024, iters: int = 10):
+        """
+        Args:
+            dim (int): Embedding dimension
+            nlist (int): Number of cells; 0 picks ~sqrt(n) at training time
+            nprobe (int): Number of cells scanned per query
+            min_train (int): Minimum number of vectors before clustering
+            iters (int): k-means iterations
+        """
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self.iters = iters
+        self._all = _GrowableMatrix(dim)
+        self._centroids = None
+        self._cells = []
+        self._cell_ids = []
+
+    def __len__(self):
+        return len(self._all)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Normalized embedding matrix, one row per stored vector."""
+        return self._all.data
+
+    def build(self, vectors: np.ndarray) -> None:
+        """
+        Replace the index content and retrain the clustering.
+
+        Args:
+            vectors (np.ndarray): Normalized embeddings of shape (n, dim)
+        """
+        if vectors.dtype == np.float32 and vectors.shape[0]:
+            self._all = _GrowableMatrix.wrap(vectors)
+        else:
+            self._all = _GrowableMatrix(self.dim, capacity=max(64, vectors.shape[0]))
+            self._all.append(vectors)
+        self._centroids = None
+        self._cells, self._cell_ids = [], []
+        if len(self) >= self.min_train:
+            self._train()
+
+    def add(self, vectors: np.ndarray) -> None:
+        """
+        Append normalized embeddings; row ids continue from the current size.
+
+        Args:
+            vectors (np.ndarray): Normalized embeddings of shape (n, dim)
+        """
+        if not vectors.shape[0]:
+            return
+        start = len(self)
+        self._all.append(vectors)
+        if self._centroids is None:
+            if len(self) >= self.min_train:
+                self._train()
+            return
+        self._assign(vectors, np.arange(start, start + vectors.shape[0]))
+
+    def replace(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        """
+        Overwrite stored rows in place and move them to their nearest cells; row ids are unchanged.
+
+        Args:
+            ids (np.ndarray): Row ids to overwrite
+            vectors (np.ndarray): Normalized embeddings of shape (len(ids), dim)
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if not self.matrix.flags.writeable:
+            self._all = _GrowableMatrix.wrap(self.matrix.copy())
+        self.matrix[ids] = vectors
+        if self._centroids is None:
+            return
+        moved = set(ids.tolist())
+        for c, cell_ids in enumerate(self._cell_ids):
+            if moved.isdisjoint(cell_ids):
+                continue
+            keep = np.asarray([i for i in cell_ids if i not in moved], dtype=np.int64)
+            self._cells[c] = _GrowableMatrix(self.dim, capacity=max(16, keep.shape[0]))
+            self._cells[c].append(self.matrix[keep])
+            self._cell_ids[c] = keep.tolist()
+        self._assign(vectors, ids)
+
+    def _train(self) -> None:
+        """Cluster all stored vectors with spherical k-means and fill the cells."""
+        data = self.matrix
+        n = data.shape[0]
+        nlist = self.nlist or max(1, int(np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(0)
+        sample = data[rng.choice(n, size=min(n, nlist * 64), replace=False)]
+        centroids = sample[rng.choice(sample.shape[0], size=nlist, replace=False)].copy()
+        for _ in range(self.iters):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assign == c]
+                if members.shape[0]:
+                    centroids[c] = members.sum(axis=0)
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        self._centroids = centroids
+        self._cells = [_GrowableMatrix(self.dim, capacity=16) for _ in range(nlist)]
+        self._cell_ids = [[] for _ in range(nlist)]
+        self._assign(data, np.arange(n))
+        FancyText.info(f'IVF index trained: {n} vectors in {nlist} cells')
+
+    def _assign(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        """Append vectors to the cells of their nearest centroid."""
+        assign = np.argmax(vectors @ self._centroids.T, axis=1)
+        for c in np.unique(assign):
+            mask = assign == c
+            self._cells[c].append(vectors[mask])
+            self._cell_ids[c].extend(ids[mask].tolist())
+
+    def search(self, query: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find approximately the k most similar stored vectors.
+
+        Args:
+            query (np.ndarray): Normalized query embedding of shape (dim,)
+            k (int): Number of neighbours to return
+
+        Returns:
+            tuple: (row_ids, scores), best first
+        """
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if self._centroids is None:
+            scores = self.matrix @ query
+            idx = _topk(scores, k)
+            return idx, scores[idx]
+        probe = _topk(self._centroids @ query, min(self.nprobe, len(self._cells)))
+        ids, scores = [], []
+        for c in probe:
+            if len(self._cells[c]):
+                scores.append(self._cells[c].data @ query)
+                ids.extend(self._cell_ids[c])
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = np.concatenate(scores)
+        ids = np.asarray(ids, dtype=np.int64)
+        idx = _topk(scores, k)
+        return ids[idx], scores[idx]
+
+    def search_many(self, queries: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find approximately the k most similar stored vectors for several queries.
+
+        Queries are grouped by probed cell: each cell is scored against all
+        queries that probe it with one matrix product, its per-query top k is
+        kept in that query's candidate slot for the cell, and the candidates
+        are reduced to the final top k in one pass.
+
+        Args:
+            queries (np.ndarray): Normalized query embeddings of shape (m, dim)
+            k (int): Number of neighbours to return per query
+
+        Returns:
+            tuple: (row_ids, scores), each of shape (m, min(k, n)), best first;
+                missing neighbours have id -1 and score -inf
+        """
+        if self._centroids is None:
+            return _topk_rows(queries @ self.matrix.T, k)
+        k = min(k, len(self))
+        m = queries.shape[0]
+        probes, _ = _topk_rows(queries @ self._centroids.T, min(self.nprobe, len(self._cells)))
+        cand_ids = np.full((m, probes.shape[1] * k), -1, dtype=np.int64)
+        cand_scores = np.full((m, probes.shape[1] * k), -np.inf, dtype=np.float32)
+        for c in np.unique(probes):
+            if not len(self._cells[c]):
+                continue
+            rows, slots = np.nonzero(probes == c)
+            idx, scores = _topk_rows(queries[rows] @ self._cells[c].data.T, k)
+            cols = slots[:, None] * k + np.arange(idx.shape[1])
+            cand_ids[rows[:, None], cols] = np.asarray(self._cell_ids[c], dtype=np.int64)[idx]
+            cand_scores[rows[:, None], cols] = scores
+        best, scores = _topk_rows(cand_scores, k)
+        return np.take_along_axis(cand_ids, best, axis=1), scores
+
+
+SEARCH_BACKENDS = {
+    ExactIndex.name: ExactIndex,
+    IVFIndex.name: IVFIndex,
+}
+
+
+def create_index(backend: str = 'exact', dim: int = 512, **kwargs):
+    """
+    Create a search index by backend name.
+
+    Args:
+        backend (str): 'exact' (brute force) or 'ivf' (approximate)
+        dim (int): Embedding dimension
+        **kwargs: Backend-specific options
+
+    Returns:
+        Search index instance
+    """
+    if backend not in SEARCH_BACKENDS:
+        FancyText.warning(f'Unknown search backend "{backend}", falling back to exact search.')
+        backend = ExactIndex.name
+    return SEARCH_BACKENDS[backend](dim=dim, **kwargs)
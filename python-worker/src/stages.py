@@ -0,0 +1,170 @@
+"""Threaded multi-stage pipeline with bounded queues and per-stage timing."""
+
+import queue
+import threading
+import time
+from src.utils import FancyText
+
+_DONE = object()
+
+
+class StageTimer():
+    """Busy time and item count of one pipeline stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+
+    def summary(self) -> str:
+        avg = (self.total / self.count * 1000) if self.count else 0.0
+        return f'{self.name} {self.total * 1000:.0f} ms ({self.count} x {avg:.0f} ms)'
+
+
+class StagedPipeline():
+    """
+    Run items through a chain of stages, one thread per stage.
+
+    Stages are connected by bounded queues, so while item N is in stage 2,
+    item N+1 can already be in stage 1. OpenCV and ONNX Runtime release the
+    GIL, so the stages really overlap and the total time approaches that of
+    the slowest stage rather than the sum of all stages. Items keep their
+    order. An item whose stage raises is logged and dropped; every other
+    item still comes out.
+
+    A stage given as (name, fn, batch) is a micro-batch stage: it waits for
+    `batch` items (fewer at the end of the source) and fn maps that list to
+    a list of results, one per item. This lets a model run once over several
+    frames, at the cost of overlap: the first item of a batch only leaves the
+    stage once the last one has arrived. If fn raises for a batch, each item
+    is retried alone, so one bad item does not cost the others their results.
+    """
+
+    def __init__(self, stages: list, queue_size: int = 2):
+        """
+        Args:
+            stages (list): List of (name, fn) or (name, fn, batch) tuples; fn maps one item
+                (a list of up to `batch` items for batch stages) to the next
+            queue_size (int): Capacity of the queue in front of each stage
+        """
+        self.stages = stages
+        self.queue_size = queue_size
+        self.timers = []
+        self.results = []
+        self.wall_time = 0.0
+
+    def _source_worker(self, source, out_q: queue.Queue, timer: StageTimer) -> None:
+        """Pull items from the source iterator into the first queue."""
+        try:
+            iterator = iter(source)
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                timer.add(time.perf_counter() - start)
+                out_q.put(item)
+        except Exception as e:
+            FancyText.error(f'Pipeline stage {timer.name} error: {e}')
+        finally:
+            out_q.put(_DONE)
+
+    def _stage_worker(self, fn, in_q: queue.Queue, out_q: queue.Queue, timer: StageTimer) -> None:
+        """Apply one stage function to every item until the end marker arrives."""
+        while True:
+            item = in_q.get()
+            if item is _DONE:
+                out_q.put(_DONE)
+                return
+            start = time.perf_counter()
+            try:
+                result = fn(item)
+            except Exception as e:
+                FancyText.error(f'Pipeline stage {timer.name} error: {e}')
+                continue
+            finally:
+                timer.add(time.perf_counter() - start)
+            out_q.put(result)
+
+    def _batch_worker(self, fn, batch: int, in_q: queue.Queue, out_q: queue.Queue, timer: StageTimer) -> None:
+        """Apply a batch stage function to groups of `batch` items until the end marker arrives."""
+        done = False
+        while not done:
+            items = []
+            while len(items) < batch:
+                item = in_q.get()
+                if item is _DONE:
+                    done = True
+                    break
+                items.append(item)
+            if items:
+                start = time.perf_counter()
+                for result in self._run_batch(fn, items, timer):
+                    out_q.put(result)
+                timer.add(time.perf_counter() - start)
+        out_q.put(_DONE)
+
+    def _run_batch(self, fn, items: list, timer: StageTimer) -> list:
+        """Results of a batch stage, retrying item by item if the whole batch fails."""
+        try:
+            return fn(items)
+        except Exception as e:
+            if len(items) == 1:
+                FancyText.error(f'Pipeline stage {timer.name} error: {e}')
+                return []
+            FancyText.warning(f'Pipeline stage {timer.name} failed for {len(items)} items ({e}), retrying one by one')
+        results = []
+        for item in items:
+            try:
+                results.extend(fn([item]))
+            except Exception as e:
+                FancyText.error(f'Pipeline stage {timer.name} error: {e}')
+        return results
+
+    def run(self, source, source_name: str = 'capture') -> list:
+        """
+        Feed every item of `source` through all stages.
+
+        Args:
+            source (iterable): Items for the first stage; iterated in its own thread
+            source_name (str): Name of the source in the timing report
+
+        Returns:
+            list: Outputs of the last stage, in source order (also kept in `results`)
+        """
+        start = time.perf_counter()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages))]
+        results_q = queue.Queue()
+        queues.append(results_q)
+        self.timers = [StageTimer(source_name)] + [StageTimer(stage[0]) for stage in self.stages]
+        self.results = []
+        threads = [threading.Thread(target=self._source_worker, args=(source, queues[0], self.timers[0]), daemon=True)]
+        for i, stage in enumerate(self.stages):
+            fn, batch = stage[1], (stage[2] if len(stage) > 2 else 0)
+            if batch > 1:
+                target, args = self._batch_worker, (fn, batch, queues[i], queues[i + 1], self.timers[i + 1])
+            else:
+                wrapped = (lambda item, fn=fn: fn([item])[0]) if batch == 1 else fn
+                target, args = self._stage_worker, (wrapped, queues[i], queues[i + 1], self.timers[i + 1])
+            threads.append(threading.Thread(target=target, args=args, daemon=True))
+        for thread in threads:
+            thread.start()
+        while True:
+            item = results_q.get()
+            if item is _DONE:
+                break
+            self.results.append(item)
+        for thread in threads:
+            thread.join()
+        self.wall_time = time.perf_counter() - start
+        return self.results
+
+    def report(self) -> str:
+        """One-line timing summary of the last run."""
+        stages = ', '.join(timer.summary() for timer in self.timers)
+        return f'Pipeline {self.wall_time * 1000:.0f} ms total | {stages}'
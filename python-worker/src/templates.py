@@ -0,0 +1,83 @@
+"""Per-person template aggregation for face embeddings."""
+
+import numpy as np
+
+TEMPLATE_MODES = ('off', 'mean', 'medoids')
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize the rows of a matrix."""
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def mean_template(embeddings: np.ndarray) -> np.ndarray:
+    """
+    Aggregate a person's embeddings into one normalized mean vector.
+
+    Args:
+        embeddings (np.ndarray): Normalized embeddings of shape (n, dim)
+
+    Returns:
+        np.ndarray: Template matrix of shape (1, dim)
+    """
+    return _normalize(embeddings.mean(axis=0, keepdims=True))
+
+
+def medoid_templates(embeddings: np.ndarray, k: int = 3, iters: int = 10) -> np.ndarray:
+    """
+    Pick up to k representative samples with k-medoids clustering.
+
+    Medoids are real samples, so a person photographed under several
+    conditions (glasses, lighting, angle) keeps one template per mode
+    instead of a blurred average.
+
+    Args:
+        embeddings (np.ndarray): Normalized embeddings of shape (n, dim)
+        k (int): Maximum number of medoids
+        iters (int): Maximum refinement iterations
+
+    Returns:
+        np.ndarray: Template matrix of shape (min(k, n), dim)
+    """
+    n = embeddings.shape[0]
+    if n <= k:
+        return embeddings
+    sim = embeddings @ embeddings.T
+    # Farthest-first initialization starting from the most central sample
+    medoids = [int(np.argmax(sim.sum(axis=1)))]
+    while len(medoids) < k:
+        medoids.append(int(np.argmin(sim[:, medoids].max(axis=1))))
+    for _ in range(iters):
+        assign = np.argmax(sim[:, medoids], axis=1)
+        updated = []
+        for c in range(k):
+            members = np.flatnonzero(assign == c)
+            if members.size == 0:
+                updated.append(medoids[c])
+                continue
+            within = sim[np.ix_(members, members)].sum(axis=1)
+            updated.append(int(members[np.argmax(within)]))
+        if updated == medoids:
+            break
+        medoids = updated
+    return embeddings[sorted(set(medoids))]
+
+
+def build_templates(embeddings: np.ndarray, mode: str = 'off', k: int = 3) -> np.ndarray:
+    """
+    Build the search vectors for one person.
+
+    Args:
+        embeddings (np.ndarray): Raw embeddings of shape (n, dim)
+        mode (str): 'off' (every sample), 'mean' or 'medoids'
+        k (int): Number of medoids in 'medoids' mode
+
+    Returns:
+        np.ndarray: Normalized template matrix
+    """
+    normed = _normalize(embeddings.astype(np.float32))
+    if mode == 'mean':
+        return mean_template(normed)
+    if mode == 'medoids':
+        return medoid_templates(normed, k)
+    return normed
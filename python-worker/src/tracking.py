@@ -0,0 +1,150 @@
+"""Face tracking across frames with per-track embedding fusion."""
+
+import itertools
+import numpy as np
+
+# Weight floor, so a track of zero-quality faces still fuses to their plain mean
+MIN_WEIGHT = 1e-3
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Pairwise intersection over union of two sets of boxes.
+
+    Args:
+        a (np.ndarray): (N, 4) boxes as x0, y0, x1, y1
+        b (np.ndarray): (M, 4) boxes as x0, y0, x1, y1
+
+    Returns:
+        np.ndarray: (N, M) IoU values
+    """
+    a = a[:, None, :].astype(np.float32)
+    b = b[None, :, :].astype(np.float32)
+    w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = w * h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / (area_a + area_b - inter + 1e-9)
+
+
+def face_quality(face: dict) -> float:
+    """
+    Weight of a face in its track's fused embedding.
+
+    Uses the face's 'quality' score when present, otherwise the detection
+    score scaled down for faces smaller than the 112 px recognition input.
+    The weight is at least MIN_WEIGHT, so every embedded face counts.
+
+    Args:
+        face (dict): Detected face with bbox and det_score
+
+    Returns:
+        float: Positive weight
+    """
+    if 'quality' in face:
+        return max(MIN_WEIGHT, float(face['quality']))
+    x0, y0, x1, y1 = face['bbox']
+    size = min(x1 - x0, y1 - y0)
+    return max(MIN_WEIGHT, float(face.get('det_score', 1.0)) * min(1.0, max(size, 0) / 112.0))
+
+
+class Track():
+    """One person followed across frames."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, face: dict, frame_index: int):
+        self.id = next(Track._ids)
+        self.bbox = np.asarray(face['bbox'])
+        self.last_seen = frame_index
+        self.hits = 0
+        self._weighted_sum = np.zeros_like(face['embedding'], dtype=np.float32)
+        self._weight = 0.0
+        self.add(face, frame_index)
+
+    def add(self, face: dict, frame_index: int) -> None:
+        """Add a detection of this track."""
+        weight = face_quality(face)
+        self._weighted_sum += weight * face['embedding']
+        self._weight += weight
+        self.bbox = np.asarray(face['bbox'])
+        self.last_seen = frame_index
+        self.hits += 1
+
+    @property
+    def embedding(self) -> np.ndarray:
+        """Quality-weighted mean embedding of the track, L2-normalized."""
+        norm = np.linalg.norm(self._weighted_sum)
+        return self._weighted_sum / norm if norm > 0 else self._weighted_sum
+
+
+class FaceTracker():
+    """
+    Greedy IoU and embedding tracker.
+
+    A detection continues a track when its box overlaps the track's last box
+    by at least `iou_threshold` or its embedding is at least `sim_threshold`
+    similar to the track's fused embedding; the best pairs are linked first.
+    Tracks not seen for `max_age` frames are closed, so a student who walks
+    away and returns starts a new track (which still recognizes as the same
+    person).
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, sim_threshold: float = 0.5, max_age: int = 5):
+        """
+        Args:
+            iou_threshold (float): Minimum box overlap to link a detection to a track
+            sim_threshold (float): Minimum cosine similarity to link a detection to a track
+            max_age (int): Frames without a detection after which a track is closed
+        """
+        self.iou_threshold = iou_threshold
+        self.sim_threshold = sim_threshold
+        self.max_age = max_age
+        self.tracks = []
+        self.frame_index = -1
+
+    def update(self, faces: list) -> list:
+        """
+        Link the detections of the next frame to tracks.
+
+        Args:
+            faces (list): Detected faces with bbox and embedding
+
+        Returns:
+            list: Track ID per face (None for faces without an embedding)
+        """
+        self.frame_index += 1
+        ids = [None] * len(faces)
+        candidates = [i for i, face in enumerate(faces) if 'embedding' in face]
+        live = [t for t in self.tracks if self.frame_index - t.last_seen <= self.max_age]
+        if candidates and live:
+            boxes = np.array([faces[i]['bbox'] for i in candidates])
+            iou = iou_matrix(boxes, np.array([t.bbox for t in live]))
+            sim = np.stack([faces[i]['embedding'] for i in candidates]) @ np.stack([t.embedding for t in live]).T
+            linkable = (iou >= self.iou_threshold) | (sim >= self.sim_threshold)
+            affinity = np.where(linkable, iou + sim, -np.inf)
+            while np.isfinite(affinity).any():
+                r, c = np.unravel_index(np.argmax(affinity), affinity.shape)
+                live[c].add(faces[candidates[r]], self.frame_index)
+                ids[candidates[r]] = live[c].id
+                affinity[r, :] = -np.inf
+                affinity[:, c] = -np.inf
+        for i in candidates:
+            if ids[i] is None:
+                track = Track(faces[i], self.frame_index)
+                self.tracks.append(track)
+                ids[i] = track.id
+        return ids
+
+    def confirmed(self, min_hits: int = 1) -> list:
+        """
+        Tracks seen in at least `min_hits` frames.
+
+        Args:
+            min_hits (int): Minimum number of detections
+
+        Returns:
+            list: Matching tracks
+        """
+        return [t for t in self.tracks if t.hits >= min_hits]
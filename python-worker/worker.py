@@ -1,41 +1,211 @@
 import os
+import socket
 import time
+import zlib
+STARTED_AT = time.perf_counter()  # before the heavier imports below, for the startup log
 import atexit
 from dotenv import load_dotenv
 from concurrent.futures import ThreadPoolExecutor
 
 import base64
-import numpy as np
-import cv2
 
+# cv2 and numpy are imported where they are used (_add_student); the capture
+# and pipeline modules below still load them at startup, since the cameras
+# open their streams right away
 from src.utils import FancyText
 from src.config import cfg
 import src.gateway as gateway
-from src.pipeline import run_checkin_workflow
-from src.scheduler import run_auto_capture
+from src.pipeline import run_checkin_workflow, send_attendance
+from src.outbox import AttendanceOutbox
+from src.jobs import Job, JobScheduler
+from src.scheduler import CaptureScheduler
 from src.FaceSystem import FaceSystem
-from src.StreamCapture import StreamCapture
+from src.cameras import CameraRegistry
 
-load_dotenv()
-RTSP_URL = os.getenv('RTSP_URL')
+RTSP_URL = None
+face_system = cameras = outbox = jobs = None
 
-FancyText.info('Loading AI face recognition model...')
-face_system = FaceSystem(threshold=cfg.get('face_recognition_threshold', 0.32))
-stream_capture = None
+def _report_status():
+    """Report model readiness and cameras to the Gateway over the WebSocket."""
+    loaded = face_system.ready.is_set()
+    gateway.report_status({
+        'ready': loaded and face_system.load_error is None,
+        'loading': not loaded,
+        'error': str(face_system.load_error) if face_system.load_error else None,
+        'model': face_system.inference_profile['model_pack'],
+        'cameras': [camera.id for camera in cameras],
+        'queue': jobs.stats()
+    })
 
-if RTSP_URL:
-    FancyText.info(f'Connecting to RTSP camera: {RTSP_URL}')
-    stream_capture = StreamCapture(RTSP_URL)
-else:
-    FancyText.error('RTSP_URL environment variable not configured.')
+def _report_when_ready():
+    """Send the worker status again once the model has finished loading."""
+    face_system.ready.wait()
+    _report_status()
 
-atexit.register(lambda: stream_capture.stop() if stream_capture else None)
+def _report_job(job: Job, status: str):
+    """
+    Report a job status change to the Gateway.
+    
+    Args:
+        job (Job): The job, or the Command of a multi-camera check-in
+        status (str): New status (accepted, running, processed, failed, cancelled, duplicate)
+    """
+    if job.msg_id:
+        gateway.post_ack(job.msg_id, status, {**job.to_detail(), 'status': status})
+    if job.type == 'trigger_checkin' and job.done:
+        # Queue depth and wait times, for sizing nodes from the peak
+        _report_status()
+
+# Check-ins share a concurrency cap; manual triggers start before queued automatic ones
+PRIORITY_MANUAL = 0
+PRIORITY_AUTO = 10
+
+def _setup() -> None:
+    """
+    Create the Gateway client, face system, cameras, outbox and job scheduler.
+    
+    Runs from the __main__ block only: inference server processes that are
+    spawned instead of forked (Windows) import this module again, and must
+    not start another face system, cameras and jobs of their own.
+    """
+    global RTSP_URL, face_system, cameras, outbox, jobs
+    load_dotenv()
+    RTSP_URL = os.getenv('RTSP_URL')
+
+    gateway.client = gateway.GatewayClient(
+        connect_timeout=cfg.get('http_connect_timeout', 3.05),
+        read_timeout=cfg.get('http_read_timeout', 10),
+        retries=cfg.get('http_retries', 3)
+    )
+
+    # The model loads on a background thread (or in the inference server processes
+    # when inference_workers > 0, started here before the camera and job threads);
+    # detection waits for it, while the cameras, scheduler and WebSocket start right away
+    FancyText.info('Loading AI face recognition model in the background...')
+    face_system = FaceSystem(
+        threshold=cfg.get('face_recognition_threshold', 0.32),
+        searchBackend=cfg.get('search_backend', 'exact'),
+        searchOptions={'nprobe': cfg.get('search_nprobe', 8)},
+        templateMode=cfg.get('template_mode', 'off'),
+        templateK=cfg.get('template_k', 3),
+        flushInterval=cfg.get('embedding_flush_interval', 2.0),
+        flushBatch=cfg.get('embedding_flush_batch', 32),
+        cropEnhance=cfg.get('enhance_mode', 'frame') == 'faces',
+        detectionProfile=cfg.get('detection_profile', {}),
+        qualityProfile=cfg.get('quality_profile', {}),
+        inferenceProfile=cfg.get('inference_profile', {}),
+        device=cfg.get('device', 'auto'),
+        loadInBackground=True,
+        inferenceWorkers=cfg.get('inference_workers', 0),
+        inferenceChunkFrames=cfg.get('inference_chunk_frames', 1),
+        inferenceSlotBytes=int(cfg.get('inference_slot_mb', 3) * 1024 * 1024),
+        inferenceTimeout=cfg.get('inference_timeout', 60)
+    )
+    cameras = CameraRegistry.from_config(
+        cfg.get('cameras', []),
+        default_url=RTSP_URL,
+        stream_options={
+            'skipFrames': cfg.get('stream_skip_frames', 2),
+            'decodeMode': cfg.get('stream_decode_mode', 'always'),
+            'captureProfile': cfg.get('capture_profile', {})
+        }
+    )
+
+    if len(cameras) == 0:
+        FancyText.error('No cameras configured (set RTSP_URL or the "cameras" config list).')
+    elif len(cameras) > 1 and face_system.inference_server is None:
+        # Several cameras share one model: batch their detection through one queue
+        face_system.start_inference_queue(cfg.get('inference_batch_frames', 16))
+
+    outbox = AttendanceOutbox(
+        'data/outbox.db',
+        send_fn=send_attendance,
+        max_image_bytes=int(cfg.get('outbox_max_image_mb', 200) * 1024 * 1024),
+        max_attempts=cfg.get('outbox_max_attempts', 10)
+    )
+
+    atexit.register(cameras.stop_all)
+    atexit.register(face_system.close)
+    atexit.register(outbox.close)
+
+    jobs = JobScheduler(
+        max_workers=cfg.get('job_workers', 4),
+        on_status=_report_job,
+        limits={'checkin': cfg.get('max_concurrent_checkins', 3)}
+    )
+
+def _stagger_delays(targets: list, spread: float) -> dict:
+    """
+    Start delays that spread a scheduled check-in over `spread` seconds.
+    
+    The targeted cameras are spaced evenly over the window, and the whole
+    pattern is shifted by a phase hashed from this node's host name, so
+    nodes sharing a schedule do not all start their first camera at the
+    same second. Both only depend on names, so every run keeps its offsets.
+    
+    Args:
+        targets (list): Cameras of the check-in
+        spread (float): Width of the window in seconds
+        
+    Returns:
+        dict: {camera_id: delay in seconds}
+    """
+    if not spread or not targets:
+        return {camera.id: 0.0 for camera in targets}
+    node = socket.gethostname()
+    phase = zlib.crc32(node.encode('utf-8')) % 1000 / 1000
+    ordered = sorted(targets, key=lambda camera: zlib.crc32(f'{node}/{camera.id}'.encode('utf-8')))
+    return {camera.id: spread * ((i + phase) / len(ordered)) for i, camera in enumerate(ordered)}
+
+def submit_checkin(payload: dict, msg_id: str = None) -> list:
+    """
+    Queue a check-in job on each targeted camera.
+    
+    Check-ins on the same camera run one at a time, and a trigger for a
+    camera that already has a check-in queued or running is merged into it.
+    At most max_concurrent_checkins run at once; automatic triggers queue
+    behind manual ones and are staggered over schedule_spread seconds (see
+    _stagger_delays), so cameras sharing a slot do not all start together.
+    
+    Args:
+        payload (dict): Command payload (optional camera_id, frame_count, source)
+        msg_id (str): Command ID for acknowledgments (None for automatic triggers)
+        
+    A command (msg_id set) is acknowledged once for all its cameras:
+    accepted (or duplicate), running, then one final status.
+    
+    Returns:
+        list: (job, is_new) pairs, one per camera
+    """
+    targets = cameras.select(payload.get('camera_id'))
+    if not targets:
+        raise ValueError(f"Unknown camera: {payload.get('camera_id')}")
+    command = jobs.command('trigger_checkin', msg_id) if msg_id else None
+    auto = payload.get('source') == 'auto'
+    delays = _stagger_delays(targets, cfg.get('schedule_spread', 60) if auto else 0)
+    submitted = []
+    for camera in targets:
+        meta = {**payload, 'camera_id': camera.id}
+        submitted.append(jobs.submit(
+            'trigger_checkin', f'camera:{camera.id}',
+            lambda job, camera=camera, meta=meta: run_checkin_workflow(
+                face_system, camera.stream, meta, job.cancel_event, outbox, roster=camera.roster
+            ),
+            msg_id=msg_id, meta={'camera_id': camera.id}, dedup=True,
+            priority=PRIORITY_AUTO if auto else PRIORITY_MANUAL, group='checkin',
+            delay=delays[camera.id], command=command
+        ))
+    if command is not None:
+        jobs.seal(command)
+    return submitted
 
 def handle_ws_message(data: dict):
     """
     Process WebSocket messages from API Gateway.
     
-    Handles trigger_checkin, add_student, and update_config commands.
+    Handles trigger_checkin, add_student, update_config and cancel_job commands.
+    Commands are queued on the job scheduler and acknowledged as accepted right
+    away; progress and results are reported through further acknowledgments.
     Gracefully ignores non-command messages (ping/pong, handshake, etc).
     
     Args:
@@ -49,22 +219,27 @@ def handle_ws_message(data: dict):
         return
     
     try:
+        payload = data.get('payload', {})
         if msg_type == 'trigger_checkin':
             FancyText.info(f'Command: Manual Check-in (ID: {msg_id})')
-            result = run_checkin_workflow(face_system, stream_capture, data.get('payload', {}))
-            gateway.post_ack(msg_id, 'processed', result)
+            for job, is_new in submit_checkin(payload, msg_id):
+                if not is_new:
+                    FancyText.info(f'Check-in already pending on camera {job.meta.get("camera_id")} ({job.id})')
             
         elif msg_type == 'add_student':
             FancyText.info(f'Command: Add Student (ID: {msg_id})')
-            _handle_add_student(msg_id, data.get('payload', {}))
+            jobs.submit('add_student', 'registry', lambda job: _add_student(payload), msg_id=msg_id)
             
         elif msg_type == 'update_config':
             FancyText.info(f'Command: Update Config (ID: {msg_id})')
-            payload = data.get('payload', {})
-            cfg.update(payload)
-            face_system.threshold = cfg.get('face_recognition_threshold', 0.32)
-            FancyText.success(f'Configuration updated successfully')
-            gateway.post_ack(msg_id, 'processed', {'updated': True})
+            jobs.submit('update_config', 'config', lambda job: _update_config(payload), msg_id=msg_id)
+            
+        elif msg_type == 'cancel_job':
+            job_id = payload.get('job_id', '')
+            FancyText.info(f'Command: Cancel Job {job_id} (ID: {msg_id})')
+            if not jobs.cancel(job_id):
+                raise ValueError(f'No pending job with ID: {job_id}')
+            gateway.post_ack(msg_id, 'processed', {'job_id': job_id, 'cancel_requested': True})
             
         else:
             FancyText.warning(f'Unknown message type: {msg_type}')
@@ -74,13 +249,40 @@ def handle_ws_message(data: dict):
         FancyText.error(f'Error processing message {msg_id}: {e}')
         gateway.post_ack(msg_id, 'failed', {'error': str(e)})
 
-def _handle_add_student(msg_id: str, payload: dict):
+def _update_config(payload: dict) -> dict:
     """
-    Handle adding a new student with validation.
+    Apply a configuration update.
+    
+    Args:
+        payload (dict): Configuration keys to update
+        
+    Returns:
+        dict: Acknowledgment details
+    """
+    cfg.update(payload)
+    if 'cameras' in payload:
+        cameras.reload(cfg.get('cameras', []), default_url=RTSP_URL)
+        if len(cameras) > 1 and face_system.inference_server is None and face_system.inference_queue is None:
+            face_system.start_inference_queue(cfg.get('inference_batch_frames', 16))
+        _report_status()
+    face_system.threshold = cfg.get('face_recognition_threshold', 0.32)
+    face_system.crop_enhance = cfg.get('enhance_mode', 'frame') == 'faces'
+    jobs.set_limit('checkin', cfg.get('max_concurrent_checkins', 3))
+    FancyText.success(f'Configuration updated successfully')
+    return {'updated': True}
+
+def _add_student(payload: dict) -> dict:
+    """
+    Add a new student with validation.
     
     Args:
-        msg_id (str): Message ID for acknowledgment
         payload (dict): Payload containing 'name' and 'image' (base64)
+        
+    Returns:
+        dict: Acknowledgment details
+        
+    Raises:
+        ValueError: If the payload is invalid or no face is found
     """
     try:
         person_name = payload.get('name', '').strip()
@@ -106,6 +308,9 @@ def _handle_add_student(msg_id: str, payload: dict):
             raise ValueError(f'Invalid base64 image data: {e}')
         
         # Convert to numpy array and decode
+        import cv2
+        import numpy as np
+        
         nparr = np.frombuffer(image_data, np.uint8)
         img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
@@ -118,35 +323,38 @@ def _handle_add_student(msg_id: str, payload: dict):
         # Register the face
         success = face_system.register_face_from_image(person_name, img)
         
-        if success:
-            FancyText.success(f'Student \"{person_name}\" added successfully')
-            gateway.post_ack(msg_id, 'processed', {
-                'success': True,
-                'added': True,
-                'name': person_name,
-                'message': f'Student \"{person_name}\" has been registered'
-            })
-        else:
+        if not success:
             raise ValueError('No face detected in the image. Please ensure the image is clear and contains a face.')
             
+        FancyText.success(f'Student \"{person_name}\" added successfully')
+        return {
+            'success': True,
+            'added': True,
+            'name': person_name,
+            'pending_writes': face_system.pending_writes,
+            'message': f'Student \"{person_name}\" has been registered'
+        }
+            
     except Exception as e:
-        error_msg = str(e)
-        FancyText.error(f'Failed to add student: {error_msg}')
-        gateway.post_ack(msg_id, 'failed', {
-            'success': False,
-            'error': error_msg
-        })
+        FancyText.error(f'Failed to add student: {e}')
+        raise
 
 if __name__ == '__main__':
-    pool = ThreadPoolExecutor(max_workers=2)
-    pool.submit(run_auto_capture, face_system, stream_capture)
-    pool.submit(gateway.connect_websocket, handle_ws_message)
+    _setup()
+    pool = ThreadPoolExecutor(max_workers=3)
+    scheduler = CaptureScheduler(submit_checkin)
+    pool.submit(scheduler.run)
+    pool.submit(gateway.connect_websocket, handle_ws_message, _report_status)
+    pool.submit(_report_when_ready)
+    FancyText.success(f'Worker started in {time.perf_counter() - STARTED_AT:.2f}s')
     
     try:
         while True:
             time.sleep(60)
     except KeyboardInterrupt:
         FancyText.warning('Shutdown initiated by user.')
-        if stream_capture:
-            stream_capture.stop()
+        scheduler.stop()
+        jobs.shutdown(wait=False)
+        cameras.stop_all()
+        face_system.close()
         pool.shutdown(wait=False)
\ No newline at end of file